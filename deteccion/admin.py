@@ -2,8 +2,15 @@ from django.contrib import admin
 
 # deteccion/admin.py
 
+from datetime import date, datetime, time
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
 from .models import (
     Menu, 
     Module, 
@@ -11,8 +18,14 @@ from .models import (
     User, 
     Cargo, 
     Empleado,
-    Alert
+    Alert,
+    AlertVersion,
+    Recording,
+    PPEItem,
+    AlertArchive
 )
+from .alertas import resolver_alertas
+from . import busqueda, resumenes
 
 # --- 1. Definir la clase Admin para el modelo User personalizado ---
 # Esto es crucial para que el modelo User se muestre correctamente en el Admin.
@@ -58,11 +71,203 @@ class EmpleadoAdmin(admin.ModelAdmin):
     search_fields = ('nombres', 'apellidos', 'cedula_ecuatoriana')
 
 
-class AlertAdmin(admin.ModelAdmin):
-    list_display = ('message', 'level', 'timestamp', 'resolved')  # columnas que se verán en la lista
-    list_filter = ('level', 'resolved', 'timestamp')  # filtros en la barra lateral
-    search_fields = ('message', 'missing')  # barra de búsqueda
+class ConteoAcotadoPaginator(Paginator):
+    """
+    Cuenta como mucho LIMITE filas: un COUNT(*) sobre millones de alertas
+    recorre toda la tabla en cada página. Más allá del límite se navega con
+    la jerarquía de fechas o el enlace a las más antiguas.
+    """
+    LIMITE = 10000
+
+    @cached_property
+    def count(self):
+        return self.object_list.order_by()[:self.LIMITE + 1].count()
+
+    @property
+    def truncado(self):
+        return self.count > self.LIMITE
+
+
+class FechasIndexadasQuerySet(models.QuerySet):
+    """
+    QuerySet del admin cuya jerarquía de fechas (datetimes por año, mes o
+    día) se calcula con una consulta EXISTS por periodo sobre el índice de
+    timestamp, en lugar de truncar la fecha de cada fila del rango.
+    """
+
+    def aggregate(self, *args, **kwargs):
+        # SQLite sólo resuelve con el índice un min() o max() solo; juntos
+        # (el rango de la jerarquía de fechas) recorren la tabla
+        if not args and len(kwargs) > 1 and all(isinstance(a, (models.Min, models.Max)) for a in kwargs.values()):
+            resultado = {}
+            for nombre, agregado in kwargs.items():
+                resultado.update(super().aggregate(**{nombre: agregado}))
+            return resultado
+        return super().aggregate(*args, **kwargs)
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        zona = tzinfo or timezone.get_current_timezone()
+        rango = self.aggregate(first=models.Min(field_name), last=models.Max(field_name))
+        if rango['first'] is None:
+            return []
+        primero = rango['first'].astimezone(zona).date()
+        ultimo = rango['last'].astimezone(zona).date()
+
+        if kind == 'year':
+            dia = date(primero.year, 1, 1)
+        elif kind == 'month':
+            dia = primero.replace(day=1)
+        else:
+            dia = primero
+        fechas = []
+        while dia <= ultimo:
+            if kind == 'year':
+                siguiente = date(dia.year + 1, 1, 1)
+            elif kind == 'month':
+                siguiente = date(dia.year + dia.month // 12, dia.month % 12 + 1, 1)
+            else:
+                siguiente = date.fromordinal(dia.toordinal() + 1)
+            inicio = timezone.make_aware(datetime.combine(dia, time()), zona)
+            fin = timezone.make_aware(datetime.combine(siguiente, time()), zona)
+            if self.filter(**{f'{field_name}__gte': inicio, f'{field_name}__lt': fin}).exists():
+                fechas.append(inicio)
+            dia = siguiente
+        return fechas if order == 'ASC' else fechas[::-1]
+
+
+class AlertChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        # Con búsqueda, por relevancia salvo que se elija una columna
+        if ORDER_VAR not in self.params and self.model_admin._buscando(request):
+            queryset = queryset.order_by('rank', '-pk')
+        return queryset
+
+    @cached_property
+    def anteriores_url(self):
+        """
+        Página siguiente por cursor (timestamp__lt de la última fila) cuando
+        el conteo se truncó: el índice de timestamp la resuelve sin OFFSET.
+        """
+        if not getattr(self.paginator, 'truncado', False) or ORDER_VAR in self.params or self.query:
+            return None
+        fechas = [alerta.timestamp for alerta in self.result_list]
+        if not fechas:
+            return None
+        cursor = timezone.localtime(min(fechas)).isoformat()
+        return self.get_query_string({'timestamp__lt': cursor}, [PAGE_VAR])
+
+
+class BusquedaAlertasMixin:
+    """Búsqueda del admin con el índice FTS5, ordenada por relevancia"""
+    search_fields = ('message', 'missing', 'resolution_notes')  # sin FTS5 se usan con icontains
+
+    def _buscando(self, request):
+        return busqueda.disponible() and busqueda.consulta(request.GET.get('q'))
+
+    def get_search_results(self, request, queryset, search_term):
+        if not self._buscando(request):
+            return super().get_search_results(request, queryset, search_term)
+        return busqueda.filtrar(queryset, search_term), False
+
+    def get_changelist(self, request, **kwargs):
+        return AlertChangeList
+
+
+class AlertasGrandesMixin(BusquedaAlertasMixin):
+    """
+    Listado de alertas que no depende del tamaño de la tabla: sin COUNT(*)
+    completo, conteo acotado, jerarquía de fechas y orden sobre el índice de
+    timestamp y resolved_by en la misma consulta.
+    """
+    show_full_result_count = False
+    paginator = ConteoAcotadoPaginator
+    date_hierarchy = 'timestamp'
+    ordering = ('-timestamp', '-id')
+    list_select_related = ('resolved_by',)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return FechasIndexadasQuerySet(model=queryset.model, query=queryset.query, using=queryset.db)
+
+
+class AlertAdmin(AlertasGrandesMixin, admin.ModelAdmin):
+    list_display = ('message', 'camera', 'level', 'timestamp', 'resolution_status', 'resolved_by')  # columnas que se verán en la lista
+    # Filtros con opciones fijas: no consultan valores distintos a la base
+    list_filter = ('level', 'resolution_status', 'resolved')
     readonly_fields = ('timestamp',)  # campo solo lectura
+    actions = ('resolver', 'marcar_falsa_alerta', 'marcar_incumplimiento')
+
+    # Editar y borrar desde el admin también mueve los resúmenes y la versión
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            if change:
+                antes = resumenes.clave(Alert.objects.select_for_update().get(pk=obj.pk))
+                super().save_model(request, obj, form, change)
+                resumenes.mover(antes, resumenes.clave(obj))
+            else:
+                super().save_model(request, obj, form, change)
+                resumenes.registrar([obj])
+            AlertVersion.bump()
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Alert.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            if resumenes.eliminar(queryset):
+                AlertVersion.bump()
+
+    def _resolver(self, request, queryset, status):
+        # Un UPDATE por lote en lugar de guardar cada alerta; las ya
+        # resueltas de la selección se dejan como están
+        updated = resolver_alertas(queryset, request.user, status=status)
+        self.message_user(request, f"{updated} alertas actualizadas")
+
+    @admin.action(description='Resolver las alertas seleccionadas')
+    def resolver(self, request, queryset):
+        self._resolver(request, queryset, 'resolved')
+
+    @admin.action(description='Marcar como falsa alerta')
+    def marcar_falsa_alerta(self, request, queryset):
+        self._resolver(request, queryset, 'false_positive')
+
+    @admin.action(description='Marcar como incumplimiento real')
+    def marcar_incumplimiento(self, request, queryset):
+        self._resolver(request, queryset, 'non_compliant')
+
+
+class RecordingAdmin(admin.ModelAdmin):
+    list_display = ('started_at', 'camera', 'duration', 'codec', 'size', 'violation_seconds')
+    list_filter = ('camera', 'codec', 'started_at')
+    exclude = ('timeline',)  # binario, no editable
+
+
+class PPEItemAdmin(admin.ModelAdmin):
+    list_display = ('name', 'code', 'bit')
+    # Las máscaras se escriben con los bits de epp.ELEMENTOS (migración
+    # 0011): cambiar aquí un código o un bit desincronizaría la lectura
+    readonly_fields = ('code', 'bit')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class AlertArchiveAdmin(AlertasGrandesMixin, admin.ModelAdmin):
+    # Sólo consulta: se llena con `manage.py archivar_alertas`
+    list_display = ('message', 'level', 'timestamp', 'resolution_status', 'resolved_by', 'archived_at')
+    list_filter = ('level', 'resolution_status')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 
@@ -83,6 +288,9 @@ admin.site.register(Cargo)
 admin.site.register(Empleado, EmpleadoAdmin)
 # Register your models here.
 admin.site.register(Alert, AlertAdmin)
+admin.site.register(Recording, RecordingAdmin)
+admin.site.register(PPEItem, PPEItemAdmin)
+admin.site.register(AlertArchive, AlertArchiveAdmin)
 
 
 
@@ -0,0 +1,326 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from .dedup import obtener_dedup
+from .eventos import datos_alerta, obtener_bus
+
+logger = logging.getLogger(__name__)
+
+
+class AlertSink:
+    """
+    Persistencia asíncrona de alertas.
+
+    Las cámaras sólo llaman a `submit()`, que encola la alerta (y su captura,
+    si la hay) en una cola acotada sin bloquear; si la cola está llena la
+    alerta se descarta y se cuenta en `dropped`. Un hilo escritor codifica
+    y guarda las capturas y luego inserta las alertas con `bulk_create` en
+    lotes de hasta `batch_size`, o cada `flush_interval` segundos.
+
+    Una alerta creada con `key` puede actualizarse después con
+    `actualizar()` (incidentes abiertos); las actualizaciones llevan el
+    estado completo, así que dentro de un lote sólo se aplica la última de
+    cada incidente. Con un `bus` (BusAlertas) cada alerta creada o
+    actualizada se publica después de escribirse.
+
+    Con un `dedup` (DedupStore) las operaciones que traen `clave_dedup`
+    reclaman o renuevan esa clave desde el hilo escritor, nunca desde el de
+    la cámara. Si al crear la clave ya tiene otro incidente vigente, la
+    alerta no se crea: el incidente se retoma y sus envíos siguientes sólo
+    actualizan `last_seen`/`closed_at` de la fila existente.
+
+    Los frames entregados no deben modificarse después de `submit()`.
+    """
+
+    def __init__(self, media_root='media', batch_size=20, flush_interval=1.0, queue_size=500,
+                 jpeg_quality=85, dedup=None, bus=None):
+        self.media_root = media_root
+        self.dedup = dedup
+        self.bus = bus
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.jpeg_quality = jpeg_quality
+
+        self.submitted = 0
+        self.written = 0
+        self.updated = 0
+        self.dropped = 0
+        self.errors = 0
+        self._pks = {}  # key del incidente -> pk (sólo en el hilo escritor)
+        self._retomados = {}  # key local -> key del incidente de otra instancia
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # --- Hilo de la cámara -------------------------------------------------
+
+    def submit(self, campos, snapshot=None, snapshot_name=None, key=None, clave_dedup=None):
+        """
+        Encola una alerta. `campos` son los argumentos de Alert; si se pasa
+        `snapshot` se guarda como JPEG en `snapshot_name` (relativo a
+        media_root) y ese nombre queda en `video`. `clave_dedup` es
+        (cámara, zona, firma, ttl, instante).
+        """
+        return self._encolar(('crear', key, campos, snapshot, snapshot_name, clave_dedup))
+
+    def actualizar(self, key, campos, snapshot=None, snapshot_name=None, cerrar=False, clave_dedup=None):
+        """Encola la actualización de la alerta creada con `key`"""
+        op = 'cerrar' if cerrar else 'actualizar'
+        return self._encolar((op, key, campos, snapshot, snapshot_name, clave_dedup))
+
+    def _encolar(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(f"Cola de alertas llena: {self.dropped} alertas descartadas")
+            return False
+        self.submitted += 1
+        return True
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'written': self.written,
+            'updated': self.updated,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'pending': self._queue.qsize(),
+        }
+
+    def close(self, timeout=10):
+        """Escribe lo pendiente y detiene el hilo escritor"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        logger.info(f"Alertas: {self.stats()}")
+
+    # --- Hilo escritor -----------------------------------------------------
+
+    def _guardar_captura(self, frame, nombre):
+        path = os.path.join(self.media_root, nombre)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return False
+        with open(path, 'wb') as f:
+            f.write(jpeg.tobytes())
+        return True
+
+    def _con_captura(self, campos, snapshot, snapshot_name):
+        if snapshot is None or not snapshot_name:
+            return campos
+        try:
+            guardada = self._guardar_captura(snapshot, snapshot_name)
+        except OSError as e:
+            logger.error(f"No se pudo guardar la captura {snapshot_name}: {e}")
+            guardada = False
+        if guardada:
+            return dict(campos, video=snapshot_name)
+        # Al crear sin captura queda vacío; al actualizar se conserva la anterior
+        return campos if 'video' in campos else dict(campos, video='')
+
+    def _deduplicar(self, op, key, clave_dedup):
+        """Reclama (al crear) o renueva la clave del incidente en el DedupStore"""
+        camara, zona, firma, ttl, instante = clave_dedup
+        try:
+            if op == 'crear':
+                nuevo, existente = self.dedup.reclamar(camara, zona, firma, key, ttl, instante)
+                if not nuevo:
+                    self._retomados[key] = existente
+            elif op == 'actualizar':
+                self.dedup.renovar(camara, zona, firma, ttl, instante)
+        except Exception as e:
+            # Sin deduplicación el incidente sigue como propio
+            logger.error(f"No se pudo deduplicar el incidente {key}: {e}")
+
+    def _escribir(self, lote):
+        from django.db import close_old_connections, transaction
+        from .models import Alert, AlertVersion
+        from . import resumenes
+
+        nuevas, claves = [], []
+        creadas, actualizadas = [], []
+        cambios = {}  # key -> (campos, snapshot, snapshot_name, cerrar), el último gana
+        for op, key, campos, snapshot, snapshot_name, clave_dedup in lote:
+            if self.dedup is not None and clave_dedup is not None:
+                self._deduplicar(op, key, clave_dedup)
+            retomado = self._retomados.pop(key, None) if op == 'cerrar' else self._retomados.get(key)
+            if retomado is not None:
+                # No se conoce el estado acumulado por la otra instancia
+                op = 'cerrar' if op == 'cerrar' else 'actualizar'
+                key = retomado
+                campos = {k: v for k, v in campos.items() if k in ('last_seen', 'closed_at')}
+                snapshot = snapshot_name = None
+            if op == 'crear':
+                campos = self._con_captura(campos, snapshot, snapshot_name)
+                nuevas.append(Alert(**campos))
+                claves.append(key)
+            else:
+                anterior = cambios.get(key)
+                if snapshot is None and anterior is not None and anterior[1] is not None:
+                    # Conservar la mejor captura pendiente del lote
+                    snapshot, snapshot_name = anterior[1], anterior[2]
+                cambios[key] = (campos, snapshot, snapshot_name, op == 'cerrar' or (anterior and anterior[3]))
+
+        close_old_connections()
+        if nuevas:
+            try:
+                with transaction.atomic():
+                    Alert.objects.bulk_create(nuevas)
+                    resumenes.registrar(nuevas)
+                self.written += len(nuevas)
+                creadas = nuevas
+                for key, alerta in zip(claves, nuevas):
+                    if key is not None and alerta.pk is not None:
+                        self._pks[key] = alerta.pk
+                        if self.dedup is not None:
+                            self.dedup.asociar(key, alerta.pk)
+            except Exception as e:
+                self.errors += len(nuevas)
+                logger.error(f"No se pudieron guardar {len(nuevas)} alertas: {e}")
+
+        for key, (campos, snapshot, snapshot_name, cerrar) in cambios.items():
+            pk = self._pks.pop(key, None) if cerrar else self._pks.get(key)
+            if pk is None and self.dedup is not None:
+                # Incidente creado por otro proceso o una instancia anterior
+                pk = self.dedup.alerta_de(key)
+                if pk is not None and not cerrar:
+                    self._pks[key] = pk
+            if pk is None:
+                # La creación se descartó o falló
+                self.errors += 1
+                continue
+            campos = self._con_captura(campos, snapshot, snapshot_name)
+            try:
+                resumenes.actualizar(Alert.objects.filter(pk=pk), **campos)
+                self.updated += 1
+                actualizadas.append(pk)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"No se pudo actualizar la alerta {pk}: {e}")
+
+        if creadas or actualizadas:
+            # Una sola vez por lote: invalida las respuestas cacheadas
+            try:
+                AlertVersion.bump()
+            except Exception as e:
+                logger.error(f"No se pudo actualizar la versión de alertas: {e}")
+            if self.bus is not None:
+                self._publicar(creadas, actualizadas)
+
+    def _publicar(self, creadas, actualizadas):
+        from .models import Alert
+
+        try:
+            for alerta in creadas:
+                self.bus.publicar('creada', datos_alerta(alerta))
+            if actualizadas:
+                for alerta in Alert.objects.filter(pk__in=actualizadas):
+                    self.bus.publicar('actualizada', datos_alerta(alerta))
+        except Exception as e:
+            logger.error(f"No se pudieron publicar los eventos de alertas: {e}")
+
+    def _run(self):
+        lote = []
+        limite = None
+        terminar = False
+        while not terminar:
+            timeout = None if limite is None else max(0, limite - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            if item is None:
+                terminar = True
+            elif item:
+                lote.append(item)
+                if limite is None:
+                    limite = time.monotonic() + self.flush_interval
+            if lote and (terminar or len(lote) >= self.batch_size or time.monotonic() >= limite):
+                self._escribir(lote)
+                lote = []
+                limite = None
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def obtener_sink():
+    """AlertSink compartido del proceso, configurado desde settings"""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            from django.conf import settings
+            _sink = AlertSink(
+                media_root=str(settings.MEDIA_ROOT),
+                batch_size=getattr(settings, 'ALERTAS_LOTE', 20),
+                flush_interval=getattr(settings, 'ALERTAS_FLUSH_SECONDS', 1.0),
+                queue_size=getattr(settings, 'ALERTAS_COLA', 500),
+                dedup=obtener_dedup(),
+                bus=obtener_bus(),
+            )
+            atexit.register(_sink.close)
+        return _sink
+
+
+def resolver_alertas(alertas, user, status='resolved', notes='', level=None, only_unresolved=True, batch_size=500):
+    """
+    Resuelve en bloque las alertas del queryset `alertas`: un UPDATE por
+    lote de `batch_size` ids, con los resúmenes ajustados en la misma
+    transacción. La versión de alertas y el evento se emiten una sola vez al
+    final; el evento lleva el número de alertas y la versión, no los ids, y
+    los clientes vuelven a consultar. Devuelve el número de alertas
+    actualizadas.
+
+    Por defecto sólo se tocan las pendientes (`only_unresolved`), también si
+    otro usuario resolvió alguna mientras se recorrían los lotes, para no
+    pisar quién y cuándo lo hizo. Las notas existentes sólo se reemplazan
+    si se pasan `notes`.
+    """
+    from django.db import transaction
+    from django.utils import timezone
+    from .models import Alert, AlertVersion
+    from . import resumenes
+
+    campos = {
+        'resolved': True,
+        'resolution_status': status,
+        'resolved_by': user,
+        'resolved_at': timezone.now(),
+    }
+    if notes:
+        campos['resolution_notes'] = notes
+    if level:
+        campos['level'] = level
+
+    if only_unresolved:
+        alertas = alertas.filter(resolved=False)
+    ids = list(alertas.order_by().values_list('pk', flat=True))
+    total = 0
+    for inicio in range(0, len(ids), batch_size):
+        lote = ids[inicio:inicio + batch_size]
+        pendientes = Alert.objects.filter(pk__in=lote)
+        if only_unresolved:
+            pendientes = pendientes.filter(resolved=False)
+        with transaction.atomic():
+            # Los resúmenes se mueven sólo para las filas que el UPDATE toca
+            total += resumenes.actualizar(pendientes, **campos)
+
+    if total:
+        AlertVersion.bump()
+        obtener_bus().publicar('resueltas', {
+            'count': total,
+            'resolution_status': status,
+            'version': AlertVersion.current().version,
+        })
+    return total
@@ -0,0 +1,35 @@
+from django.db import transaction
+
+
+def archivables(antes):
+    """Alertas resueltas con timestamp anterior a `antes`"""
+    from .models import Alert
+
+    return Alert.objects.filter(resolved=True, timestamp__lt=antes)
+
+
+def archivar(antes, batch_size=1000):
+    """
+    Mueve a AlertArchive las alertas resueltas anteriores a `antes`, en
+    transacciones de `batch_size` filas para no bloquear la base a los
+    escritores de alertas. Los resúmenes no cambian: las alertas archivadas
+    siguen contadas. Devuelve el número de alertas archivadas.
+    """
+    from .models import Alert, AlertArchive, AlertVersion
+
+    campos = [campo.attname for campo in Alert._meta.concrete_fields]
+    alertas = archivables(antes).order_by('pk')
+    total = 0
+    while True:
+        with transaction.atomic():
+            filas = list(alertas.values(*campos)[:batch_size])
+            if not filas:
+                break
+            AlertArchive.objects.bulk_create([AlertArchive(**fila) for fila in filas])
+            Alert.objects.filter(pk__in=[fila['id'] for fila in filas]).delete()
+        total += len(filas)
+
+    if total:
+        # Las listas y la caché de alertas recientes de cada proceso se recargan
+        AlertVersion.bump()
+    return total
@@ -0,0 +1,64 @@
+import html
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+# Columnas indexadas en las tablas FTS5 (migración 0015_alert_fts)
+COLUMNAS = ('message', 'missing', 'resolution_notes')
+
+# Marcas de los fragmentos: caracteres que no aparecen en el texto, para
+# escapar el HTML antes de resaltar
+_INICIO, _FIN = '\x02', '\x03'
+
+
+def disponible():
+    return connection.vendor == 'sqlite'
+
+
+def consulta(texto):
+    """
+    Convierte lo que escribe el usuario en una consulta FTS5 segura: cada
+    palabra entre comillas y como prefijo, todas requeridas. Devuelve '' si
+    no queda ninguna palabra.
+    """
+    palabras = re.findall(r'\w+', texto or '')
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+def filtrar(queryset, texto, snippet=False):
+    """
+    Filtra un queryset de Alert o AlertArchive por `texto` y lo ordena por
+    relevancia (bm25; el atributo `rank`, menor es mejor). Con `snippet` se
+    agrega `snippet`, el fragmento con las coincidencias sin escapar (ver
+    `resaltar`). Sin FTS5 se usa icontains y se conserva el orden.
+    """
+    q = consulta(texto)
+    if not q:
+        return queryset.none()
+    if not disponible():
+        condicion = Q()
+        for palabra in re.findall(r'\w+', texto):
+            condicion &= Q(message__icontains=palabra) | Q(missing__icontains=palabra) | Q(resolution_notes__icontains=palabra)
+        return queryset.filter(condicion)
+
+    tabla = queryset.model._meta.db_table
+    fts = f'{tabla}_fts'
+    select = {'rank': f'bm25({fts})'}
+    if snippet:
+        select['snippet'] = f"snippet({fts}, -1, '{_INICIO}', '{_FIN}', '…', 16)"
+    # extra(): el JOIN con la tabla virtual no se puede expresar con el ORM
+    return queryset.extra(
+        tables=[fts],
+        where=[f'{fts}.rowid = {tabla}.id', f'{fts} MATCH %s'],
+        params=[q],
+        select=select,
+        order_by=['rank'],
+    )
+
+
+def resaltar(fragmento):
+    """HTML del fragmento de `filtrar(snippet=True)`, escapado y con <mark>"""
+    if not fragmento:
+        return ''
+    return html.escape(fragmento).replace(_INICIO, '<mark>').replace(_FIN, '</mark>')
@@ -1,18 +1,49 @@
 import cv2
 import numpy as np
 import os
+import time
 from ultralytics import YOLO
+from .detecciones import CanalDetecciones, construir_metadatos
+from .alertas import obtener_sink
+from .evidencia import GrabadorClips
+from .incidentes import GestorIncidentes
+from .grabacion import GrabadorAsincrono, OpenCVBackend, registrar_grabacion
 
 class VideoCamera:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, tracking=False, pre_roll_seconds=5, post_roll_seconds=5,
+                 recording_backend=OpenCVBackend, recordings_dir='grabaciones/pc', media_root=None,
+                 segment_seconds=300, segment_max_bytes=None, clips=None, alert_sink=None,
+                 incident_quiet_seconds=15):
         self.video = None
         self.is_running = False
-        self.out = None
-        self.is_recording = False
-        self.last_detection_time = None
-        self.no_detection_threshold = 5  # segundos sin detección antes de detener la grabación
-        self.current_recording_filename = None
-        self.last_alert_time = None
+        # Grabación en segundo plano: pre-roll de los segundos previos a la
+        # primera detección y post-roll tras la última
+        self.recorder = GrabadorAsincrono(
+            recordings_dir,
+            backend_factory=recording_backend,
+            pre_roll_seconds=pre_roll_seconds,
+            post_roll_seconds=post_roll_seconds,
+            segment_seconds=segment_seconds,
+            segment_max_bytes=segment_max_bytes,
+            base_dir=media_root,
+            on_segment_closed=registrar_grabacion,
+        )
+        # Clips de evidencia por alerta (buffer circular propio)
+        self.clips = clips or GrabadorClips(
+            os.path.join(media_root or '', 'clips', 'pc'),
+            backend_factory=recording_backend,
+            base_dir=media_root,
+        )
+        # Las alertas se guardan desde el hilo del AlertSink, nunca desde get_frame
+        self.alertas = alert_sink or obtener_sink()
+        # Un incumplimiento continuo es un solo incidente (una fila de Alert),
+        # y el AlertSink lo deduplica entre reinicios de la cámara
+        self.incidentes = GestorIncidentes(self.alertas, camera='pc', quiet_seconds=incident_quiet_seconds)
+        # Metadatos de detección por frame (para overlays en el navegador)
+        self.frame_seq = 0
+        self.detecciones = CanalDetecciones()
+        self.tracking = tracking  # usar model.track para obtener track ids
+        self.hls = None  # HLSStreamer opcional (stream H.264 para supervisores remotos)
         
         # Ruta absoluta al modelo
         model_path = r'C:\Users\jonat\Desktop\modelo_entrenado\sistema\epp\Models\best.pt'
@@ -39,36 +70,19 @@ class VideoCamera:
     def __del__(self):
         if self.video:
             self.video.release()
-        if self.out:
-            self.out.release()
-            
-    def start_recording(self, frame):
-        if not self.is_recording:
-            # Crear directorio de grabaciones si no existe
-            os.makedirs('grabaciones', exist_ok=True)
-            
-            # Generar nombre de archivo con timestamp
-            from datetime import datetime
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'grabaciones/recording_{timestamp}.avi'
-            # Guardar filename para enlazar en alertas
-            self.current_recording_filename = filename
-            
-            # Obtener dimensiones del frame
-            height, width = frame.shape[:2]
-            
-            # Inicializar el escritor de video
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            self.out = cv2.VideoWriter(filename, fourcc, 20.0, (width, height))
-            self.is_recording = True
-            print(f"Iniciando grabación: {filename}")
-            
-    def stop_recording(self):
-        if self.is_recording:
-            self.out.release()
-            self.out = None
-            self.is_recording = False
-            print("Grabación detenida")
+        if getattr(self, 'recorder', None):
+            self.recorder.close()
+        if getattr(self, 'clips', None):
+            self.clips.close()
+
+    @property
+    def is_recording(self):
+        return self.recorder.is_recording
+
+    @property
+    def current_recording_filename(self):
+        # Filename de la grabación en curso, para enlazar en alertas
+        return self.recorder.current_filename
     
     def start(self):
         if not self.is_running:
@@ -108,8 +122,22 @@ class VideoCamera:
             self.video.release()
             self.video = None
             self.is_running = False
+        self.recorder.stop()
+        self.incidentes.cerrar()
+        if self.hls:
+            self.hls.stop()
     
-    def get_frame(self):
+    def _inferir(self, image):
+        if self.tracking:
+            return self.model.track(image, conf=0.25, persist=True, show=False, verbose=False)
+        return self.model.predict(image, conf=0.25, show=False)
+
+    def get_frame(self, annotate=True):
+        """
+        Devuelve el frame como JPEG. Con annotate=False se omite el dibujo de
+        las detecciones y se codifica con menor calidad: el navegador dibuja
+        los recuadros a partir de los metadatos publicados en `detecciones`.
+        """
         if not self.is_running:
             print("Error: La cámara no está iniciada")
             return None
@@ -134,67 +162,52 @@ class VideoCamera:
                 return None
             
             # Realizar predicción con YOLOv8
-            results = self.model.predict(image, conf=0.25, show=False)
+            results = self._inferir(image)
             
             # Obtener el primer resultado
             if results and len(results) > 0:
                 result = results[0]
                 num_detections = len(result.boxes)
+                self.frame_seq += 1
+                metadatos = construir_metadatos(result, self.model.names, self.frame_seq, person_class="person")
+                self.detecciones.publicar(metadatos)
                 
-                # Si hay detecciones de personas
-                if num_detections > 0:
-                    # Actualizar tiempo de última detección
-                    import time
-                    self.last_detection_time = time.time()
-                    
-                    # Iniciar grabación si no está grabando
-                    self.start_recording(image)
-                    
-                    # Grabar el frame si está grabando
-                    if self.is_recording:
-                        self.out.write(image)
+                # El grabador inicia con la primera detección (volcando el
+                # pre-roll) y se detiene al vencer el post-roll
+                self.recorder.submit(
+                    image, detected=num_detections > 0,
+                    persons=len(metadatos["persons"]),
+                    violations=sum(1 for persona in metadatos["persons"] if persona[2]),
+                )
+                self.clips.submit(image)
                 
-                # Dibujar las detecciones en la imagen
-                annotated_frame = result.plot()
-                # Detectar clases y guardar alertas si falta algún elemento
+                # Detectar clases y abrir/actualizar el incidente si falta algún elemento
                 try:
                     detected_classes = [self.model.names[int(cls)] for cls in result.boxes.cls]
                     required_items = ["person", "helmet", "vest", "boots"]
+                    missing = []
                     if "person" in detected_classes:
                         missing = [item for item in required_items[1:] if item not in detected_classes]
-                        import time
-                        now = time.time()
-                        if missing:
-                            # Crear alerta en DB (si está disponible)
-                            try:
-                                from .models import Alert
-                                if not self.last_alert_time or (now - self.last_alert_time) > 10:
-                                    Alert.objects.create(
-                                        message=f"Persona sin {', '.join(missing)}",
-                                        missing=', '.join(missing),
-                                        level='high',
-                                        video=self.current_recording_filename or ''
-                                    )
-                                    self.last_alert_time = now
-                            except Exception as e:
-                                print(f"No se pudo guardar alerta: {e}")
-                        else:
-                            # Todos los elementos presentes: alerta positiva (opcional)
-                            try:
-                                from .models import Alert
-                                if not self.last_alert_time or (now - self.last_alert_time) > 10:
-                                    Alert.objects.create(
-                                        message="Persona con EPP completo",
-                                        missing='',
-                                        level='positive',
-                                        video=self.current_recording_filename or ''
-                                    )
-                                    self.last_alert_time = now
-                            except Exception as e:
-                                print(f"No se pudo guardar alerta positiva: {e}")
-                except Exception:
-                    pass
+                    now = time.time()
+                    confianza = max(
+                        (metadatos["boxes"][persona[0]][5] for persona in metadatos["persons"]), default=0.0
+                    )
+                    self.incidentes.observar(
+                        missing, now, confidence=confianza,
+                        al_abrir=lambda: {
+                            'video': self.current_recording_filename or '',
+                            'clip': self.clips.solicitar(now),
+                        },
+                    )
+                except Exception as e:
+                    print(f"No se pudo registrar el incidente: {e}")
+                
+                if not annotate and self.hls is None:
+                    ret, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 60])
+                    return jpeg.tobytes() if ret else None
                 
+                # Dibujar las detecciones en la imagen
+                annotated_frame = result.plot()
                 # Añadir contador de detecciones y estado de grabación
                 cv2.putText(annotated_frame, f"Detecciones: {num_detections}", (10, 30),
                           cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
@@ -202,6 +215,12 @@ class VideoCamera:
                     cv2.putText(annotated_frame, "REC", (10, 70),
                               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
                 
+                if self.hls:
+                    self.hls.write(annotated_frame)
+                if not annotate:
+                    ret, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 60])
+                    return jpeg.tobytes() if ret else None
+                
                 # Convertir a JPEG
                 ret, jpeg = cv2.imencode('.jpg', annotated_frame)
                 if not ret:
@@ -210,22 +229,20 @@ class VideoCamera:
                 
                 return jpeg.tobytes()
             else:
-                # Si no hay detecciones, verificar si debemos detener la grabación
-                if self.is_recording and self.last_detection_time:
-                    import time
-                    current_time = time.time()
-                    if current_time - self.last_detection_time > self.no_detection_threshold:
-                        self.stop_recording()
+                # Sin resultados: el grabador aplica el post-roll
+                self.recorder.submit(image, detected=False)
+                self.clips.submit(image)
+                self.incidentes.observar([])
                 
-                # Si está grabando, grabar el frame aunque no haya detecciones
-                if self.is_recording:
-                    self.out.write(image)
-                
-                # Mostrar el frame original
-                if self.is_recording:
-                    cv2.putText(image, "REC", (10, 70),
+                # Mostrar el frame original (copia: el grabador conserva `image`)
+                display = image
+                if self.is_recording and annotate:
+                    display = image.copy()
+                    cv2.putText(display, "REC", (10, 70),
                               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                ret, jpeg = cv2.imencode('.jpg', image)
+                if self.hls:
+                    self.hls.write(display)
+                ret, jpeg = cv2.imencode('.jpg', display)
                 return jpeg.tobytes()
             
         except Exception as e:
@@ -0,0 +1,132 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS dedup (
+    clave TEXT PRIMARY KEY,
+    camara TEXT NOT NULL,
+    expira REAL NOT NULL,
+    incidente TEXT NOT NULL,
+    alerta INTEGER
+);
+CREATE INDEX IF NOT EXISTS dedup_expira ON dedup (expira);
+CREATE INDEX IF NOT EXISTS dedup_incidente ON dedup (incidente);
+"""
+
+
+class DedupStore:
+    """
+    Estado de deduplicación de incidentes compartido entre procesos y
+    reinicios de cámara.
+
+    Cada entrada (cámara, zona/track, firma del incumplimiento) apunta al
+    incidente activo y vence `ttl` segundos después de la última vez que se
+    vio. Vive en un archivo SQLite propio en modo WAL, separado de la base de
+    Django para no competir por su bloqueo de escritura. Las renovaciones se
+    filtran con una caché en memoria, así que la mayoría de las consultas no
+    llegan a SQLite.
+    """
+
+    def __init__(self, path, purge_interval=300):
+        self.path = str(path)
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._cache = {}  # clave -> (expira, incidente)
+        self._last_purge = 0
+        self._conn().executescript(ESQUEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def clave(camara, zona, firma):
+        return f'{camara}|{zona}|{firma}'
+
+    def reclamar(self, camara, zona, firma, incidente, ttl, now=None):
+        """
+        Registra `incidente` como activo para la clave si no hay otro vigente.
+        Devuelve (True, incidente) si se reclamó, o (False, incidente
+        existente) si otro proceso o instancia ya tiene uno abierto.
+        """
+        now = now if now is not None else time.time()
+        clave = self.clave(camara, zona, firma)
+        cached = self._cache.get(clave)
+        if cached and cached[0] > now:
+            return False, cached[1]
+
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.execute(
+                'INSERT INTO dedup (clave, camara, expira, incidente, alerta) VALUES (?, ?, ?, ?, NULL) '
+                'ON CONFLICT (clave) DO UPDATE SET expira = excluded.expira, '
+                'incidente = excluded.incidente, alerta = NULL WHERE dedup.expira <= ?',
+                (clave, camara, now + ttl, incidente, now),
+            )
+            if cursor.rowcount:
+                resultado = (True, incidente)
+                expira = now + ttl
+            else:
+                expira, existente = conn.execute(
+                    'SELECT expira, incidente FROM dedup WHERE clave = ?', (clave,)
+                ).fetchone()
+                resultado = (False, existente)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._cache[clave] = (expira, resultado[1])
+        self._purgar_si_corresponde(now)
+        return resultado
+
+    def renovar(self, camara, zona, firma, ttl, now=None):
+        """Extiende la vigencia de la clave; sólo escribe cuando pasó la mitad del ttl"""
+        now = now if now is not None else time.time()
+        clave = self.clave(camara, zona, firma)
+        cached = self._cache.get(clave)
+        if cached and cached[0] - now > ttl / 2:
+            return
+        self._conn().execute('UPDATE dedup SET expira = ? WHERE clave = ?', (now + ttl, clave))
+        if cached:
+            self._cache[clave] = (now + ttl, cached[1])
+
+    def asociar(self, incidente, alerta_pk):
+        """Guarda el id de la fila de Alert del incidente (desde el hilo del AlertSink)"""
+        self._conn().execute('UPDATE dedup SET alerta = ? WHERE incidente = ?', (alerta_pk, incidente))
+
+    def alerta_de(self, incidente):
+        row = self._conn().execute(
+            'SELECT alerta FROM dedup WHERE incidente = ? AND alerta IS NOT NULL', (incidente,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _purgar_si_corresponde(self, now):
+        if now - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = now
+        self._conn().execute('DELETE FROM dedup WHERE expira < ?', (now,))
+        self._cache = {k: v for k, v in self._cache.items() if v[0] >= now}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def obtener_dedup():
+    """DedupStore compartido del proceso, configurado desde settings"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            from django.conf import settings
+            _store = DedupStore(settings.DEDUP_DB_PATH)
+        return _store
@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+
+# Elementos de EPP que se verifican para cada persona detectada
+REQUIRED_ITEMS = ("helmet", "vest", "boots")
+
+
+def _centro_dentro(box, persona):
+    """Indica si el centro de `box` cae dentro del recuadro de la persona"""
+    cx = (box[0] + box[2]) / 2
+    cy = (box[1] + box[3]) / 2
+    return persona[0] <= cx <= persona[2] and persona[1] <= cy <= persona[3]
+
+
+def construir_metadatos(result, names, seq, person_class="person", required_items=REQUIRED_ITEMS):
+    """
+    Convierte un resultado de YOLOv8 en un diccionario compacto con las
+    detecciones del frame, listo para enviarse al navegador.
+
+    Cada caja se envía como [x1, y1, x2, y2, clase, confianza, track_id] y cada
+    persona como [índice de caja, track_id, [elementos faltantes]].
+    """
+    boxes = result.boxes
+    xyxy = boxes.xyxy.tolist() if len(boxes) else []
+    clases = [int(c) for c in boxes.cls.tolist()] if len(boxes) else []
+    confs = boxes.conf.tolist() if len(boxes) else []
+    ids = boxes.id.tolist() if getattr(boxes, "id", None) is not None else [None] * len(clases)
+
+    cajas = []
+    for (x1, y1, x2, y2), cls, conf, track_id in zip(xyxy, clases, confs, ids):
+        cajas.append([
+            int(x1), int(y1), int(x2), int(y2),
+            cls, round(conf, 2),
+            int(track_id) if track_id is not None else None,
+        ])
+
+    # Asignar cada elemento de EPP a la persona que lo contiene
+    personas = []
+    for i, caja in enumerate(cajas):
+        if names[caja[4]] != person_class:
+            continue
+        presentes = {
+            names[otra[4]] for otra in cajas
+            if names[otra[4]] in required_items and _centro_dentro(otra, caja)
+        }
+        faltantes = [item for item in required_items if item not in presentes]
+        personas.append([i, caja[6], faltantes])
+
+    height, width = result.orig_shape[:2]
+    return {
+        "seq": seq,
+        "t": round(time.time(), 3),
+        "w": width,
+        "h": height,
+        "boxes": cajas,
+        "persons": personas,
+    }
+
+
+def serializar(metadatos):
+    """JSON sin espacios para reducir los bytes enviados por frame"""
+    return json.dumps(metadatos, separators=(",", ":"))
+
+
+class CanalDetecciones:
+    """
+    Publica los metadatos del último frame procesado para que varios
+    clientes (SSE) los lean sin volver a ejecutar la inferencia.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._ultimo = None
+
+    def publicar(self, metadatos):
+        with self._cond:
+            self._ultimo = metadatos
+            self._cond.notify_all()
+
+    def esperar(self, ultimo_seq, timeout=15):
+        """Bloquea hasta que haya un frame distinto de `ultimo_seq` o venza el timeout"""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._ultimo is not None and self._ultimo["seq"] != ultimo_seq,
+                timeout=timeout,
+            )
+            if self._ultimo is None or self._ultimo["seq"] == ultimo_seq:
+                return None
+            return self._ultimo
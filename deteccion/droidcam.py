@@ -4,21 +4,21 @@ import os
 import time
 from ultralytics import YOLO
 import logging
+from .alertas import obtener_sink
+from .detecciones import CanalDetecciones, construir_metadatos
+from .incidentes import GestorIncidentes
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class DroidCamera:
-    def __init__(self, model_path=None, ip_address="192.168.1.100", port="4747"):
+    def __init__(self, model_path=None, ip_address="192.168.1.100", port="4747", tracking=False, clips=None,
+                 alert_sink=None, incident_quiet_seconds=15):
         self.video = None
         self.is_running = False
         self.ip_address = ip_address
         self.port = port
-        self.last_alert_time = None
-        self.alert_cooldown = 5  # segundos entre alertas
-        self.last_capture_time = 0
-        self.capture_interval = 2  # segundos mínimo entre capturas
         self.consecutive_errors = 0
         self.max_consecutive_errors = 5
         
@@ -27,6 +27,19 @@ class DroidCamera:
         self.alert_pending = False
         self.pending_alert_data = None
         self.alert_delay = 3.0  # 3 segundos de retraso
+
+        # Metadatos de detección por frame (para overlays en el navegador)
+        self.frame_seq = 0
+        self.detecciones = CanalDetecciones()
+        self.tracking = tracking  # usar model.track para obtener track ids
+        self.hls = None  # HLSStreamer opcional (stream H.264 para supervisores remotos)
+        self.clips = clips  # GrabadorClips opcional (clip de evidencia por alerta)
+        # Capturas y alertas se escriben desde el hilo del AlertSink
+        self.alertas = alert_sink or obtener_sink()
+        # Un incumplimiento continuo es un solo incidente, que se cierra tras
+        # `incident_quiet_seconds` sin verlo; el estado de deduplicación es
+        # compartido, así que reconectar no abre un incidente duplicado
+        self.incidentes = GestorIncidentes(self.alertas, camera='droidcam', quiet_seconds=incident_quiet_seconds)
         
         # Ruta absoluta al modelo YOLO
         model_path = r'C:\Users\jonat\Desktop\modelo_entrenado\sistema\models2\Models\best.pt'
@@ -52,6 +65,9 @@ class DroidCamera:
 
     def __del__(self):
         self.stop()
+        # stop() también se usa al reconectar: los clips se cierran sólo aquí
+        if getattr(self, 'clips', None):
+            self.clips.close()
 
     def _safe_release_camera(self):
         """Libera la cámara de forma segura"""
@@ -76,8 +92,11 @@ class DroidCamera:
         elapsed_time = current_time - self.human_detection_time
         return elapsed_time >= self.alert_delay
 
-    def _process_human_detection(self, frame, detected_classes, current_time):
-        """Procesa la detección de humano con retraso de 3 segundos"""
+    def _process_human_detection(self, frame, detected_classes, current_time, confidence=0.0):
+        """
+        Procesa la detección de humano: el incidente se abre tras 3 segundos
+        de incumplimiento continuo y luego se actualiza en cada frame.
+        """
         required_items = {
             "helmet": "Casco",
             "vest": "Chaleco", 
@@ -92,6 +111,12 @@ class DroidCamera:
 
         # Si hay elementos faltantes
         if missing_items:
+            if self.incidentes.actual is not None:
+                # ✅ INCIDENTE ABIERTO: actualizarlo en el lugar
+                self.incidentes.observar(missing_items, current_time, confidence=confidence, frame=frame)
+                missing_item = ', '.join(self.incidentes.actual['missing'])
+                return f"Persona sin {missing_item}", missing_item
+
             if self.human_detection_time is None:
                 # ✅ PRIMERA DETECCIÓN: Iniciar contador de 3 segundos
                 self.human_detection_time = current_time
@@ -105,14 +130,18 @@ class DroidCamera:
                 return None, None
             
             elif self._check_alert_delay(current_time):
-                # ✅ PASARON 3 SEGUNDOS: Generar alerta
+                # ✅ PASARON 3 SEGUNDOS: Abrir incidente (captura y fila las escribe el AlertSink)
                 alert_message = f"Persona sin {', '.join(missing_items)}"
                 missing_item = ', '.join(missing_items)
                 
-                logger.info(f"⚠️ ALERTA GENERADA después de {self.alert_delay} segundos: {alert_message}")
+                logger.info(f"⚠️ INCIDENTE ABIERTO después de {self.alert_delay} segundos: {alert_message}")
                 
-                # Guardar captura y alerta
-                self.save_alert_capture(frame, alert_message, missing_item)
+                self.incidentes.observar(
+                    missing_items, current_time, confidence=confidence, frame=frame,
+                    al_abrir=lambda: {
+                        'clip': self.clips.solicitar(current_time) if self.clips else '',
+                    },
+                )
                 
                 # Resetear para la próxima detección
                 self.human_detection_time = None
@@ -133,81 +162,10 @@ class DroidCamera:
                 self.human_detection_time = None
                 self.alert_pending = False
                 self.pending_alert_data = None
+            self.incidentes.observar([], current_time)
 
         return None, None
 
-    def save_alert_capture(self, frame, alert_message, missing_item):
-        """Guarda captura localmente"""
-        current_time = time.time()
-
-        # Verificar cooldown
-        if current_time - self.last_capture_time < self.capture_interval:
-            return None
-
-        try:
-            alertas_dir = 'media/alertas'
-            os.makedirs(alertas_dir, exist_ok=True)
-
-            timestamp = time.strftime('%Y%m%d_%H%M%S')
-            filename = f'alerta_{timestamp}_{missing_item.replace(" ", "_").lower()}.jpg'
-            local_path = os.path.join(alertas_dir, filename)
-
-            logger.info(f"📸 Guardando imagen de alerta: {local_path}")
-
-            success = cv2.imwrite(local_path, frame)
-            if not success:
-                logger.error(f"❌ Error: No se pudo guardar la imagen en {local_path}")
-                return None
-
-            logger.info(f"✅ Imagen guardada exitosamente: {local_path}")
-
-            self.last_capture_time = current_time
-            db_path = f'alertas/{filename}'
-
-            # Guardar en base de datos
-            alert_obj = self.save_alert_to_db(alert_message, missing_item, db_path, current_time)
-
-            if alert_obj:
-                logger.info(f"✅ Alerta guardada en BD con ID: {alert_obj.id}")
-            else:
-                logger.info("⚠️ Alerta no guardada en BD (posible cooldown)")
-
-            return db_path
-
-        except Exception as e:
-            logger.error(f"❌ Error crítico guardando captura: {e}")
-            return None
-
-    def save_alert_to_db(self, alert_message, missing_item, filename, current_time):
-        """Guarda la alerta en la base de datos Django"""
-        try:
-            from django.utils import timezone
-            from .models import Alert
-
-            # Evitar alertas duplicadas por cooldown
-            if not self.last_alert_time or (current_time - self.last_alert_time) > self.alert_cooldown:
-                alert = Alert.objects.create(
-                    message=alert_message,
-                    missing=missing_item,
-                    level='high',
-                    video=filename,
-                    timestamp=timezone.now()
-                )
-
-                logger.info(f"✅ Alerta guardada en BD: {alert_message} - Imagen: {filename}")
-                self.last_alert_time = current_time
-                return alert
-            else:
-                logger.info("⏳ Alerta omitida (cooldown activo)")
-                return None
-
-        except (ImportError, NameError) as e:
-            logger.warning(f"⚠️ Django no disponible: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"❌ Error guardando alerta en BD: {e}")
-            return None
-
     def start(self):
         """Inicia la conexión con DroidCam con manejo robusto de errores"""
         if self.is_running:
@@ -255,8 +213,12 @@ class DroidCamera:
 
     def stop(self):
         """Detiene la cámara de forma segura"""
+        if getattr(self, 'incidentes', None):
+            self.incidentes.cerrar()
         self.is_running = False
         self._safe_release_camera()
+        if getattr(self, 'hls', None):
+            self.hls.stop()
         logger.info("🛑 DroidCam stopped successfully")
 
     def _validate_frame(self, frame):
@@ -269,8 +231,18 @@ class DroidCamera:
             return False
         return True
 
-    def get_frame(self):
-        """Obtiene un frame con manejo robusto de errores"""
+    def _inferir(self, image):
+        """Ejecuta YOLOv8 (con tracking si está habilitado)"""
+        if self.tracking:
+            return self.model.track(image, conf=0.25, persist=True, verbose=False, imgsz=320)
+        return self.model.predict(image, conf=0.25, verbose=False, imgsz=320)
+
+    def get_frame(self, annotate=True):
+        """
+        Obtiene un frame con manejo robusto de errores. Con annotate=False
+        devuelve el frame sin dibujar y con menor calidad JPEG; los recuadros
+        se dibujan en el navegador a partir de `self.detecciones`.
+        """
         if not self.is_running or self.video is None or not self.video.isOpened():
             logger.warning("Cámara no disponible, intentando reconectar...")
             if not self.start():
@@ -293,14 +265,19 @@ class DroidCamera:
             self.consecutive_errors = 0
             original_image = image.copy()
             current_time = time.time()
+            if self.clips:
+                self.clips.submit(image, current_time)
 
             # YOLOv8 Prediction con manejo de errores
             try:
-                results = self.model.predict(image, conf=0.25, verbose=False, imgsz=320)
+                results = self._inferir(image)
 
                 if results and len(results) > 0:
                     result = results[0]
                     num_detections = len(result.boxes)
+                    self.frame_seq += 1
+                    metadatos = construir_metadatos(result, self.model.names, self.frame_seq, person_class="human")
+                    self.detecciones.publicar(metadatos)
 
                     detected_classes = [self.model.names[int(cls)] for cls in result.boxes.cls]
 
@@ -312,8 +289,11 @@ class DroidCamera:
 
                     # ✅ NUEVA LÓGICA: Solo procesar si hay humano
                     if has_person:
+                        confianza = max(
+                            (metadatos["boxes"][persona[0]][5] for persona in metadatos["persons"]), default=0.0
+                        )
                         alert_message, missing_item = self._process_human_detection(
-                            original_image, detected_classes, current_time
+                            image, detected_classes, current_time, confidence=confianza
                         )
                         
                         # Actualizar estado EPP para visualización
@@ -327,12 +307,17 @@ class DroidCamera:
                             self.human_detection_time = None
                             self.alert_pending = False
                             self.pending_alert_data = None
+                        self.incidentes.observar([], current_time)
 
                         # Si no hay humano, todos los EPP son None
                         required_items = {"helmet": "Casco", "vest": "Chaleco", "boots": "Botas"}
                         for item_label in required_items.values():
                             epp_status[item_label] = None
 
+                    if not annotate and self.hls is None:
+                        ret, jpeg = cv2.imencode('.jpg', original_image, [cv2.IMWRITE_JPEG_QUALITY, 60])
+                        return jpeg.tobytes()
+
                     annotated_frame = result.plot()
                     y_offset = 40
 
@@ -380,6 +365,12 @@ class DroidCamera:
                         cv2.putText(annotated_frame, f"Falta: {missing_item}", (10, y_offset),
                                     cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
 
+                    if self.hls:
+                        self.hls.write(annotated_frame)
+                    if not annotate:
+                        ret, jpeg = cv2.imencode('.jpg', original_image, [cv2.IMWRITE_JPEG_QUALITY, 60])
+                        return jpeg.tobytes()
+
                     ret, jpeg = cv2.imencode('.jpg', annotated_frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
                     return jpeg.tobytes()
 
@@ -388,11 +379,20 @@ class DroidCamera:
                     self.human_detection_time = None
                     self.alert_pending = False
                     self.pending_alert_data = None
+                    self.incidentes.observar([], current_time)
+
+                    if not annotate:
+                        if self.hls:
+                            self.hls.write(original_image)
+                        ret, jpeg = cv2.imencode('.jpg', original_image, [cv2.IMWRITE_JPEG_QUALITY, 60])
+                        return jpeg.tobytes()
                     
                     cv2.putText(original_image, "Detecciones: 0", (10, 30),
                                 cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
                     cv2.putText(original_image, "No se detectaron objetos relevantes", (10, 60),
                                 cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+                    if self.hls:
+                        self.hls.write(original_image)
 
                     ret, jpeg = cv2.imencode('.jpg', original_image, [cv2.IMWRITE_JPEG_QUALITY, 80])
                     return jpeg.tobytes()
@@ -0,0 +1,30 @@
+import re
+
+# Elementos de protección obligatorios: clase del detector, nombre y bit en
+# Alert.missing_mask. Deben coincidir con las filas de PPEItem, que crea la
+# migración 0011 y que el admin no deja modificar.
+ELEMENTOS = (
+    ('helmet', 'Casco', 1),
+    ('vest', 'Chaleco', 2),
+    ('boots', 'Botas', 4),
+)
+
+# Las cámaras escriben la clase ("helmet") o la etiqueta ("Casco")
+_BITS = {}
+for _code, _name, _bit in ELEMENTOS:
+    _BITS[_code] = _BITS[_name.lower()] = _bit
+
+
+def mascara(missing):
+    """Máscara de bits de una lista de elementos o de un texto separado por comas"""
+    if isinstance(missing, str):
+        missing = re.split(r'\s*,\s*', missing)
+    mask = 0
+    for item in missing:
+        mask |= _BITS.get(item.strip().lower(), 0)
+    return mask
+
+
+def nombres(mask):
+    """Nombres de los elementos presentes en la máscara"""
+    return [name for _code, name, bit in ELEMENTOS if mask & bit]
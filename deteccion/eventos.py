@@ -0,0 +1,159 @@
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from collections import deque
+
+from django.utils.timezone import localtime
+
+logger = logging.getLogger(__name__)
+
+
+def datos_alerta(alerta):
+    """Datos de una alerta para los eventos, con el formato de latest_alerts"""
+    missing_elements = alerta.missing_items()
+    return {
+        'id': alerta.pk,
+        'message': alerta.message,
+        'missing_elements': missing_elements,
+        'timestamp': localtime(alerta.timestamp).strftime("%H:%M:%S %d-%m-%Y"),
+        'ts': alerta.timestamp.timestamp(),
+        'video': alerta.video.url if alerta.video else None,
+        'clip': alerta.clip.url if alerta.clip else None,
+        'level': alerta.level,
+        'element_count': len(missing_elements),
+        'camera': alerta.camera,
+        'frame_count': alerta.frame_count,
+        'open': alerta.closed_at is None,
+        'resolved': alerta.resolved,
+        'resolution_status': alerta.resolution_status or 'pending',
+    }
+
+
+class BusAlertas:
+    """
+    Publicación en proceso de los cambios de alertas (creada, actualizada,
+    resuelta) para los clientes SSE.
+
+    Los publicadores son hilos (AlertSink, vistas síncronas); los
+    suscriptores son corrutinas que esperan en su propio event loop, así que
+    `publicar()` los despierta con call_soon_threadsafe. Se guardan los
+    últimos `history` eventos para que un cliente que se reconecta con
+    Last-Event-ID reciba lo que se perdió. Los ids llevan un prefijo
+    distinto en cada arranque: un id de otro arranque no se puede reanudar.
+
+    También admite suscriptores síncronos (`suscribir`), que se llaman en el
+    hilo que publica.
+    """
+
+    def __init__(self, history=500):
+        self.boot = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._eventos = deque(maxlen=history)  # (seq, tipo, datos)
+        self._esperando = set()  # (loop, asyncio.Event)
+        self._suscriptores = []
+
+    def suscribir(self, callback):
+        """`callback(tipo, datos)` se llama con cada evento publicado"""
+        with self._lock:
+            self._suscriptores.append(callback)
+
+    def publicar(self, tipo, datos):
+        with self._lock:
+            self._seq += 1
+            self._eventos.append((self._seq, tipo, datos))
+            esperando = list(self._esperando)
+            suscriptores = list(self._suscriptores)
+        for callback in suscriptores:
+            try:
+                callback(tipo, datos)
+            except Exception as e:
+                logger.error(f"Error en un suscriptor de alertas: {e}")
+        for loop, evento in esperando:
+            try:
+                loop.call_soon_threadsafe(evento.set)
+            except RuntimeError:
+                # El loop del cliente ya se cerró
+                pass
+
+    def ultimo(self):
+        with self._lock:
+            return self._seq
+
+    def id_evento(self, seq):
+        return f"{self.boot}-{seq}"
+
+    def posicion(self, last_event_id):
+        """
+        Secuencia desde la que reanudar a partir de un Last-Event-ID, o None
+        si no se puede (otro arranque o eventos ya descartados del historial).
+        """
+        boot, _, seq = (last_event_id or '').partition('-')
+        if boot != self.boot or not seq.isdigit():
+            return None
+        seq = int(seq)
+        with self._lock:
+            primero = self._eventos[0][0] if self._eventos else self._seq + 1
+            if seq > self._seq or seq < primero - 1:
+                return None
+        return seq
+
+    def desde(self, seq):
+        with self._lock:
+            return [evento for evento in self._eventos if evento[0] > seq]
+
+    async def esperar(self, seq, timeout=15):
+        """Eventos posteriores a `seq`; espera hasta `timeout` segundos si no hay"""
+        eventos = self.desde(seq)
+        if eventos:
+            return eventos
+        clave = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._esperando.add(clave)
+        try:
+            # Un publicar() entre desde() y el registro no se pierde
+            eventos = self.desde(seq)
+            if not eventos:
+                try:
+                    await asyncio.wait_for(clave[1].wait(), timeout)
+                except asyncio.TimeoutError:
+                    return []
+                eventos = self.desde(seq)
+            return eventos
+        finally:
+            with self._lock:
+                self._esperando.discard(clave)
+
+    async def flujo(self, last_event_id=None, keepalive=15):
+        """Generador SSE; empieza en el evento siguiente a `last_event_id` o en el actual"""
+        seq = self.posicion(last_event_id) if last_event_id else None
+        yield 'retry: 3000\n\n'
+        if seq is None:
+            if last_event_id:
+                # No se puede reanudar: el cliente debe recargar la lista completa
+                yield f"id: {self.id_evento(self.ultimo())}\nevent: reset\ndata: {{}}\n\n"
+            seq = self.ultimo()
+        while True:
+            eventos = await self.esperar(seq, timeout=keepalive)
+            if not eventos:
+                yield ': keepalive\n\n'
+                continue
+            for seq, tipo, datos in eventos:
+                data = json.dumps(datos, separators=(',', ':'))
+                yield f"id: {self.id_evento(seq)}\nevent: {tipo}\ndata: {data}\n\n"
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def obtener_bus():
+    """BusAlertas compartido del proceso, configurado desde settings"""
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            from django.conf import settings
+            _bus = BusAlertas(history=getattr(settings, 'ALERTAS_EVENTOS_HISTORIAL', 500))
+        return _bus
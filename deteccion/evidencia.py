@@ -0,0 +1,145 @@
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from .grabacion import BackendError, BufferPreRoll, OpenCVBackend
+
+logger = logging.getLogger(__name__)
+
+
+class GrabadorClips:
+    """
+    Clips cortos de evidencia por alerta.
+
+    Mantiene en memoria los últimos `before_seconds` segundos de video. Al
+    pedir un clip se toma una copia de ese buffer y se siguen agregando
+    frames hasta `after_seconds` después de la alerta. La apertura, la
+    codificación y el cierre ocurren en un hilo propio: `solicitar()` sólo
+    arma el nombre del archivo y lo devuelve (relativo a `base_dir`) para
+    guardarlo en la alerta. Si el codificador no logra abrirlo lo registra
+    en el log y el nombre queda sin archivo.
+
+    Con la cola llena se descartan frames; la apertura y el cierre de un
+    clip esperan lugar como mucho `control_timeout` segundos.
+    """
+
+    def __init__(self, directory='clips', backend_factory=OpenCVBackend, before_seconds=3,
+                 after_seconds=5, base_dir=None, queue_size=256, max_active=4, control_timeout=1.0):
+        self.directory = directory
+        self.base_dir = base_dir
+        self.backend_factory = backend_factory
+        self.after_seconds = after_seconds
+        self.max_active = max_active
+        self.control_timeout = control_timeout
+        self.buffer = BufferPreRoll(before_seconds)
+        self.dropped = 0
+
+        self._activos = {}  # id del clip -> instante en que termina
+        self._ids = itertools.count(1)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # --- Hilo de la cámara -------------------------------------------------
+
+    def _put(self, item):
+        """Encola un frame; si la cola está llena se descarta"""
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _control(self, item):
+        """Encola una apertura o un cierre esperando lugar; False si no lo hubo"""
+        try:
+            self._queue.put(item, timeout=self.control_timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def submit(self, frame, timestamp=None):
+        """Agrega un frame al buffer y a los clips en curso"""
+        now = timestamp if timestamp is not None else time.time()
+        self.buffer.append(frame, now)
+        for clip_id, fin in list(self._activos.items()):
+            self._put(('frame', clip_id, frame, now))
+            if now >= fin:
+                del self._activos[clip_id]
+                if not self._control(('close', clip_id)):
+                    # Queda abierto hasta close(); no se bloquea la cámara
+                    logger.warning(f"Cola de clips llena, no se pudo cerrar el clip {clip_id}")
+
+    def solicitar(self, timestamp=None):
+        """
+        Inicia un clip alrededor de `timestamp`; devuelve su nombre, o '' si
+        no hay frames, ya hay `max_active` clips o no se pudo encolar.
+        """
+        now = timestamp if timestamp is not None else time.time()
+        previos = self.buffer.snapshot()
+        if not previos or len(self._activos) >= self.max_active:
+            return ''
+
+        backend = self.backend_factory()
+        moment = datetime.fromtimestamp(now)
+        day_dir = os.path.join(self.directory, moment.strftime('%Y%m%d'))
+        clip_id = next(self._ids)
+        path = os.path.join(day_dir, f"clip_{moment.strftime('%Y%m%d_%H%M%S')}_{clip_id}{backend.extension}")
+        height, width = previos[-1][1].shape[:2]
+
+        if not self._control(('open', clip_id, backend, path, width, height)):
+            logger.warning(f"Cola de clips llena, se descarta {path}")
+            return ''
+        for ts, frame in previos:
+            self._put(('frame', clip_id, frame, ts))
+        self._activos[clip_id] = now + self.after_seconds
+
+        filename = os.path.relpath(path, self.base_dir) if self.base_dir else path
+        return filename.replace('\\', '/')
+
+    def close(self, timeout=10):
+        """Cierra los clips en curso y espera a que el hilo termine"""
+        for clip_id in list(self._activos):
+            self._control(('close', clip_id))
+        self._activos.clear()
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.error("El codificador de clips no responde")
+            return
+        self._thread.join(timeout)
+
+    # --- Hilo codificador --------------------------------------------------
+
+    def _run(self):
+        backends = {}
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                if item[0] == 'open':
+                    clip_id, backend, path, width, height = item[1:]
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if backend.open(path, width, height):
+                        backends[clip_id] = backend
+                    else:
+                        logger.error(f"No se pudo abrir el clip {path}")
+                elif item[0] == 'frame':
+                    backend = backends.get(item[1])
+                    if backend is not None:
+                        backend.write(item[2], item[3])
+                elif item[0] == 'close':
+                    backend = backends.pop(item[1], None)
+                    if backend is not None:
+                        backend.close()
+            except BackendError as e:
+                logger.error(f"Se abandona el clip {item[1]}: {e}")
+                backends.pop(item[1]).close()
+            except Exception as e:
+                logger.error(f"Error en el codificador de clips: {e}")
+        for backend in backends.values():
+            backend.close()
@@ -0,0 +1,241 @@
+import csv
+import io
+import queue
+import threading
+from datetime import date, datetime, timedelta
+
+from django.utils import timezone
+
+from . import epp
+
+# Columnas exportadas: (nombre, campo de values_list)
+COLUMNAS = (
+    ('id', 'id'),
+    ('timestamp', 'timestamp'),
+    ('camera', 'camera'),
+    ('level', 'level'),
+    ('resolution_status', 'resolution_status'),
+    ('resolved', 'resolved'),
+    ('missing', 'missing_mask'),
+    ('missing_mask', 'missing_mask'),
+    ('message', 'message'),
+    ('frame_count', 'frame_count'),
+    ('confidence', 'confidence'),
+    ('resolved_at', 'resolved_at'),
+    ('resolved_by', 'resolved_by__username'),
+)
+CAMPOS = tuple(dict.fromkeys(campo for _, campo in COLUMNAS))
+FORMATOS = ('csv', 'parquet')
+
+
+def filtros(desde=None, hasta=None, level=None, status=None, item=None, camera=None):
+    """
+    Valida los filtros recibidos como texto (fechas AAAA-MM-DD) y los
+    devuelve como argumentos de `filtrar`. Lanza ValueError si alguno no vale.
+    """
+    from .models import Alert, PPEItem
+
+    resultado = {}
+    for nombre, valor in (('desde', desde), ('hasta', hasta)):
+        if valor:
+            try:
+                resultado[nombre] = date.fromisoformat(valor)
+            except ValueError:
+                raise ValueError(f"Fecha inválida: {valor}")
+    if level:
+        if level not in dict(Alert.LEVEL_CHOICES):
+            raise ValueError(f"Nivel inválido: {level}")
+        resultado['level'] = level
+    if status:
+        if status not in dict(Alert.RESOLUTION_CHOICES):
+            raise ValueError(f"Estado inválido: {status}")
+        resultado['status'] = status
+    if item:
+        if not PPEItem.objects.filter(code=item).exists():
+            raise ValueError(f"Elemento desconocido: {item}")
+        resultado['item'] = item
+    if camera:
+        resultado['camera'] = camera
+    return resultado
+
+
+def filtrar(alertas, desde=None, hasta=None, level=None, status=None, item=None, camera=None):
+    """
+    Aplica los filtros de exportación a un queryset de Alert o AlertArchive.
+    `desde` y `hasta` son fechas locales (hasta incluida); `item` es el código
+    de un PPEItem. Lanza ValueError si el elemento no existe.
+    """
+    from django.db.models import F
+    from .models import PPEItem
+
+    if desde:
+        alertas = alertas.filter(timestamp__gte=timezone.make_aware(datetime.combine(desde, datetime.min.time())))
+    if hasta:
+        fin = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+        alertas = alertas.filter(timestamp__lt=fin)
+    if level:
+        alertas = alertas.filter(level=level)
+    if status:
+        alertas = alertas.filter(resolution_status=status)
+    if camera:
+        alertas = alertas.filter(camera=camera)
+    if item:
+        bit = PPEItem.objects.filter(code=item).values_list('bit', flat=True).first()
+        if bit is None:
+            raise ValueError(f"Elemento desconocido: {item}")
+        alertas = alertas.alias(item_bit=F('missing_mask').bitand(bit)).filter(item_bit=bit)
+    return alertas
+
+
+def lotes(chunk_size=5000, **filtros):
+    """
+    Tuplas de valores (CAMPOS) de las alertas filtradas, en listas de hasta
+    `chunk_size`: primero el archivo y luego la tabla de alertas, cada una
+    por fecha. Se leen con un cursor, sin cargar todo en memoria.
+    """
+    from .models import Alert, AlertArchive
+
+    for modelo in (AlertArchive, Alert):
+        alertas = filtrar(modelo.objects.all(), **filtros).order_by('timestamp')
+        lote = []
+        for fila in alertas.values_list(*CAMPOS).iterator(chunk_size=chunk_size):
+            lote.append(fila)
+            if len(lote) >= chunk_size:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+
+def _convertidor():
+    """Función que pasa una tupla de CAMPOS a las columnas exportadas"""
+    posiciones = [CAMPOS.index(campo) for _, campo in COLUMNAS]
+    faltantes = COLUMNAS.index(('missing', 'missing_mask'))
+    nombres = {}  # missing_mask -> texto, hay pocas combinaciones
+
+    def convertir(fila):
+        valores = [fila[i] for i in posiciones]
+        mask = valores[faltantes]
+        if mask not in nombres:
+            nombres[mask] = ', '.join(epp.nombres(mask))
+        valores[faltantes] = nombres[mask]
+        return valores
+    return convertir
+
+
+def _csv_bloques(chunk_size, filtros):
+    """(texto CSV, número de filas) por cada lote; el primero lleva la cabecera"""
+    convertir = _convertidor()
+    fechas = [i for i, (nombre, _) in enumerate(COLUMNAS) if nombre in ('timestamp', 'resolved_at')]
+    zona = timezone.get_current_timezone()  # localtime() la busca en cada llamada
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([nombre for nombre, _ in COLUMNAS])
+    for lote in lotes(chunk_size, **filtros):
+        for fila in lote:
+            valores = convertir(fila)
+            for i in fechas:
+                if valores[i] is not None:
+                    valores[i] = valores[i].astimezone(zona).isoformat(timespec='seconds')
+            writer.writerow(valores)
+        yield buffer.getvalue(), len(lote)
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Sin filas: sólo la cabecera
+        yield buffer.getvalue(), 0
+
+
+def csv_filas(chunk_size=5000, **filtros):
+    """Texto CSV por bloques (cabecera incluida), para StreamingHttpResponse"""
+    for texto, _ in _csv_bloques(chunk_size, filtros):
+        yield texto
+
+
+def escribir_csv(destino, chunk_size=50000, **filtros):
+    """Escribe las alertas filtradas en el archivo de texto `destino`; devuelve el número de filas"""
+    total = 0
+    for texto, filas in _csv_bloques(chunk_size, filtros):
+        destino.write(texto)
+        total += filas
+    return total
+
+
+def esquema_parquet():
+    import polars as pl
+
+    fecha = pl.Datetime('us', time_zone='UTC')
+    return {
+        'id': pl.Int64,
+        'timestamp': fecha,
+        'camera': pl.Utf8,
+        'level': pl.Utf8,
+        'resolution_status': pl.Utf8,
+        'resolved': pl.Boolean,
+        'missing': pl.Utf8,
+        'missing_mask': pl.Int64,
+        'message': pl.Utf8,
+        'frame_count': pl.Int64,
+        'confidence': pl.Float64,
+        'resolved_at': fecha,
+        'resolved_by': pl.Utf8,
+    }
+
+
+def escribir_parquet(destino, chunk_size=50000, **filtros):
+    """
+    Escribe las alertas filtradas en Parquet (`destino` es una ruta o un
+    archivo binario) con polars, en modo streaming: cada lote leído de la
+    base es un row group y nunca hay más de dos en memoria.
+
+    polars lee la fuente desde sus propios hilos, que no deben usar las
+    conexiones de Django; por eso la escritura va en un hilo aparte y este
+    hilo le pasa los lotes por una cola acotada. Devuelve el número de filas.
+    """
+    import polars as pl
+    from polars.io.plugins import register_io_source
+
+    esquema = esquema_parquet()
+    cola = queue.Queue(maxsize=2)
+    errores = []
+
+    def fuente(with_columns, predicate, n_rows, batch_size):
+        while True:
+            df = cola.get()
+            if df is None:
+                return
+            yield df
+
+    def escribir():
+        try:
+            register_io_source(io_source=fuente, schema=esquema).sink_parquet(destino)
+        except Exception as e:
+            errores.append(e)
+
+    hilo = threading.Thread(target=escribir, daemon=True)
+    hilo.start()
+    convertir = _convertidor()
+    total = 0
+    try:
+        for lote in lotes(chunk_size, **filtros):
+            df = pl.DataFrame([convertir(fila) for fila in lote], schema=esquema, orient='row')
+            while hilo.is_alive():
+                try:
+                    cola.put(df, timeout=1)
+                    break
+                except queue.Full:
+                    pass
+            if not hilo.is_alive():
+                break
+            total += len(lote)
+    finally:
+        while hilo.is_alive():
+            try:
+                cola.put(None, timeout=1)
+                break
+            except queue.Full:
+                pass
+        hilo.join()
+    if errores:
+        raise errores[0]
+    return total
@@ -0,0 +1,447 @@
+import collections
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+import cv2
+
+from .streaming import FFmpegPipe
+
+logger = logging.getLogger(__name__)
+
+
+class BufferPreRoll:
+    """Mantiene en memoria los frames de los últimos `seconds` segundos"""
+
+    def __init__(self, seconds=5, max_frames=300):
+        self.seconds = seconds
+        self._frames = collections.deque(maxlen=max_frames)
+
+    def append(self, frame, timestamp):
+        self._frames.append((timestamp, frame))
+        limite = timestamp - self.seconds
+        while self._frames and self._frames[0][0] < limite:
+            self._frames.popleft()
+
+    def snapshot(self):
+        """Copia de los frames acumulados sin vaciar el buffer"""
+        return list(self._frames)
+
+    def drain(self):
+        """Devuelve y vacía los frames acumulados, del más antiguo al más reciente"""
+        frames = list(self._frames)
+        self._frames.clear()
+        return frames
+
+    def __len__(self):
+        return len(self._frames)
+
+
+class BackendError(Exception):
+    """El codificador dejó de aceptar frames; el segmento se abandona"""
+
+
+class BaseBackend:
+    """
+    Interfaz de los codificadores de grabación.
+
+    Los frames llegan con su marca de tiempo de captura. Como un pipe de
+    video crudo no transporta marcas de tiempo, cada frame se coloca en la
+    base de tiempo `fps` según su instante real (repitiendo o descartando
+    frames), así la duración del archivo coincide con la de la captura
+    aunque la cámara entregue menos cuadros por segundo que los nominales.
+    """
+
+    extension = ''
+
+    def __init__(self, fps=15.0):
+        self.fps = fps
+        self.frames_written = 0
+        self._t0 = None
+
+    def open(self, path, width, height):
+        raise NotImplementedError
+
+    def _emit(self, frame):
+        raise NotImplementedError
+
+    def write(self, frame, timestamp):
+        if self._t0 is None:
+            self._t0 = timestamp
+        target = int(round((timestamp - self._t0) * self.fps)) + 1
+        while self.frames_written < target:
+            self._emit(frame)
+            self.frames_written += 1
+
+    def close(self):
+        raise NotImplementedError
+
+
+class OpenCVBackend(BaseBackend):
+    """Escritura con cv2.VideoWriter (XVID/AVI)"""
+
+    extension = '.avi'
+    codec = 'XVID'
+
+    def __init__(self, fps=15.0, fourcc='XVID'):
+        super().__init__(fps)
+        self.codec = fourcc
+        self._writer = None
+
+    def open(self, path, width, height):
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.codec), self.fps, (width, height))
+        return self._writer.isOpened()
+
+    def _emit(self, frame):
+        self._writer.write(frame)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+
+
+class FFmpegBackend(BaseBackend):
+    """
+    Codificación H.264 con un subproceso ffmpeg (libx264 multihilo).
+
+    Escribe MP4 fragmentado, que puede reproducirse mientras la grabación
+    sigue abierta y no queda inutilizable si el proceso se interrumpe.
+    """
+
+    extension = '.mp4'
+    codec = 'h264'
+
+    def __init__(self, fps=15.0, ffmpeg_bin='ffmpeg', preset='ultrafast', crf=26, threads=2,
+                 write_timeout=10.0):
+        super().__init__(fps)
+        self.ffmpeg_bin = ffmpeg_bin
+        self.preset = preset
+        self.crf = crf
+        self.threads = threads
+        self.write_timeout = write_timeout
+        self._pipe = None
+
+    def open(self, path, width, height):
+        output_args = [
+            '-c:v', 'libx264', '-preset', self.preset, '-crf', str(self.crf),
+            '-threads', str(self.threads),
+            '-pix_fmt', 'yuv420p',
+            '-g', str(int(self.fps * 2)),
+            '-movflags', '+frag_keyframe+empty_moov+default_base_moof',
+            '-f', 'mp4', path,
+        ]
+        try:
+            self._pipe = FFmpegPipe(
+                output_args, width, height,
+                ffmpeg_bin=self.ffmpeg_bin, wallclock=False, input_fps=self.fps,
+            )
+        except OSError as e:
+            logger.error(f"No se pudo iniciar ffmpeg: {e}")
+            return False
+        return True
+
+    def _emit(self, frame):
+        # Desde el hilo escritor: esperar en lugar de descartar, pero no más
+        # allá de `write_timeout` ni con ffmpeg ya terminado
+        if not self._pipe.write(frame, block=True, timeout=self.write_timeout):
+            if self._pipe.is_alive:
+                raise BackendError(f"ffmpeg no acepta frames desde hace {self.write_timeout} s")
+            raise BackendError(
+                f"ffmpeg terminó con código {self._pipe.returncode}: {self._pipe.stderr_tail or 'sin salida'}"
+            )
+
+    def close(self):
+        if self._pipe is not None:
+            self._pipe.close()
+            self._pipe = None
+
+
+def crear_backend_factory(nombre='ffmpeg', fps=15.0, ffmpeg_bin='ffmpeg', preset='ultrafast', crf=26, threads=2):
+    """
+    Devuelve una fábrica de backends de grabación. Si se pide ffmpeg y no está
+    instalado se usa cv2.VideoWriter.
+    """
+    if nombre == 'ffmpeg' and shutil.which(ffmpeg_bin):
+        return lambda: FFmpegBackend(fps=fps, ffmpeg_bin=ffmpeg_bin, preset=preset, crf=crf, threads=threads)
+    if nombre == 'ffmpeg':
+        logger.warning(f"{ffmpeg_bin} no encontrado, se graba con OpenCV")
+    return lambda: OpenCVBackend(fps=fps)
+
+
+def registrar_grabacion(info):
+    """Guarda en la base de datos un segmento cerrado (callback del hilo escritor)"""
+    from .models import Recording
+    Recording.objects.update_or_create(
+        file=info['filename'],
+        defaults={
+            'camera': info['camera'],
+            'started_at': datetime.fromtimestamp(info['started'], tz=timezone.utc),
+            'ended_at': datetime.fromtimestamp(info['ended'], tz=timezone.utc),
+            'duration': info['duration'],
+            'frame_count': info['frames'],
+            'codec': info['codec'],
+            'size': info['size'],
+            'timeline': info['timeline'],
+            'violation_seconds': sum(1 for v in info['timeline'][1::2] if v),
+        },
+    )
+
+
+class GrabadorAsincrono:
+    """
+    Grabación en segundo plano con pre-roll y post-roll.
+
+    El hilo de la cámara sólo llama a `submit()`, que encola el frame en una
+    cola acotada; la codificación y la escritura a disco ocurren en un hilo
+    propio. Mientras no se graba, los frames se guardan en un buffer
+    circular y se vuelcan al archivo cuando comienza la grabación, de modo
+    que se conservan los segundos previos al incidente. La grabación se
+    detiene `post_roll_seconds` después de la última detección.
+
+    Las grabaciones largas se dividen en segmentos de `segment_seconds` o
+    de `segment_max_bytes`, en subdirectorios por día
+    (`directory/AAAAMMDD/recording_HHMMSS.ext`). `current_filename` es
+    relativo a `base_dir` (MEDIA_ROOT) para poder guardarse en Alert.video.
+
+    Por cada segmento se arma una línea de tiempo de dos bytes por segundo
+    (personas, incumplimientos) que se entrega junto con los datos del
+    archivo a `on_segment_closed` cuando el hilo escritor lo cierra.
+
+    La apertura y el cierre de un segmento esperan lugar en la cola como
+    mucho `control_timeout` segundos; si no lo hay el grabador queda en
+    `failed` y no graba hasta que el escritor vacíe la cola.
+    """
+
+    def __init__(self, directory='grabaciones', backend_factory=OpenCVBackend,
+                 pre_roll_seconds=5, post_roll_seconds=5, queue_size=256,
+                 segment_seconds=300, segment_max_bytes=None, base_dir=None,
+                 camera=None, on_segment_closed=None, control_timeout=1.0):
+        self.directory = directory
+        self.base_dir = base_dir
+        self.camera = camera or os.path.basename(os.path.normpath(directory))
+        self.on_segment_closed = on_segment_closed
+        self.backend_factory = backend_factory
+        self.post_roll_seconds = post_roll_seconds
+        self.segment_seconds = segment_seconds
+        self.segment_max_bytes = segment_max_bytes
+        self.control_timeout = control_timeout
+        self.pre_roll = BufferPreRoll(pre_roll_seconds)
+        self.dropped = 0
+        self.failed = False
+
+        self.is_recording = False
+        self.current_filename = None
+        self.current_path = None
+        self.last_detection_time = None
+        self._segment_start = None
+        self._size_exceeded = False
+        self._timeline = bytearray()
+        self._timeline_t0 = None
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # --- Hilo de la cámara -------------------------------------------------
+
+    def _put(self, item):
+        """Encola un frame; si la cola está llena se descarta"""
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _control(self, item):
+        # open/close esperan lugar: sin ellos el segmento no se registra o
+        # los frames siguientes van al archivo equivocado. La espera es
+        # acotada porque ocurre en el hilo de la cámara.
+        try:
+            self._queue.put(item, timeout=self.control_timeout)
+            return True
+        except queue.Full:
+            self.failed = True
+            self.is_recording = False
+            logger.error(
+                f"Cola de grabación de {self.camera} llena durante {self.control_timeout} s; "
+                f"se suspende la grabación"
+            )
+            return False
+
+    def submit(self, frame, detected, timestamp=None, persons=0, violations=0):
+        """
+        Registra un frame; `detected` indica si hubo detecciones en él y
+        `persons`/`violations` alimentan la línea de tiempo del segmento.
+        """
+        now = timestamp if timestamp is not None else time.time()
+
+        if self.failed:
+            if not self._queue.empty():
+                return
+            self.failed = False
+            logger.info(f"Cola de grabación de {self.camera} vaciada, se reanuda la grabación")
+
+        if detected:
+            self.last_detection_time = now
+            if not self.is_recording:
+                self.start(frame, now)
+
+        if not self.is_recording:
+            self.pre_roll.append(frame, now)
+            return
+
+        # Rotación de segmento por duración o por tamaño
+        if now - self._segment_start >= self.segment_seconds or self._size_exceeded:
+            self.stop()
+            self.start(frame, now)
+            if not self.is_recording:
+                return
+
+        self._put(('frame', frame, now))
+        self._marcar(now, persons, violations)
+
+        # Post-roll: seguir grabando unos segundos tras la última detección
+        if now - self.last_detection_time > self.post_roll_seconds:
+            self.stop()
+
+    def _new_path(self, backend, timestamp):
+        moment = datetime.fromtimestamp(timestamp)
+        day_dir = os.path.join(self.directory, moment.strftime('%Y%m%d'))
+        os.makedirs(day_dir, exist_ok=True)
+        stamp = moment.strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(day_dir, f'recording_{stamp}{backend.extension}')
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(day_dir, f'recording_{stamp}_{suffix}{backend.extension}')
+            suffix += 1
+        return path
+
+    def _marcar(self, timestamp, persons, violations):
+        """Guarda el máximo de personas e incumplimientos del segundo"""
+        second = int(timestamp - self._timeline_t0)
+        if second < 0:
+            return
+        needed = (second + 1) * 2
+        if len(self._timeline) < needed:
+            self._timeline.extend(bytes(needed - len(self._timeline)))
+        i = second * 2
+        self._timeline[i] = max(self._timeline[i], min(persons, 255))
+        self._timeline[i + 1] = max(self._timeline[i + 1], min(violations, 255))
+
+    def start(self, frame, timestamp=None):
+        if self.is_recording:
+            return self.current_filename
+        if self.failed:
+            return None
+        timestamp = timestamp or time.time()
+        backend = self.backend_factory()
+        path = self._new_path(backend, timestamp)
+        filename = os.path.relpath(path, self.base_dir) if self.base_dir else path
+        height, width = frame.shape[:2]
+
+        self.current_path = path
+        self.current_filename = filename.replace('\\', '/')
+        self.is_recording = True
+        self._segment_start = timestamp
+        self._size_exceeded = False
+        buffered_frames = self.pre_roll.drain()
+        # La línea de tiempo empieza con el primer frame del pre-roll
+        self._timeline = bytearray()
+        self._timeline_t0 = buffered_frames[0][0] if buffered_frames else timestamp
+        # La apertura del archivo también ocurre en el hilo escritor
+        if not self._control(('open', backend, path, width, height)):
+            self.current_filename = self.current_path = None
+            return None
+        for ts, buffered in buffered_frames:
+            self._put(('frame', buffered, ts))
+        logger.info(f"Iniciando grabación: {filename}")
+        return filename
+
+    def stop(self):
+        if self.is_recording:
+            self.is_recording = False
+            self._control(('close', {
+                'camera': self.camera,
+                'filename': self.current_filename,
+                'timeline': bytes(self._timeline),
+            }))
+            logger.info("Grabación detenida")
+
+    def close(self, timeout=10):
+        """Detiene la grabación y espera a que el hilo escritor termine"""
+        self.stop()
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.error(f"El escritor de grabaciones de {self.camera} no responde")
+            return
+        self._thread.join(timeout)
+
+    # --- Hilo escritor -----------------------------------------------------
+
+    def _run(self):
+        backend = None
+        path = None
+        frames = 0
+        first_ts = last_ts = None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                if item[0] == 'open':
+                    if backend is not None:
+                        backend.close()
+                    backend, path, width, height = item[1:]
+                    frames = 0
+                    first_ts = last_ts = None
+                    if not backend.open(path, width, height):
+                        logger.error(f"No se pudo abrir {path} para escritura")
+                        backend = None
+                elif item[0] == 'frame':
+                    if backend is not None:
+                        backend.write(item[1], item[2])
+                        frames += 1
+                        if first_ts is None:
+                            first_ts = item[2]
+                        last_ts = item[2]
+                        # Revisar el tamaño cada cierto número de frames
+                        if self.segment_max_bytes and frames % 30 == 0:
+                            if os.path.exists(path) and os.path.getsize(path) >= self.segment_max_bytes:
+                                self._size_exceeded = True
+                elif item[0] == 'close':
+                    if backend is not None:
+                        backend.close()
+                        self._segment_closed(backend, path, first_ts, last_ts, item[1])
+                        backend = None
+            except BackendError as e:
+                # Los frames siguientes se ignoran hasta el próximo segmento
+                logger.error(f"Se abandona el segmento {path}: {e}")
+                backend.close()
+                backend = None
+            except Exception as e:
+                logger.error(f"Error en el escritor de grabaciones: {e}")
+        if backend is not None:
+            backend.close()
+
+    def _segment_closed(self, backend, path, first_ts, last_ts, info):
+        if self.on_segment_closed is None or first_ts is None or not os.path.exists(path):
+            return
+        info = dict(info)
+        info.update({
+            'path': path,
+            'started': first_ts,
+            'ended': last_ts,
+            'frames': backend.frames_written,
+            'duration': backend.frames_written / backend.fps,
+            'codec': backend.codec,
+            'size': os.path.getsize(path),
+        })
+        try:
+            self.on_segment_closed(info)
+        except Exception as e:
+            logger.error(f"No se pudo registrar la grabación {path}: {e}")
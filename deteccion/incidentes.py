@@ -0,0 +1,132 @@
+import time
+import uuid
+from datetime import datetime, timezone
+
+from .epp import mascara
+
+
+class GestorIncidentes:
+    """
+    Agrupa las detecciones de incumplimiento de una cámara en incidentes.
+
+    Un incidente se abre con la primera detección de EPP faltante, se
+    actualiza en el lugar mientras continúa (última vez visto, conjunto
+    máximo de elementos faltantes, frames y mejor captura) y se cierra
+    cuando pasan `quiet_seconds` sin verlo. Las escrituras pasan por el
+    AlertSink; las actualizaciones se envían cada `update_seconds` como
+    mucho, así que un incidente largo genera una sola fila.
+
+    Cada envío lleva la clave de deduplicación (cámara, zona, firma) y el
+    AlertSink, en su hilo, la reclama o renueva en su DedupStore: si otra
+    instancia ya tiene abierto un incidente con esa clave, éste se retoma
+    en lugar de crear una fila nueva. La clave no usa track ids aunque haya
+    seguimiento: se reinician con cada proceso y no reconocerían el mismo
+    incidente tras un reinicio, y el gestor lleva un solo incidente por cámara.
+    """
+
+    def __init__(self, sink, camera='', quiet_seconds=15, update_seconds=5, snapshot_dir='alertas', zona='*'):
+        self.sink = sink
+        self.camera = camera
+        self.quiet_seconds = quiet_seconds
+        self.update_seconds = update_seconds
+        self.snapshot_dir = snapshot_dir
+        self.zona = zona
+        self.actual = None
+
+    @staticmethod
+    def _fecha(timestamp):
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+    def _clave_dedup(self, incidente):
+        return (self.camera, self.zona, incidente['firma'], self.quiet_seconds, incidente['last_seen'])
+
+    def _campos(self, incidente):
+        faltantes = ', '.join(incidente['missing'])
+        return {
+            'message': f"Persona sin {faltantes}",
+            'missing': faltantes,
+            'missing_mask': mascara(incidente['missing']),
+            'last_seen': self._fecha(incidente['last_seen']),
+            'frame_count': incidente['frame_count'],
+            'confidence': incidente['confidence'],
+            'closed_at': None,
+        }
+
+    def observar(self, missing, timestamp=None, confidence=0.0, frame=None, al_abrir=None):
+        """
+        Registra un frame. `missing` es la lista de elementos faltantes (vacía
+        si no hay incumplimiento); `al_abrir` es una función que devuelve
+        campos adicionales de la alerta (video, clip...) y sólo se llama al
+        abrir un incidente. Devuelve True si se abrió un incidente nuevo (el
+        AlertSink puede retomar después uno abierto por otra instancia).
+        """
+        now = timestamp if timestamp is not None else time.time()
+        if not missing:
+            self._cerrar_si_inactivo(now)
+            return False
+
+        incidente = self.actual
+        if incidente is not None and now - incidente['last_seen'] > self.quiet_seconds:
+            self.cerrar()
+            incidente = None
+
+        if incidente is None:
+            key = uuid.uuid4().hex
+            snapshot_name = None
+            if frame is not None:
+                stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(now))
+                snapshot_name = f'{self.snapshot_dir}/incidente_{stamp}_{key[:8]}.jpg'
+            self.actual = {
+                'key': key,
+                'missing': list(missing),
+                'last_seen': now,
+                'frame_count': 1,
+                'confidence': confidence,
+                'snapshot_name': snapshot_name,
+                'best_frame': None,
+                'flushed': now,
+                'firma': ','.join(sorted(missing)),
+            }
+            campos = dict(self._campos(self.actual), level='high', camera=self.camera)
+            if al_abrir is not None:
+                campos.update(al_abrir())
+            self.sink.submit(campos, snapshot=frame, snapshot_name=snapshot_name, key=key,
+                             clave_dedup=self._clave_dedup(self.actual))
+            return True
+
+        incidente['last_seen'] = now
+        incidente['frame_count'] += 1
+        for item in missing:
+            if item not in incidente['missing']:
+                incidente['missing'].append(item)
+        if frame is not None and confidence > incidente['confidence']:
+            # Mejor captura: se reemplaza la imagen en la próxima actualización
+            incidente['confidence'] = confidence
+            incidente['best_frame'] = frame
+        if now - incidente['flushed'] >= self.update_seconds:
+            self._enviar(incidente)
+        return False
+
+    def _enviar(self, incidente, cerrar=False):
+        campos = self._campos(incidente)
+        if cerrar:
+            campos['closed_at'] = campos['last_seen']
+        self.sink.actualizar(
+            incidente['key'], campos,
+            snapshot=incidente['best_frame'],
+            snapshot_name=incidente['snapshot_name'] if incidente['best_frame'] is not None else None,
+            cerrar=cerrar,
+            clave_dedup=self._clave_dedup(incidente),
+        )
+        incidente['best_frame'] = None
+        incidente['flushed'] = incidente['last_seen']
+
+    def _cerrar_si_inactivo(self, now):
+        if self.actual is not None and now - self.actual['last_seen'] > self.quiet_seconds:
+            self.cerrar()
+
+    def cerrar(self):
+        """Cierra el incidente abierto (al vencer el periodo de silencio o al detener la cámara)"""
+        if self.actual is not None:
+            self._enviar(self.actual, cerrar=True)
+            self.actual = None
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from deteccion.archivo import archivables, archivar
+
+
+class Command(BaseCommand):
+    help = 'Mueve las alertas resueltas antiguas a la tabla de archivo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=settings.ALERTAS_ARCHIVAR_DIAS,
+                            help='Archivar las alertas resueltas con más de N días')
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Alertas movidas por transacción')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Mostrar cuántas se archivarían sin moverlas')
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1 or options['lote'] < 1:
+            raise CommandError('--dias y --lote deben ser mayores que cero')
+        antes = timezone.now() - timedelta(days=options['dias'])
+        if options['dry_run']:
+            self.stdout.write(f"Se archivarían {archivables(antes).count()} alertas")
+            return
+        archivadas = archivar(antes, batch_size=options['lote'])
+        self.stdout.write(f"Archivadas {archivadas} alertas")
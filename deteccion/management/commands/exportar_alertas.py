@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from deteccion import exportar
+
+
+class Command(BaseCommand):
+    help = 'Exporta las alertas (incluidas las archivadas) a CSV o Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help='Archivo de salida')
+        parser.add_argument('--formato', choices=exportar.FORMATOS,
+                            help='Por defecto según la extensión de la salida')
+        parser.add_argument('--desde', help='Primer día (AAAA-MM-DD)')
+        parser.add_argument('--hasta', help='Último día (AAAA-MM-DD), incluido')
+        parser.add_argument('--nivel', help='Nivel de la alerta (high, medium, low, positive)')
+        parser.add_argument('--estado', help='Estado de resolución')
+        parser.add_argument('--elemento', help='Código del elemento de EPP faltante')
+        parser.add_argument('--camara', help='Cámara')
+        parser.add_argument('--lote', type=int, default=50000, help='Filas leídas por lote')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or ('parquet' if options['salida'].endswith('.parquet') else 'csv')
+        try:
+            filtros = exportar.filtros(
+                desde=options['desde'],
+                hasta=options['hasta'],
+                level=options['nivel'],
+                status=options['estado'],
+                item=options['elemento'],
+                camera=options['camara'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if formato == 'parquet':
+            try:
+                total = exportar.escribir_parquet(options['salida'], chunk_size=options['lote'], **filtros)
+            except ImportError:
+                raise CommandError('La exportación a Parquet necesita polars')
+        else:
+            with open(options['salida'], 'w', newline='', encoding='utf-8') as f:
+                total = exportar.escribir_csv(f, chunk_size=options['lote'], **filtros)
+        self.stdout.write(f"Exportadas {total} alertas a {options['salida']}")
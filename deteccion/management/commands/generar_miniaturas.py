@@ -0,0 +1,89 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from deteccion.miniaturas import generar_miniaturas
+from deteccion.models import Recording
+
+
+def rutas_miniaturas(recording):
+    """Rutas relativas a MEDIA_ROOT del sprite y el póster de una grabación"""
+    base = os.path.splitext(recording.file.name)[0]
+    if base.startswith('grabaciones/'):
+        base = base[len('grabaciones/'):]
+    return f'miniaturas/{base}.sprite.jpg', f'miniaturas/{base}.poster.jpg'
+
+
+class Command(BaseCommand):
+    help = 'Genera sprites de miniaturas y pósters de las grabaciones que aún no los tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--segundos-por-miniatura', type=int, default=settings.MINIATURAS_INTERVALO_SECONDS,
+                            help='Una miniatura cada N segundos de video')
+        parser.add_argument('--limite', type=int, default=0,
+                            help='Procesar como máximo N grabaciones por pasada')
+        parser.add_argument('--forzar', action='store_true',
+                            help='Regenerar también las que ya tienen miniaturas o fallaron antes')
+        parser.add_argument('--intervalo', type=int, default=0,
+                            help='Repetir cada N segundos (modo daemon)')
+
+    def handle(self, *args, **options):
+        while True:
+            pendientes = Recording.objects.order_by('started_at')
+            if not options['forzar']:
+                pendientes = pendientes.filter(sprite='', sprite_failed_at__isnull=True)
+            if options['limite']:
+                pendientes = pendientes[:options['limite']]
+
+            generadas = 0
+            for recording in pendientes.iterator():
+                if self.procesar(recording, options['segundos_por_miniatura']):
+                    generadas += 1
+            self.stdout.write(f"Miniaturas generadas para {generadas} grabaciones")
+
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
+
+    def procesar(self, recording, intervalo):
+        video_path = os.path.join(settings.MEDIA_ROOT, recording.file.name)
+        if not os.path.exists(video_path):
+            self.stderr.write(f"No existe {video_path}")
+            self._fallida(recording)
+            return False
+
+        sprite, poster = rutas_miniaturas(recording)
+        rangos = recording.violation_ranges()
+        count = generar_miniaturas(
+            video_path,
+            os.path.join(settings.MEDIA_ROOT, sprite),
+            os.path.join(settings.MEDIA_ROOT, poster),
+            interval=intervalo,
+            thumb_width=settings.MINIATURAS_ANCHO,
+            columns=settings.MINIATURAS_COLUMNAS,
+            poster_second=rangos[0][0] if rangos else 0,
+            ffmpeg_bin=settings.FFMPEG_BIN,
+        )
+        if not count:
+            self.stderr.write(f"No se pudo leer {video_path}")
+            self._fallida(recording)
+            return False
+
+        # Se marca al final: si el proceso se interrumpe, la grabación se
+        # vuelve a procesar en la siguiente pasada
+        Recording.objects.filter(pk=recording.pk).update(
+            sprite=sprite,
+            poster=poster,
+            sprite_interval=intervalo,
+            sprite_columns=min(settings.MINIATURAS_COLUMNAS, count),
+            sprite_count=count,
+            sprite_failed_at=None,
+        )
+        return True
+
+    def _fallida(self, recording):
+        # Sin marca, una grabación que no se puede leer se reintentaría en cada pasada
+        Recording.objects.filter(pk=recording.pk).update(sprite_failed_at=timezone.now())
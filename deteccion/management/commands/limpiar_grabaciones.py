@@ -0,0 +1,83 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from deteccion.models import Alert, Recording
+from deteccion.retencion import aplicar_retencion
+
+MB = 1024 * 1024
+
+
+def rutas_protegidas(campo='video', prefijo='grabaciones/'):
+    """Grabaciones (o clips) enlazadas desde alertas sin resolver"""
+    rutas = set()
+    nombres = Alert.objects.filter(
+        resolved=False, **{f'{campo}__startswith': prefijo}
+    ).values_list(campo, flat=True).iterator()
+    for nombre in nombres:
+        rutas.add(os.path.join(settings.MEDIA_ROOT, nombre))
+        # Grabaciones antiguas se guardaban relativas al directorio del proyecto
+        rutas.add(os.path.join(settings.BASE_DIR, nombre))
+    return rutas
+
+
+class Command(BaseCommand):
+    help = 'Aplica las cuotas de disco a las grabaciones y los clips, borrando primero los más antiguos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quota-camara-mb', type=int, default=settings.GRABACIONES_QUOTA_CAMARA_MB,
+                            help='Cuota por cámara en MB')
+        parser.add_argument('--quota-global-mb', type=int, default=settings.GRABACIONES_QUOTA_GLOBAL_MB,
+                            help='Cuota total en MB')
+        parser.add_argument('--quota-clips-camara-mb', type=int, default=settings.CLIPS_QUOTA_CAMARA_MB,
+                            help='Cuota de clips por cámara en MB')
+        parser.add_argument('--quota-clips-global-mb', type=int, default=settings.CLIPS_QUOTA_GLOBAL_MB,
+                            help='Cuota total de clips en MB')
+        parser.add_argument('--intervalo', type=int, default=0,
+                            help='Repetir cada N segundos (modo daemon)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Mostrar qué se borraría sin borrar')
+
+    def handle(self, *args, **options):
+        while True:
+            eliminados = aplicar_retencion(
+                settings.GRABACIONES_DIR,
+                quota_camara=options['quota_camara_mb'] * MB if options['quota_camara_mb'] else None,
+                quota_global=options['quota_global_mb'] * MB if options['quota_global_mb'] else None,
+                protegidos=rutas_protegidas(),
+                dry_run=options['dry_run'],
+            )
+            if eliminados and not options['dry_run']:
+                # Quitar del índice de grabaciones los archivos borrados
+                nombres = [
+                    os.path.relpath(a['path'], settings.MEDIA_ROOT).replace(os.sep, '/')
+                    for a in eliminados
+                ]
+                recordings = Recording.objects.filter(file__in=nombres)
+                for recording in recordings:
+                    # Miniaturas de la grabación borrada
+                    if recording.sprite:
+                        recording.sprite.delete(save=False)
+                    if recording.poster:
+                        recording.poster.delete(save=False)
+                recordings.delete()
+            liberado = sum(a['size'] for a in eliminados)
+            accion = 'Se borrarían' if options['dry_run'] else 'Borradas'
+            self.stdout.write(f"{accion} {len(eliminados)} grabaciones ({liberado / MB:.1f} MB)")
+
+            clips = aplicar_retencion(
+                settings.CLIPS_DIR,
+                quota_camara=options['quota_clips_camara_mb'] * MB if options['quota_clips_camara_mb'] else None,
+                quota_global=options['quota_clips_global_mb'] * MB if options['quota_clips_global_mb'] else None,
+                protegidos=rutas_protegidas('clip', 'clips/'),
+                dry_run=options['dry_run'],
+            )
+            liberado = sum(a['size'] for a in clips)
+            accion = 'Se borrarían' if options['dry_run'] else 'Borrados'
+            self.stdout.write(f"{accion} {len(clips)} clips ({liberado / MB:.1f} MB)")
+
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
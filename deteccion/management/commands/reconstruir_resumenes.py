@@ -0,0 +1,27 @@
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from deteccion.resumenes import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los resúmenes horarios de alertas desde las alertas y el archivo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Primer día a recalcular (AAAA-MM-DD); por defecto todo')
+        parser.add_argument('--hasta', help='Último día a recalcular (AAAA-MM-DD), incluido')
+
+    def _inicio_dia(self, valor):
+        try:
+            dia = date.fromisoformat(valor)
+        except ValueError:
+            raise CommandError(f"Fecha inválida: {valor}")
+        return timezone.make_aware(datetime.combine(dia, datetime.min.time()))
+
+    def handle(self, *args, **options):
+        desde = self._inicio_dia(options['desde']) if options['desde'] else None
+        hasta = self._inicio_dia(options['hasta']) + timedelta(days=1) if options['hasta'] else None
+        creadas = reconstruir(desde, hasta)
+        self.stdout.write(f"Resúmenes recalculados: {creadas} filas")
@@ -0,0 +1,156 @@
+import argparse
+import os
+import shutil
+import subprocess
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from deteccion.models import Alert, AlertArchive, AlertVersion, Recording
+from deteccion.recientes import obtener_recientes
+from deteccion.transcodificacion import compactar_timeline, tramos_con_personas, transcodificar, verificar
+
+
+class Command(BaseCommand):
+    help = 'Recodifica a calidad de archivo las grabaciones cerradas, de la más antigua a la más nueva'
+
+    def add_arguments(self, parser):
+        # --no-descartar-sin-personas anula el valor de settings
+        parser.add_argument('--descartar-sin-personas', action=argparse.BooleanOptionalAction,
+                            default=settings.TRANSCODIFICACION_DESCARTAR_SIN_PERSONAS,
+                            help='Eliminar los tramos sin personas según la línea de tiempo')
+        parser.add_argument('--min-edad-minutos', type=int, default=settings.TRANSCODIFICACION_MIN_EDAD_MINUTOS,
+                            help='Sólo grabaciones cerradas hace al menos N minutos')
+        parser.add_argument('--limite', type=int, default=0,
+                            help='Procesar como máximo N grabaciones por pasada')
+        parser.add_argument('--intervalo', type=int, default=0,
+                            help='Repetir cada N segundos (modo daemon)')
+
+    def handle(self, *args, **options):
+        for binario in (settings.FFMPEG_BIN, settings.FFPROBE_BIN):
+            if not shutil.which(binario):
+                raise CommandError(f"{binario} no está instalado")
+
+        while True:
+            limite = timezone.now() - timedelta(minutes=options['min_edad_minutos'])
+            pendientes = Recording.objects.filter(
+                transcoded_at__isnull=True, ended_at__lte=limite
+            ).order_by('started_at')
+            if options['limite']:
+                pendientes = pendientes[:options['limite']]
+
+            ahorro = 0
+            procesadas = 0
+            for recording in pendientes.iterator():
+                liberado = self.procesar(recording, options['descartar_sin_personas'])
+                if liberado is not None:
+                    procesadas += 1
+                    ahorro += liberado
+            self.stdout.write(f"Recodificadas {procesadas} grabaciones ({ahorro / (1024 * 1024):.1f} MB liberados)")
+
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
+
+    def procesar(self, recording, descartar_sin_personas):
+        """Recodifica una grabación; devuelve los bytes liberados o None si falló"""
+        src = os.path.join(settings.MEDIA_ROOT, recording.file.name)
+        if not os.path.exists(src):
+            self.stderr.write(f"No existe {src}")
+            return None
+
+        nuevo_nombre = os.path.splitext(recording.file.name)[0] + '.mp4'
+        dst = os.path.join(settings.MEDIA_ROOT, nuevo_nombre)
+        # Temporal en el mismo directorio para que os.replace sea atómico
+        tmp = os.path.join(os.path.dirname(src), f'.{os.path.basename(dst)}.tmp')
+
+        total_segundos = len(recording.timeline) // 2
+        tramos = None
+        if descartar_sin_personas and total_segundos:
+            tramos = tramos_con_personas(recording.timeline)
+            # Sin personas en ningún segundo, o en todos: no hay nada que recortar
+            if not tramos or tramos == [(0, total_segundos)]:
+                tramos = None
+        esperado = sum(end - start for start, end in tramos) if tramos else recording.duration
+
+        try:
+            transcodificar(
+                src, tmp,
+                fps=settings.TRANSCODIFICACION_FPS,
+                preset=settings.TRANSCODIFICACION_PRESET,
+                crf=settings.TRANSCODIFICACION_CRF,
+                threads=settings.TRANSCODIFICACION_THREADS,
+                tramos=tramos,
+                ffmpeg_bin=settings.FFMPEG_BIN,
+                nice=settings.TRANSCODIFICACION_NICE,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.stderr.write(f"Error al recodificar {src}: {e}")
+            self._borrar(tmp)
+            return None
+
+        if not verificar(tmp, esperado, ffprobe_bin=settings.FFPROBE_BIN):
+            self.stderr.write(f"La salida de {src} no pasó la verificación, se conserva el original")
+            self._borrar(tmp)
+            return None
+
+        original = os.path.getsize(src)
+        size = os.path.getsize(tmp)
+        if size >= original and not tramos:
+            # Ya estaba comprimida: se marca para no volver a intentarlo
+            self._borrar(tmp)
+            Recording.objects.filter(pk=recording.pk).update(transcoded_at=timezone.now())
+            return 0
+
+        os.replace(tmp, dst)
+        campos = {
+            'file': nuevo_nombre,
+            'codec': 'h264',
+            'size': size,
+            'transcoded_at': timezone.now(),
+            # Archivo nuevo: las miniaturas pueden volver a intentarse
+            'sprite_failed_at': None,
+        }
+        if tramos:
+            timeline = compactar_timeline(recording.timeline, tramos)
+            campos.update({
+                'timeline': timeline,
+                'violation_seconds': sum(1 for v in timeline[1::2] if v),
+                'duration': esperado,
+                'frame_count': int(esperado * settings.TRANSCODIFICACION_FPS),
+                # Las miniaturas ya no coinciden con los tiempos del video
+                'sprite': '',
+                'poster': '',
+                'sprite_count': 0,
+            })
+        with transaction.atomic():
+            Recording.objects.filter(pk=recording.pk).update(**campos)
+            if nuevo_nombre != recording.file.name:
+                enlazadas = Alert.objects.filter(video=recording.file.name).update(video=nuevo_nombre)
+                enlazadas += AlertArchive.objects.filter(video=recording.file.name).update(video=nuevo_nombre)
+                if enlazadas:
+                    # Las listas y la caché de recientes todavía apuntan al .avi
+                    transaction.on_commit(self._alertas_cambiadas)
+
+        if dst != src:
+            self._borrar(src)
+        if tramos:
+            for campo in (recording.sprite, recording.poster):
+                if campo:
+                    campo.delete(save=False)
+        return original - size
+
+    @staticmethod
+    def _alertas_cambiadas():
+        AlertVersion.bump()
+        obtener_recientes().invalidar()
+
+    def _borrar(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0004_capacitacion_evaluacion_certificado_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recording',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('camera', models.CharField(db_index=True, max_length=50, verbose_name='Cámara')),
+                ('file', models.FileField(max_length=255, unique=True, upload_to='grabaciones/', verbose_name='Archivo')),
+                ('started_at', models.DateTimeField(db_index=True, verbose_name='Inicio')),
+                ('ended_at', models.DateTimeField(verbose_name='Fin')),
+                ('duration', models.FloatField(default=0, verbose_name='Duración (s)')),
+                ('frame_count', models.PositiveIntegerField(default=0, verbose_name='Frames')),
+                ('codec', models.CharField(blank=True, max_length=20, verbose_name='Códec')),
+                ('size', models.PositiveBigIntegerField(default=0, verbose_name='Tamaño (bytes)')),
+                ('timeline', models.BinaryField(blank=True, default=bytes, verbose_name='Línea de tiempo')),
+                ('violation_seconds', models.PositiveIntegerField(default=0, verbose_name='Segundos con incumplimiento')),
+            ],
+            options={
+                'verbose_name': 'Grabación',
+                'verbose_name_plural': 'Grabaciones',
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
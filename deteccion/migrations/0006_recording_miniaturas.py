@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0005_recording'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recording',
+            name='poster',
+            field=models.FileField(blank=True, max_length=255, upload_to='miniaturas/', verbose_name='Póster'),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='sprite',
+            field=models.FileField(blank=True, max_length=255, upload_to='miniaturas/', verbose_name='Sprite'),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='sprite_columns',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Columnas del sprite'),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='sprite_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Miniaturas del sprite'),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='sprite_interval',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Intervalo del sprite (s)'),
+        ),
+    ]
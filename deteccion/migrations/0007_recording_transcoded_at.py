@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0006_recording_miniaturas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recording',
+            name='transcoded_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Recodificada'),
+        ),
+    ]
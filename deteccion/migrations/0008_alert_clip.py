@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0007_recording_transcoded_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='clip',
+            field=models.FileField(blank=True, max_length=255, upload_to='clips/'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:21
+
+from django.db import migrations, models
+
+
+def cerrar_alertas_existentes(apps, schema_editor):
+    # Las alertas anteriores eran eventos puntuales: se marcan como cerradas
+    Alert = apps.get_model('deteccion', 'Alert')
+    Alert.objects.filter(closed_at__isnull=True).update(
+        last_seen=models.F('timestamp'), closed_at=models.F('timestamp')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0008_alert_clip'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='camera',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='confidence',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='frame_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(cerrar_alertas_existentes, migrations.RunPython.noop),
+    ]
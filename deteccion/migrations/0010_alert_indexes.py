@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0009_alert_incidente'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['timestamp', 'resolved', 'resolution_status'], name='alert_ts_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(condition=models.Q(('resolution_status', 'non_compliant')), fields=['missing'], name='alert_noncompliant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(condition=models.Q(('closed_at__isnull', True)), fields=['camera', 'last_seen'], name='alert_open_idx'),
+        ),
+    ]
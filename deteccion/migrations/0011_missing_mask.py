@@ -0,0 +1,71 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:27
+
+import re
+
+from django.db import migrations, models
+
+ELEMENTOS = (
+    ('helmet', 'Casco', 1),
+    ('vest', 'Chaleco', 2),
+    ('boots', 'Botas', 4),
+)
+
+
+def cargar_elementos(apps, schema_editor):
+    PPEItem = apps.get_model('deteccion', 'PPEItem')
+    for code, name, bit in ELEMENTOS:
+        PPEItem.objects.update_or_create(code=code, defaults={'name': name, 'bit': bit})
+
+
+def calcular_mascaras(apps, schema_editor):
+    # Una actualización por combinación distinta, no por fila
+    Alert = apps.get_model('deteccion', 'Alert')
+    bits = {}
+    for code, name, bit in ELEMENTOS:
+        bits[code] = bits[name.lower()] = bit
+    combinaciones = Alert.objects.exclude(missing='').values_list('missing', flat=True).distinct()
+    for missing in list(combinaciones):
+        mask = 0
+        for item in re.split(r'\s*,\s*', missing):
+            mask |= bits.get(item.strip().lower(), 0)
+        if mask:
+            Alert.objects.filter(missing=missing).update(missing_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0010_alert_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PPEItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, unique=True)),
+                ('name', models.CharField(max_length=50)),
+                ('bit', models.PositiveIntegerField(unique=True)),
+            ],
+            options={
+                'verbose_name': 'Elemento de protección',
+                'verbose_name_plural': 'Elementos de protección',
+                'ordering': ['bit'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='alert',
+            name='alert_noncompliant_idx',
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='missing_mask',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(cargar_elementos, migrations.RunPython.noop),
+        migrations.RunPython(calcular_mascaras, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(condition=models.Q(('resolution_status', 'non_compliant')), fields=['missing_mask'], name='alert_noncompliant_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:30
+
+from datetime import timezone
+
+from django.db import migrations, models
+from django.db.models.functions import TruncHour
+
+
+def cargar_resumenes(apps, schema_editor):
+    Alert = apps.get_model('deteccion', 'Alert')
+    AlertRollup = apps.get_model('deteccion', 'AlertRollup')
+    grupos = Alert.objects.annotate(
+        hour=TruncHour('timestamp', tzinfo=timezone.utc)
+    ).values('hour', 'camera', 'level', 'resolved', 'resolution_status', 'missing_mask').annotate(
+        count=models.Count('id')
+    ).order_by()
+    AlertRollup.objects.bulk_create([AlertRollup(**grupo) for grupo in grupos], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0011_missing_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('camera', models.CharField(blank=True, max_length=50)),
+                ('level', models.CharField(max_length=10)),
+                ('resolved', models.BooleanField(default=False)),
+                ('resolution_status', models.CharField(max_length=20)),
+                ('missing_mask', models.PositiveIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Resumen horario de alertas',
+                'verbose_name_plural': 'Resúmenes horarios de alertas',
+                'ordering': ['-hour'],
+                'constraints': [models.UniqueConstraint(fields=('hour', 'camera', 'level', 'resolved', 'resolution_status', 'missing_mask'), name='unique_alert_rollup')],
+            },
+        ),
+        migrations.RunPython(cargar_resumenes, migrations.RunPython.noop),
+    ]
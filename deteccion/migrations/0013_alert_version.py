@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def crear_version(apps, schema_editor):
+    AlertVersion = apps.get_model('deteccion', 'AlertVersion')
+    AlertVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0012_alert_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Versión de alertas',
+                'verbose_name_plural': 'Versión de alertas',
+            },
+        ),
+        migrations.RunPython(crear_version, migrations.RunPython.noop),
+    ]
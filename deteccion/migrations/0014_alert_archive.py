@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0013_alert_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('message', models.CharField(max_length=255)),
+                ('missing', models.CharField(blank=True, max_length=255)),
+                ('missing_mask', models.PositiveIntegerField(default=0)),
+                ('level', models.CharField(choices=[('high', 'Alta'), ('medium', 'Media'), ('low', 'Baja'), ('positive', 'Positiva')], default='high', max_length=10)),
+                ('video', models.FileField(blank=True, null=True, upload_to='')),
+                ('clip', models.FileField(blank=True, max_length=255, upload_to='clips/')),
+                ('timestamp', models.DateTimeField()),
+                ('resolved', models.BooleanField(default=True)),
+                ('camera', models.CharField(blank=True, max_length=50)),
+                ('last_seen', models.DateTimeField(blank=True, null=True)),
+                ('closed_at', models.DateTimeField(blank=True, null=True)),
+                ('frame_count', models.PositiveIntegerField(default=1)),
+                ('confidence', models.FloatField(default=0)),
+                ('resolution_status', models.CharField(choices=[('pending', 'Pendiente'), ('resolved', 'Resuelto'), ('false_positive', 'Falsa Alerta'), ('non_compliant', 'Incumplimiento Real'), ('system_error', 'Error del Sistema')], default='pending', max_length=20)),
+                ('resolution_notes', models.TextField(blank=True, null=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('resolved_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_alerts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Alerta archivada',
+                'verbose_name_plural': 'Alertas archivadas',
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['timestamp'], name='alertarchive_ts_idx')],
+            },
+        ),
+    ]
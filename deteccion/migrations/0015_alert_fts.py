@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# Índices FTS5 de contenido externo sobre las alertas y el archivo. Los
+# triggers los mantienen al día con cualquier escritura (bulk_create,
+# update, el archivado), así que no hace falta tocarlos desde Python.
+TABLAS = ('deteccion_alert', 'deteccion_alertarchive')
+COLUMNAS = ('message', 'missing', 'resolution_notes')
+
+
+def _sql_crear(tabla):
+    fts = f'{tabla}_fts'
+    columnas = ', '.join(COLUMNAS)
+    nuevos = ', '.join(f'new.{c}' for c in COLUMNAS)
+    viejos = ', '.join(f'old.{c}' for c in COLUMNAS)
+    cambio = ' OR '.join(f'old.{c} IS NOT new.{c}' for c in COLUMNAS)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({columnas}, content='{tabla}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {tabla} BEGIN "
+        f"INSERT INTO {fts}(rowid, {columnas}) VALUES (new.id, {nuevos}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {tabla} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columnas}) VALUES ('delete', old.id, {viejos}); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {columnas} ON {tabla} WHEN {cambio} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columnas}) VALUES ('delete', old.id, {viejos}); "
+        f"INSERT INTO {fts}(rowid, {columnas}) VALUES (new.id, {nuevos}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def crear_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        # En otras bases la búsqueda usa icontains (deteccion.busqueda)
+        return
+    for tabla in TABLAS:
+        for sql in _sql_crear(tabla):
+            schema_editor.execute(sql)
+
+
+def borrar_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for tabla in TABLAS:
+        for sufijo in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {tabla}_fts_{sufijo}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {tabla}_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0014_alert_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_fts, borrar_fts),
+    ]
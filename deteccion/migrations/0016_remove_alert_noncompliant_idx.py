@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:34
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0015_alert_fts'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='alert',
+            name='alert_noncompliant_idx',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0016_remove_alert_noncompliant_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recording',
+            name='sprite_failed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Miniaturas fallidas'),
+        ),
+    ]
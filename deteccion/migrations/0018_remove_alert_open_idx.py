@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:37
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deteccion', '0017_recording_sprite_failed_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='alert',
+            name='alert_open_idx',
+        ),
+    ]
@@ -0,0 +1,126 @@
+import logging
+import math
+import os
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _dimensiones(video_path):
+    """Ancho, alto y duración (s) leyendo sólo la cabecera del archivo"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            return None
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+        duration = frames / fps if fps > 0 else 0
+        return width, height, duration
+    finally:
+        cap.release()
+
+
+def _thumbs_ffmpeg(video_path, interval, width, height, ffmpeg_bin, nice):
+    """
+    Decodifica sólo los keyframes (-skip_frame nokey) y toma uno cada
+    `interval` segundos, ya escalado, como video crudo por stdout.
+    """
+    cmd = [
+        ffmpeg_bin, '-hide_banner', '-loglevel', 'error',
+        '-skip_frame', 'nokey', '-i', video_path,
+        '-vf', f'fps=1/{interval},scale={width}:{height}',
+        '-an', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-',
+    ]
+    if nice is not None and shutil.which('nice'):
+        cmd = ['nice', '-n', str(nice)] + cmd
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    frame_size = width * height * 3
+    count = len(result.stdout) // frame_size
+    data = np.frombuffer(result.stdout[:count * frame_size], dtype=np.uint8)
+    return list(data.reshape(count, height, width, 3))
+
+
+def _thumbs_opencv(video_path, interval, width, height, duration):
+    """Alternativa sin ffmpeg: un seek por miniatura (decodifica desde el keyframe previo)"""
+    cap = cv2.VideoCapture(video_path)
+    thumbs = []
+    try:
+        t = 0.0
+        while t <= duration:
+            cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000)
+            ok, frame = cap.read()
+            if not ok:
+                break
+            thumbs.append(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA))
+            t += interval
+    finally:
+        cap.release()
+    return thumbs
+
+
+def _escribir_jpeg(path, image, quality=70):
+    """Escritura atómica: nunca queda una imagen a medias si el proceso se corta"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError(f"No se pudo codificar {path}")
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(jpeg.tobytes())
+    os.replace(tmp, path)
+
+
+def generar_miniaturas(video_path, sprite_path, poster_path, interval=10, thumb_width=160,
+                       columns=10, poster_width=480, poster_second=0, ffmpeg_bin='ffmpeg', nice=10):
+    """
+    Genera el sprite (una miniatura cada `interval` segundos, en una grilla de
+    `columns` columnas) y el póster (frame en `poster_second`) de un video.
+
+    Devuelve el número de miniaturas del sprite, o None si el video no se
+    pudo leer.
+    """
+    dims = _dimensiones(video_path)
+    if dims is None or not dims[0] or not dims[1]:
+        return None
+    width, height, duration = dims
+    # Alto par, requerido por algunos filtros de escala
+    thumb_height = max(2, int(round(height * thumb_width / width / 2)) * 2)
+
+    thumbs = None
+    if shutil.which(ffmpeg_bin):
+        try:
+            thumbs = _thumbs_ffmpeg(video_path, interval, thumb_width, thumb_height, ffmpeg_bin, nice)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning(f"ffmpeg no pudo generar miniaturas de {video_path}: {e}")
+    if not thumbs:
+        thumbs = _thumbs_opencv(video_path, interval, thumb_width, thumb_height, duration)
+    if not thumbs:
+        return None
+
+    columns = min(columns, len(thumbs))
+    rows = math.ceil(len(thumbs) / columns)
+    sprite = np.zeros((rows * thumb_height, columns * thumb_width, 3), dtype=np.uint8)
+    for i, thumb in enumerate(thumbs):
+        row, col = divmod(i, columns)
+        sprite[row * thumb_height:(row + 1) * thumb_height, col * thumb_width:(col + 1) * thumb_width] = thumb
+    _escribir_jpeg(sprite_path, sprite)
+
+    # Póster: un único seek, desde el keyframe anterior
+    cap = cv2.VideoCapture(video_path)
+    try:
+        cap.set(cv2.CAP_PROP_POS_MSEC, poster_second * 1000)
+        ok, frame = cap.read()
+    finally:
+        cap.release()
+    if not ok:
+        index = min(int(poster_second // interval), len(thumbs) - 1)
+        frame = thumbs[index]
+    poster_height = max(2, int(round(height * poster_width / width / 2)) * 2)
+    _escribir_jpeg(poster_path, cv2.resize(frame, (poster_width, poster_height), interpolation=cv2.INTER_AREA), quality=80)
+    return len(thumbs)
@@ -1,10 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, Group, Permission, PermissionsMixin
 from django.db import models
+from django.db import transaction
 from django.db.models import UniqueConstraint
 from django.core.validators import RegexValidator
 from django.db import models
 from .util import valida_cedula
+from . import epp, resumenes
 from django.utils import timezone
 
 
@@ -140,6 +142,19 @@ class User(AbstractUser, PermissionsMixin):
 # Create your models here.
 
 
+class PPEItem(models.Model):
+    """Elemento de protección personal; `bit` es su posición en Alert.missing_mask"""
+    code = models.CharField(max_length=20, unique=True)  # clase del detector
+    name = models.CharField(max_length=50)
+    bit = models.PositiveIntegerField(unique=True)
+
+    class Meta:
+        verbose_name = 'Elemento de protección'
+        verbose_name_plural = 'Elementos de protección'
+        ordering = ['bit']
+
+    def __str__(self):
+        return self.name
 
 
 class Alert(models.Model):
@@ -160,10 +175,22 @@ class Alert(models.Model):
 
     message = models.CharField(max_length=255)
     missing = models.CharField(max_length=255, blank=True)
+    # Elementos faltantes como bits de PPEItem, para contar en SQL
+    missing_mask = models.PositiveIntegerField(default=0)
     level = models.CharField(max_length=10, choices=LEVEL_CHOICES, default='high')
     video = models.FileField(upload_to='', blank=True, null=True)
+    # Clip corto de evidencia (segundos antes y después de la alerta)
+    clip = models.FileField(upload_to='clips/', max_length=255, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     resolved = models.BooleanField(default=False)
+
+    # Incidente: la alerta se abre al empezar el incumplimiento y se
+    # actualiza mientras continúa; se cierra tras un periodo sin verlo
+    camera = models.CharField(max_length=50, blank=True)
+    last_seen = models.DateTimeField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+    frame_count = models.PositiveIntegerField(default=1)
+    confidence = models.FloatField(default=0)  # confianza de la mejor captura
     
     # ✅ NUEVOS CAMPOS PARA RESOLUCIÓN
     resolution_status = models.CharField(
@@ -185,18 +212,189 @@ class Alert(models.Model):
         verbose_name = 'Alerta'
         verbose_name_plural = 'Alertas'
         ordering = ['-timestamp']
+        indexes = [
+            # latest_alerts, alert_list y alert_statistics filtran por rango de
+            # fechas; resolved y resolution_status van en el índice para filtrar
+            # y agrupar sin leer la tabla (Django compara los booleanos con
+            # NOT col, así que no sirven como primera columna)
+            models.Index(fields=['timestamp', 'resolved', 'resolution_status'], name='alert_ts_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_level_display()} - {self.message} ({self.timestamp:%Y-%m-%d %H:%M:%S})"
 
+    def missing_items(self):
+        """Nombres de los elementos faltantes según missing_mask"""
+        return epp.nombres(self.missing_mask)
+
     def mark_as_resolved(self, user, status='resolved', notes=''):
         """Marca la alerta como resuelta"""
+        antes = resumenes.clave(self)
         self.resolved = True
         self.resolution_status = status
         self.resolution_notes = notes
         self.resolved_by = user
         self.resolved_at = timezone.now()
-        self.save()
+        with transaction.atomic():
+            self.save()
+            resumenes.mover(antes, resumenes.clave(self))
+            AlertVersion.bump()
+
+
+class AlertVersion(models.Model):
+    """
+    Contador global de cambios de alertas (una sola fila). Los endpoints que
+    se consultan periódicamente lo usan como ETag para responder 304 sin
+    leer las alertas.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Versión de alertas'
+        verbose_name_plural = 'Versión de alertas'
+
+    @classmethod
+    def bump(cls):
+        """Registra un cambio en las alertas"""
+        if not cls.objects.filter(pk=1).update(version=models.F('version') + 1, updated_at=timezone.now()):
+            cls.objects.get_or_create(pk=1, defaults={'version': 1})
+
+    @classmethod
+    def current(cls):
+        return cls.objects.get_or_create(pk=1)[0]
+
+
+class AlertRollup(models.Model):
+    """
+    Conteo de alertas por hora (UTC) y combinación de cámara, nivel, estado
+    de resolución y elementos faltantes. Se mantiene incrementalmente desde
+    deteccion.resumenes y se reconstruye con el comando reconstruir_resumenes.
+    """
+    hour = models.DateTimeField()
+    camera = models.CharField(max_length=50, blank=True)
+    level = models.CharField(max_length=10)
+    resolved = models.BooleanField(default=False)
+    resolution_status = models.CharField(max_length=20)
+    missing_mask = models.PositiveIntegerField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Resumen horario de alertas'
+        verbose_name_plural = 'Resúmenes horarios de alertas'
+        ordering = ['-hour']
+        constraints = [
+            UniqueConstraint(
+                fields=['hour', 'camera', 'level', 'resolved', 'resolution_status', 'missing_mask'],
+                name='unique_alert_rollup',
+            )
+        ]
+
+
+class AlertArchive(models.Model):
+    """
+    Alertas resueltas antiguas movidas fuera de Alert por el comando
+    archivar_alertas, con el mismo id. Siguen contando en AlertRollup, así
+    que los reportes no cambian al archivar.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    message = models.CharField(max_length=255)
+    missing = models.CharField(max_length=255, blank=True)
+    missing_mask = models.PositiveIntegerField(default=0)
+    level = models.CharField(max_length=10, choices=Alert.LEVEL_CHOICES, default='high')
+    video = models.FileField(upload_to='', blank=True, null=True)
+    clip = models.FileField(upload_to='clips/', max_length=255, blank=True)
+    timestamp = models.DateTimeField()
+    resolved = models.BooleanField(default=True)
+    camera = models.CharField(max_length=50, blank=True)
+    last_seen = models.DateTimeField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+    frame_count = models.PositiveIntegerField(default=1)
+    confidence = models.FloatField(default=0)
+    resolution_status = models.CharField(max_length=20, choices=Alert.RESOLUTION_CHOICES, default='pending')
+    resolution_notes = models.TextField(blank=True, null=True)
+    resolved_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='archived_alerts'
+    )
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Alerta archivada'
+        verbose_name_plural = 'Alertas archivadas'
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp'], name='alertarchive_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_level_display()} - {self.message} ({self.timestamp:%Y-%m-%d %H:%M:%S})"
+
+    def missing_items(self):
+        return epp.nombres(self.missing_mask)
+
+
+class Recording(models.Model):
+    """
+    Segmento de grabación registrado por el grabador al cerrarse.
+
+    `timeline` guarda, por cada segundo del video, dos bytes: personas
+    detectadas y personas con EPP incompleto (máximo del segundo, hasta 255).
+    Permite listar y saltar a los momentos con incumplimientos sin decodificar
+    el video.
+    """
+    camera = models.CharField(verbose_name='Cámara', max_length=50, db_index=True)
+    file = models.FileField(verbose_name='Archivo', upload_to='grabaciones/', max_length=255, unique=True)
+    started_at = models.DateTimeField(verbose_name='Inicio', db_index=True)
+    ended_at = models.DateTimeField(verbose_name='Fin')
+    duration = models.FloatField(verbose_name='Duración (s)', default=0)
+    frame_count = models.PositiveIntegerField(verbose_name='Frames', default=0)
+    codec = models.CharField(verbose_name='Códec', max_length=20, blank=True)
+    size = models.PositiveBigIntegerField(verbose_name='Tamaño (bytes)', default=0)
+    timeline = models.BinaryField(verbose_name='Línea de tiempo', default=bytes, blank=True)
+    violation_seconds = models.PositiveIntegerField(verbose_name='Segundos con incumplimiento', default=0)
+    # Vistas previas generadas por el comando generar_miniaturas
+    poster = models.FileField(verbose_name='Póster', upload_to='miniaturas/', max_length=255, blank=True)
+    sprite = models.FileField(verbose_name='Sprite', upload_to='miniaturas/', max_length=255, blank=True)
+    sprite_interval = models.PositiveSmallIntegerField(verbose_name='Intervalo del sprite (s)', default=0)
+    sprite_columns = models.PositiveSmallIntegerField(verbose_name='Columnas del sprite', default=0)
+    sprite_count = models.PositiveIntegerField(verbose_name='Miniaturas del sprite', default=0)
+    # Último intento fallido de generar miniaturas; no se reintenta sin --forzar
+    sprite_failed_at = models.DateTimeField(verbose_name='Miniaturas fallidas', null=True, blank=True)
+    # Fecha de la recodificación a calidad de archivo (transcodificar_grabaciones)
+    transcoded_at = models.DateTimeField(verbose_name='Recodificada', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Grabación'
+        verbose_name_plural = 'Grabaciones'
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.camera} - {self.started_at:%Y-%m-%d %H:%M:%S}"
+
+    def timeline_seconds(self):
+        """Lista de (personas, incumplimientos) por segundo"""
+        data = bytes(self.timeline)
+        return [(data[i], data[i + 1]) for i in range(0, len(data) - 1, 2)]
+
+    def violation_ranges(self):
+        """Tramos (inicio, fin) en segundos con personas sin EPP completo"""
+        ranges = []
+        start = None
+        seconds = self.timeline_seconds()
+        for second, (persons, violations) in enumerate(seconds):
+            if violations and start is None:
+                start = second
+            elif not violations and start is not None:
+                ranges.append((start, second))
+                start = None
+        if start is not None:
+            ranges.append((start, len(seconds)))
+        return ranges
 
 
 class Cargo(models.Model):
@@ -0,0 +1,125 @@
+import threading
+import time
+
+
+class AlertasRecientes:
+    """
+    Las últimas `size` alertas del proceso en memoria (con el formato de
+    datos_alerta), para servir latest_alerts e inicio sin consultar la base.
+
+    Se carga en la primera consulta y se actualiza con los eventos del
+    BusAlertas de este proceso. Los cambios hechos por otros procesos se
+    detectan comparando la AlertVersion, como mucho cada `check_interval`
+    segundos; si cambió, se recarga. Las consultas que no se pueden
+    responder con lo que hay en memoria devuelven None y la vista usa la base.
+    """
+
+    def __init__(self, size=50, check_interval=1.0):
+        self.size = size
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._alertas = {}  # id -> datos
+        self._version = None  # AlertVersion de la última carga
+        self._completo = False  # en la base no hay alertas más antiguas
+        self._checked = 0
+
+    def aplicar(self, tipo, datos):
+        """Suscriptor del BusAlertas"""
+        with self._lock:
+            if self._version is None:
+                return
+            if 'id' not in datos:
+                # Evento de varias alertas (resolución en bloque): recargar
+                self._version = None
+                return
+            self._alertas[datos['id']] = datos
+            while len(self._alertas) > self.size:
+                del self._alertas[min(self._alertas)]
+                self._completo = False
+            # La versión cambió: comprobarla en la próxima consulta
+            self._checked = 0
+
+    def invalidar(self):
+        """Descarta lo cargado; la próxima consulta recarga desde la base"""
+        with self._lock:
+            self._version = None
+            self._alertas = {}
+
+    def _cargar(self, version):
+        from .eventos import datos_alerta
+        from .models import Alert
+
+        alertas = list(Alert.objects.order_by('-id')[:self.size])
+        with self._lock:
+            self._alertas = {alerta.pk: datos_alerta(alerta) for alerta in alertas}
+            self._completo = len(alertas) < self.size
+            self._version = version
+
+    def version(self):
+        """AlertVersion vigente, leída de la base como mucho cada check_interval"""
+        from .models import AlertVersion
+
+        now = time.monotonic()
+        if self._version is not None and now - self._checked < self.check_interval:
+            return self._version
+        version = AlertVersion.current()
+        self._checked = now
+        if self._version is None or version.version != self._version.version:
+            self._cargar(version)
+        return self._version
+
+    def pagina(self, after_id=None, limit=10, desde=None, filtro=None):
+        """
+        Como alert_page sin `before`: las más recientes, o las posteriores a
+        `after_id` en orden ascendente. `desde` es un timestamp (epoch) mínimo
+        y `filtro` una función sobre los datos. Devuelve (filas, cursores) o
+        None si la respuesta no está completa en memoria.
+        """
+        self.version()
+        with self._lock:
+            ids = sorted(self._alertas, reverse=True)
+            if after_id is not None and ids and after_id < ids[-1] - 1 and not self._completo:
+                return None
+            filas = [
+                self._alertas[i] for i in ids
+                if (after_id is None or i > after_id)
+                and (desde is None or self._alertas[i]['ts'] >= desde)
+                and (filtro is None or filtro(self._alertas[i]))
+            ]
+            # Una página incompleta puede seguir en la base, salvo que la
+            # ventana `desde` ya empiece dentro de la memoria
+            cubierto = self._completo or (
+                desde is not None and ids and self._alertas[ids[-1]]['ts'] < desde
+            )
+        if after_id is None and len(filas) < limit and not cubierto:
+            return None
+
+        if after_id is not None:
+            filas.reverse()
+        has_more = len(filas) > limit
+        filas = filas[:limit]
+        cursores = {
+            'after_id': max([fila['id'] for fila in filas] + [after_id or 0]),
+            'before': min(fila['id'] for fila in filas) if has_more and after_id is None else None,
+            'has_more': has_more,
+        }
+        return filas, cursores
+
+
+_recientes = None
+_recientes_lock = threading.Lock()
+
+
+def obtener_recientes():
+    """AlertasRecientes del proceso, suscrito al BusAlertas"""
+    global _recientes
+    with _recientes_lock:
+        if _recientes is None:
+            from django.conf import settings
+            from .eventos import obtener_bus
+            _recientes = AlertasRecientes(
+                size=getattr(settings, 'ALERTAS_RECIENTES', 50),
+                check_interval=getattr(settings, 'ALERTAS_RECIENTES_VERIFICAR_SECONDS', 1.0),
+            )
+            obtener_bus().suscribir(_recientes.aplicar)
+        return _recientes
@@ -0,0 +1,245 @@
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+from django.db.models.lookups import Exact
+from django.utils import timezone
+
+# Columnas de Alert por las que se agrupan los resúmenes (además de la hora)
+DIMENSIONES = ('camera', 'level', 'resolved', 'resolution_status', 'missing_mask')
+
+# Intervalos de las series temporales, de menor a mayor, con su duración
+# aproximada para calcular el número de puntos
+INTERVALOS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    'month': timedelta(days=30.44),
+}
+
+
+def hora(timestamp):
+    """Inicio de la hora UTC de `timestamp`"""
+    return timestamp.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _clave(valores):
+    return (hora(valores['timestamp']),) + tuple(valores[campo] for campo in DIMENSIONES)
+
+
+def clave(alerta):
+    """Clave del resumen al que pertenece una Alert"""
+    return _clave({campo: getattr(alerta, campo) for campo in ('timestamp',) + DIMENSIONES})
+
+
+def aplicar(deltas):
+    """
+    Suma `deltas` ({clave: n}) a los contadores con INSERT ... ON CONFLICT,
+    así que procesos concurrentes no se pisan. Debe llamarse dentro de la
+    misma transacción que el cambio de las alertas.
+    """
+    from .models import AlertRollup
+
+    # La hora con el mismo formato que guarda el ORM, para que coincida la clave única
+    adaptar = connection.ops.adapt_datetimefield_value
+    filas = [(adaptar(clave[0]),) + clave[1:] + (n,) for clave, n in deltas.items() if n]
+    if not filas:
+        return
+    quote = connection.ops.quote_name
+    columnas = ('hour',) + DIMENSIONES
+    lista = ', '.join(quote(c) for c in columnas)
+    sql = (
+        f"INSERT INTO {quote(AlertRollup._meta.db_table)} ({lista}, {quote('count')}) "
+        f"VALUES ({', '.join(['%s'] * (len(columnas) + 1))}) "
+        f"ON CONFLICT ({lista}) DO UPDATE SET {quote('count')} = "
+        f"{quote(AlertRollup._meta.db_table)}.{quote('count')} + excluded.{quote('count')}"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, filas)
+
+
+def registrar(alertas):
+    """Cuenta alertas recién creadas"""
+    aplicar(Counter(clave(alerta) for alerta in alertas))
+
+
+def mover(antes, despues):
+    """Pasa una alerta de un resumen a otro tras modificarla"""
+    if antes != despues:
+        aplicar({antes: -1, despues: 1})
+
+
+def actualizar(queryset, **campos):
+    """
+    `queryset.update(**campos)` manteniendo los resúmenes. Si no cambia
+    ninguna dimensión es un update normal; si no, se leen antes las claves
+    de las filas afectadas. Devuelve el número de filas actualizadas.
+    """
+    if not any(campo in campos for campo in DIMENSIONES):
+        return queryset.update(**campos)
+    with transaction.atomic():
+        filas = list(queryset.select_for_update().values('timestamp', *DIMENSIONES))
+        actualizadas = queryset.update(**campos)
+        deltas = Counter()
+        for valores in filas:
+            deltas[_clave(valores)] -= 1
+            deltas[_clave(dict(valores, **campos))] += 1
+        aplicar(deltas)
+    return actualizadas
+
+
+def eliminar(queryset):
+    """
+    `queryset.delete()` descontando las alertas borradas de los resúmenes.
+    Devuelve el número de alertas borradas.
+    """
+    with transaction.atomic():
+        deltas = Counter()
+        for valores in queryset.select_for_update().values('timestamp', *DIMENSIONES):
+            deltas[_clave(valores)] -= 1
+        borradas = queryset.delete()[1].get(queryset.model._meta.label, 0)
+        aplicar(deltas)
+    return borradas
+
+
+def reconstruir(desde=None, hasta=None):
+    """
+    Recalcula los resúmenes desde Alert y AlertArchive, para las horas en
+    [desde, hasta) o para todo. Devuelve el número de filas de resumen creadas.
+    """
+    from .models import Alert, AlertArchive, AlertRollup
+
+    resumenes = AlertRollup.objects.all()
+    if desde is not None:
+        resumenes = resumenes.filter(hour__gte=hora(desde))
+    if hasta is not None:
+        resumenes = resumenes.filter(hour__lt=hora(hasta))
+
+    with transaction.atomic():
+        conteos = Counter()
+        for modelo in (Alert, AlertArchive):
+            alertas = modelo.objects.all()
+            if desde is not None:
+                alertas = alertas.filter(timestamp__gte=hora(desde))
+            if hasta is not None:
+                alertas = alertas.filter(timestamp__lt=hora(hasta))
+            grupos = alertas.annotate(
+                hour=TruncHour('timestamp', tzinfo=dt_timezone.utc)
+            ).values('hour', *DIMENSIONES).annotate(n=Count('id')).order_by()
+            for grupo in grupos.iterator():
+                conteos[tuple(grupo[campo] for campo in ('hour',) + DIMENSIONES)] += grupo['n']
+
+        resumenes.delete()
+        filas = [
+            AlertRollup(count=n, **dict(zip(('hour',) + DIMENSIONES, clave)))
+            for clave, n in conteos.items()
+        ]
+        AlertRollup.objects.bulk_create(filas, batch_size=1000)
+    return len(filas)
+
+
+def intervalo_para(desde, hasta, max_puntos=500, minimo='hour'):
+    """El intervalo más fino (no menor que `minimo`) con el que [desde, hasta) da como mucho `max_puntos`"""
+    nombres = list(INTERVALOS)
+    for nombre in nombres[nombres.index(minimo):]:
+        if (hasta - desde) / INTERVALOS[nombre] <= max_puntos:
+            return nombre
+    return nombres[-1]
+
+
+def _cubeta(hour, intervalo, zona):
+    """Inicio del intervalo local que contiene la hora UTC `hour`"""
+    if intervalo == 'hour':
+        return hour
+    dia = hour.astimezone(zona).date()
+    if intervalo == 'week':
+        return dia - timedelta(days=dia.weekday())
+    if intervalo == 'month':
+        return dia.replace(day=1)
+    return dia
+
+
+def _cubetas(desde, hasta, intervalo, zona):
+    """Todas las cubetas de [desde, hasta), también las que no tienen alertas"""
+    if intervalo == 'hour':
+        cubeta = hora(desde)
+        paso = INTERVALOS['hour']
+    else:
+        cubeta = _cubeta(hora(desde), intervalo, zona)
+        paso = timedelta(days=7 if intervalo == 'week' else 1)
+    ultima = _cubeta(hora(hasta - timedelta(microseconds=1)), intervalo, zona)
+    cubetas = []
+    while cubeta <= ultima:
+        cubetas.append(cubeta)
+        if intervalo == 'month':
+            cubeta = (cubeta + timedelta(days=32)).replace(day=1)
+        else:
+            cubeta += paso
+    return cubetas
+
+
+def serie(desde, hasta, agrupar=None, intervalo=None, max_puntos=500):
+    """
+    Conteo de alertas en [desde, hasta) por intervalo (hour, day, week o
+    month, en hora local), total o por `agrupar` (level, status o item).
+    Sin `intervalo`, o si el pedido da más de `max_puntos`, se usa el más
+    fino que no los supera.
+
+    La base suma los resúmenes por hora y dimensión; las horas se reparten
+    en intervalos aquí, porque en SQLite las funciones Trunc* se evalúan en
+    Python para cada fila y con un año de resúmenes son varias veces más
+    lentas. Devuelve {'interval', 'buckets', 'series', 'labels'}.
+    """
+    from .models import Alert, AlertRollup, PPEItem
+
+    intervalo = intervalo_para(desde, hasta, max_puntos, intervalo or 'hour')
+    zona = timezone.get_current_timezone()
+    rollups = AlertRollup.objects.filter(hour__gte=hora(desde), hour__lt=hasta).order_by()
+
+    if agrupar == 'item':
+        items = list(PPEItem.objects.all())
+        labels = {item.code: item.name for item in items}
+        sumas = {
+            item.code: Sum('count', filter=Exact(F('missing_mask').bitand(item.bit), item.bit))
+            for item in items
+        }
+        filas = (
+            (hour, codigo, valores[i])
+            for hour, *valores in rollups.filter(missing_mask__gt=0).values_list('hour').annotate(**sumas)
+            for i, codigo in enumerate(sumas)
+        ) if items else ()
+    elif agrupar in ('level', 'status'):
+        campo = 'level' if agrupar == 'level' else 'resolution_status'
+        labels = dict(Alert.LEVEL_CHOICES if agrupar == 'level' else Alert.RESOLUTION_CHOICES)
+        filas = rollups.values_list('hour', campo).annotate(n=Sum('count'))
+    else:
+        labels = {'total': 'Total'}
+        filas = ((hour, 'total', n) for hour, n in rollups.values_list('hour').annotate(n=Sum('count')))
+
+    cubetas = _cubetas(desde, hasta, intervalo, zona)
+    posicion = {cubeta: i for i, cubeta in enumerate(cubetas)}
+    series = {} if agrupar else {'total': [0] * len(cubetas)}
+    por_hora = {}  # hour -> posición, las horas se repiten en cada serie
+    for hour, nombre, n in filas:
+        if not n:
+            continue
+        if hour not in por_hora:
+            por_hora[hour] = posicion.get(_cubeta(hour, intervalo, zona))
+        i = por_hora[hour]
+        if i is None:
+            continue
+        if nombre not in series:
+            series[nombre] = [0] * len(cubetas)
+        series[nombre][i] += n
+
+    return {
+        'interval': intervalo,
+        'buckets': [
+            cubeta.astimezone(zona).isoformat() if intervalo == 'hour' else cubeta.isoformat()
+            for cubeta in cubetas
+        ],
+        'series': series,
+        'labels': {nombre: labels.get(nombre, nombre) for nombre in series},
+    }
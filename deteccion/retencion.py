@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = ('.avi', '.mp4')
+INDEX_NAME = '.indice.json'
+# Archivos modificados hace menos de esto pueden estar grabándose todavía
+ACTIVE_SECONDS = 600
+
+
+class IndiceGrabaciones:
+    """
+    Índice persistente del árbol de grabaciones.
+
+    Guarda, por directorio, su mtime y el tamaño/mtime de cada archivo. Un
+    directorio sólo se vuelve a listar con os.scandir cuando su mtime
+    cambia (se creó o borró un archivo), así los días anteriores, que ya no
+    cambian, no se recorren en cada pasada.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, INDEX_NAME)
+        self.dirs = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.dirs = json.load(f).get('dirs', {})
+        except (OSError, ValueError):
+            self.dirs = {}
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'dirs': self.dirs}, f)
+        os.replace(tmp, self.path)
+
+    def _scan(self, rel_dir, seen):
+        abs_dir = os.path.join(self.root, rel_dir)
+        try:
+            mtime = os.stat(abs_dir).st_mtime_ns
+        except FileNotFoundError:
+            return
+        seen.add(rel_dir)
+        cached = self.dirs.get(rel_dir)
+        if cached is None or cached['mtime'] != mtime:
+            files, subdirs = {}, []
+            with os.scandir(abs_dir) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                        st = entry.stat()
+                        files[entry.name] = [st.st_size, st.st_mtime]
+            cached = {'mtime': mtime, 'files': files, 'dirs': subdirs}
+            self.dirs[rel_dir] = cached
+        else:
+            # Los archivos recientes pueden seguir creciendo sin cambiar el directorio
+            limite = time.time() - ACTIVE_SECONDS
+            for name, (size, file_mtime) in list(cached['files'].items()):
+                if file_mtime >= limite:
+                    try:
+                        st = os.stat(os.path.join(abs_dir, name))
+                        cached['files'][name] = [st.st_size, st.st_mtime]
+                    except FileNotFoundError:
+                        del cached['files'][name]
+        for name in cached['dirs']:
+            self._scan(os.path.join(rel_dir, name) if rel_dir else name, seen)
+
+    def refresh(self):
+        """Actualiza el índice y devuelve la lista de grabaciones"""
+        seen = set()
+        self._scan('', seen)
+        # Olvidar directorios que ya no existen
+        for rel_dir in set(self.dirs) - seen:
+            del self.dirs[rel_dir]
+
+        archivos = []
+        for rel_dir, data in self.dirs.items():
+            # La cámara es el primer nivel bajo la raíz ('' para archivos sueltos)
+            camera = rel_dir.split(os.sep)[0] if rel_dir else ''
+            for name, (size, mtime) in data['files'].items():
+                archivos.append({
+                    'path': os.path.join(self.root, rel_dir, name),
+                    'dir': rel_dir,
+                    'name': name,
+                    'camera': camera,
+                    'size': size,
+                    'mtime': mtime,
+                })
+        return archivos
+
+    def remove(self, archivo):
+        os.remove(archivo['path'])
+        data = self.dirs.get(archivo['dir'])
+        if data is not None:
+            data['files'].pop(archivo['name'], None)
+            abs_dir = os.path.join(self.root, archivo['dir'])
+            if archivo['dir'] and not data['files'] and not data['dirs']:
+                # Directorio de día vacío
+                try:
+                    os.rmdir(abs_dir)
+                except OSError:
+                    pass
+            elif os.path.isdir(abs_dir):
+                data['mtime'] = os.stat(abs_dir).st_mtime_ns
+
+
+def aplicar_retencion(root, quota_camara=None, quota_global=None, protegidos=(),
+                      min_age_seconds=ACTIVE_SECONDS, dry_run=False):
+    """
+    Borra las grabaciones más antiguas hasta cumplir las cuotas (en bytes)
+    por cámara y global. Nunca borra las rutas en `protegidos` ni archivos
+    modificados hace menos de `min_age_seconds`.
+
+    Devuelve la lista de archivos eliminados (o que se eliminarían con dry_run).
+    """
+    if not os.path.isdir(root):
+        return []
+    indice = IndiceGrabaciones(root)
+    archivos = indice.refresh()
+    protegidos = {os.path.normcase(os.path.normpath(p)) for p in protegidos}
+    limite = time.time() - min_age_seconds
+
+    archivos.sort(key=lambda a: a['mtime'])
+    eliminables = [
+        a for a in archivos
+        if a['mtime'] < limite and os.path.normcase(os.path.normpath(a['path'])) not in protegidos
+    ]
+
+    eliminados = []
+    borrados = set()
+
+    def borrar(archivo):
+        if not dry_run:
+            try:
+                indice.remove(archivo)
+            except FileNotFoundError:
+                pass
+        eliminados.append(archivo)
+        borrados.add(archivo['path'])
+
+    if quota_camara is not None:
+        totales = {}
+        for a in archivos:
+            totales[a['camera']] = totales.get(a['camera'], 0) + a['size']
+        for a in eliminables:
+            if totales[a['camera']] > quota_camara:
+                borrar(a)
+                totales[a['camera']] -= a['size']
+
+    if quota_global is not None:
+        total = sum(a['size'] for a in archivos if a['path'] not in borrados)
+        for a in eliminables:
+            if total <= quota_global:
+                break
+            if a['path'] in borrados:
+                continue
+            borrar(a)
+            total -= a['size']
+
+    if not dry_run:
+        indice.save()
+    for a in eliminados:
+        logger.info(f"Grabación eliminada por retención: {a['path']} ({a['size']} bytes)")
+    return eliminados
@@ -0,0 +1,235 @@
+import collections
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class FFmpegPipe:
+    """
+    Proceso ffmpeg que recibe frames BGR crudos por stdin.
+
+    Los frames se entregan a una cola acotada y un hilo propio los escribe en
+    el pipe, de modo que la codificación nunca bloquea la inferencia: si la
+    cola está llena el frame se descarta y se contabiliza en `dropped`.
+    Las últimas líneas de stderr quedan en `stderr_tail` para diagnosticar
+    una salida inesperada.
+    """
+
+    def __init__(self, output_args, width, height, ffmpeg_bin='ffmpeg',
+                 queue_size=30, wallclock=True, input_fps=None, nice=None):
+        self.width = width
+        self.height = height
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stderr = collections.deque(maxlen=20)
+
+        cmd = [ffmpeg_bin, '-hide_banner', '-loglevel', 'error', '-y']
+        if wallclock:
+            # Marcas de tiempo reales: la velocidad de reproducción coincide
+            # con la captura aunque los fps de la cámara varíen
+            cmd += ['-use_wallclock_as_timestamps', '1']
+        cmd += [
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+            '-s', f'{width}x{height}',
+        ]
+        if input_fps is not None:
+            cmd += ['-framerate', str(input_fps)]
+        cmd += ['-i', '-'] + list(output_args)
+        if nice is not None and shutil.which('nice'):
+            cmd = ['nice', '-n', str(nice)] + cmd
+
+        self.process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        # stderr se lee siempre para que el pipe no se llene y bloquee a ffmpeg
+        self._stderr_thread = threading.Thread(target=self._read_stderr, daemon=True)
+        self._stderr_thread.start()
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            try:
+                self.process.stdin.write(frame.tobytes())
+            except (BrokenPipeError, ValueError, OSError) as e:
+                logger.error(f"ffmpeg terminó inesperadamente: {e}")
+                break
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+    def _read_stderr(self):
+        for line in iter(self.process.stderr.readline, b''):
+            self._stderr.append(line.decode('utf-8', 'replace').rstrip())
+        self.process.stderr.close()
+
+    @property
+    def is_alive(self):
+        return self.process.poll() is None and self._thread.is_alive()
+
+    @property
+    def returncode(self):
+        return self.process.poll()
+
+    @property
+    def stderr_tail(self):
+        if self.process.poll() is not None:
+            # Con el proceso terminado, esperar a leer sus últimas líneas
+            self._stderr_thread.join(1)
+        return '\n'.join(self._stderr)
+
+    def write(self, frame, block=False, timeout=None):
+        """
+        Encola un frame. Por defecto no bloquea y devuelve False si se
+        descartó; con block=True espera lugar (útil desde un hilo escritor)
+        mientras ffmpeg siga vivo y, si se indica, hasta `timeout` segundos.
+        """
+        if frame.shape[1] != self.width or frame.shape[0] != self.height:
+            return False
+        if not block:
+            try:
+                self._queue.put_nowait(frame)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                return False
+        limite = None if timeout is None else time.monotonic() + timeout
+        while self.is_alive:
+            espera = 0.5 if limite is None else min(0.5, limite - time.monotonic())
+            if espera <= 0:
+                break
+            try:
+                self._queue.put(frame, timeout=espera)
+                return True
+            except queue.Full:
+                pass
+        self.dropped += 1
+        return False
+
+    def close(self, timeout=10):
+        """Vacía la cola, cierra stdin y espera a que ffmpeg termine el archivo"""
+        if self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+        self._thread.join(timeout)
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._stderr_thread.join(1)
+        return self.process.returncode
+
+
+class HLSStreamer:
+    """
+    Salida en vivo H.264 en segmentos HLS rotativos.
+
+    Codifica el stream anotado con libx264 (preset ultrafast, multihilo) y
+    mantiene sólo los últimos `list_size` segmentos en `directory`, que
+    conviene ubicar en memoria (/dev/shm). Los segmentos se numeran desde
+    el instante de inicio, así que un nombre no se repite entre sesiones.
+
+    Si ffmpeg termina se reinicia con espera creciente desde
+    `retry_seconds`; tras `max_failures` salidas seguidas antes de
+    `min_uptime` segundos el stream queda deshabilitado.
+    """
+
+    PLAYLIST = 'live.m3u8'
+    SEGMENT_PATTERN = 'seg_%05d.ts'
+
+    def __init__(self, directory, threads=2, segment_seconds=2, list_size=6,
+                 ffmpeg_bin='ffmpeg', fps=15, retry_seconds=1, max_failures=5, min_uptime=10):
+        self.directory = directory
+        self.threads = threads
+        self.segment_seconds = segment_seconds
+        self.list_size = list_size
+        self.ffmpeg_bin = ffmpeg_bin
+        self.fps = fps
+        self.retry_seconds = retry_seconds
+        self.max_failures = max_failures
+        self.min_uptime = min_uptime
+        self._pipe = None
+        self._disabled = False
+        self._failures = 0
+        self._started_at = None
+        self._retry_at = 0
+
+    def _output_args(self):
+        return [
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
+            '-threads', str(self.threads),
+            '-pix_fmt', 'yuv420p',
+            # GOP fijo para que cada segmento empiece con un keyframe
+            '-g', str(self.fps * self.segment_seconds),
+            '-keyint_min', str(self.fps * self.segment_seconds),
+            '-sc_threshold', '0',
+            '-f', 'hls',
+            '-hls_time', str(self.segment_seconds),
+            '-hls_list_size', str(self.list_size),
+            '-hls_flags', 'delete_segments+independent_segments+omit_endlist',
+            # Numeración por sesión: los segmentos se sirven como inmutables
+            '-hls_start_number_source', 'epoch',
+            '-hls_segment_filename', os.path.join(self.directory, self.SEGMENT_PATTERN),
+            os.path.join(self.directory, self.PLAYLIST),
+        ]
+
+    def _start(self, frame):
+        os.makedirs(self.directory, exist_ok=True)
+        # Segmentos de una sesión anterior confundirían al reproductor
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and (entry.name.endswith('.ts') or entry.name.endswith('.m3u8')):
+                os.remove(entry.path)
+        height, width = frame.shape[:2]
+        self._pipe = FFmpegPipe(self._output_args(), width, height, ffmpeg_bin=self.ffmpeg_bin)
+        self._started_at = time.monotonic()
+        logger.info(f"Stream HLS iniciado en {self.directory}")
+
+    def _failed(self):
+        pipe, self._pipe = self._pipe, None
+        code = pipe.close(timeout=1)
+        logger.error(f"ffmpeg de HLS terminó con código {code}: {pipe.stderr_tail or 'sin salida'}")
+        now = time.monotonic()
+        self._failures = self._failures + 1 if now - self._started_at < self.min_uptime else 1
+        if self._failures >= self.max_failures:
+            logger.error(f"HLS deshabilitado tras {self._failures} fallos seguidos de ffmpeg")
+            self._disabled = True
+            return
+        self._retry_at = now + min(self.retry_seconds * 2 ** (self._failures - 1), 60)
+
+    def write(self, frame):
+        if self._disabled:
+            return False
+        if self._pipe is not None and not self._pipe.is_alive:
+            self._failed()
+            if self._disabled:
+                return False
+        if self._pipe is None:
+            if time.monotonic() < self._retry_at:
+                return False
+            try:
+                self._start(frame)
+            except OSError as e:
+                # ffmpeg no instalado: no reintentar en cada frame
+                logger.error(f"No se pudo iniciar ffmpeg para HLS: {e}")
+                self._disabled = True
+                return False
+        return self._pipe.write(frame)
+
+    def stop(self):
+        if self._pipe is not None:
+            self._pipe.close()
+            self._pipe = None
+            logger.info("Stream HLS detenido")
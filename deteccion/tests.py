@@ -1,3 +1,940 @@
-from django.test import TestCase
+import asyncio
+import csv
+import importlib.util
+import io
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import busqueda, epp, exportar, resumenes
+from .eventos import BusAlertas, datos_alerta
+from .recientes import AlertasRecientes, obtener_recientes
+from .alertas import AlertSink
+from .archivo import archivar
+from .dedup import DedupStore
+from .detecciones import construir_metadatos
+from .evidencia import GrabadorClips
+from .grabacion import BackendError, BaseBackend, FFmpegBackend, GrabadorAsincrono
+from .incidentes import GestorIncidentes
+from .streaming import FFmpegPipe, HLSStreamer
+from .models import Alert, AlertArchive, AlertRollup, AlertVersion, PPEItem
+
+
+class BackendLento(BaseBackend):
+    """Backend de prueba: escribe un byte por frame y espera a `liberar`"""
+    extension = '.raw'
+    codec = 'raw'
+
+    def __init__(self, liberar):
+        super().__init__(fps=10)
+        self.liberar = liberar
+
+    def open(self, path, width, height):
+        self._archivo = open(path, 'wb')
+        return True
+
+    def _emit(self, frame):
+        self.liberar.wait(5)
+        self._archivo.write(b'x')
+
+    def close(self):
+        self._archivo.close()
+        self.cerrado = True
+
+
+class CajasFalsas:
+    """Imita `result.boxes` de ultralytics con arrays de numpy"""
+
+    def __init__(self, filas, ids=None):
+        datos = numpy.array(filas, dtype=float).reshape(-1, 6)
+        self.xyxy, self.conf, self.cls = datos[:, :4], datos[:, 4], datos[:, 5]
+        self.id = numpy.array(ids, dtype=float) if ids is not None else None
+
+    def __len__(self):
+        return len(self.xyxy)
+
+
+class ConstruirMetadatosTests(SimpleTestCase):
+    """Cada elemento de EPP se asigna a la persona cuyo recuadro contiene su centro"""
+
+    names = {0: 'person', 1: 'helmet', 2: 'vest', 3: 'boots'}
+
+    def resultado(self, filas, ids=None):
+        return mock.Mock(boxes=CajasFalsas(filas, ids), orig_shape=(480, 640, 3))
+
+    def test_items_assigned_to_containing_person(self):
+        resultado = self.resultado([
+            [0, 0, 100, 300, 0.91, 0],      # persona 1
+            [200, 0, 300, 300, 0.8, 0],     # persona 2
+            [30, 0, 70, 40, 0.7, 1],        # casco de la persona 1
+            [20, 100, 80, 180, 0.6, 2],     # chaleco de la persona 1
+            [220, 250, 280, 300, 0.5, 3],   # botas de la persona 2
+            [500, 0, 540, 40, 0.5, 1],      # casco fuera de ambas
+        ], ids=[7, 8, 9, 10, 11, 12])
+        meta = construir_metadatos(resultado, self.names, seq=3)
+
+        self.assertEqual((meta['seq'], meta['w'], meta['h']), (3, 640, 480))
+        self.assertEqual(meta['boxes'][0], [0, 0, 100, 300, 0, 0.91, 7])
+        self.assertEqual(meta['persons'], [
+            [0, 7, ['boots']],
+            [1, 8, ['helmet', 'vest']],
+        ])
+
+    def test_no_boxes_and_no_tracking(self):
+        meta = construir_metadatos(self.resultado([]), self.names, seq=1)
+        self.assertEqual((meta['boxes'], meta['persons']), ([], []))
+
+        meta = construir_metadatos(self.resultado([[0, 0, 10, 10, 0.9, 0]]), self.names, seq=2)
+        self.assertEqual(meta['persons'], [[0, None, ['helmet', 'vest', 'boots']]])
+
+
+def ffmpeg_falso(directorio):
+    """Script que hace de ffmpeg: escribe un error y termina con código 3"""
+    script = os.path.join(directorio, 'ffmpeg')
+    with open(script, 'w') as f:
+        f.write('#!/bin/sh\necho "codec roto" >&2\nexit 3\n')
+    os.chmod(script, 0o755)
+    return script
+
+
+@skipUnless(os.name == 'posix', 'Usa un script de shell como ffmpeg')
+class HLSStreamerTests(SimpleTestCase):
+    """Si ffmpeg termina enseguida se reintenta con espera y luego se deshabilita"""
+
+    def test_backoff_then_disable(self):
+        frame = numpy.zeros((4, 4, 3), numpy.uint8)
+        with tempfile.TemporaryDirectory() as directorio, \
+                mock.patch('deteccion.streaming.FFmpegPipe', wraps=FFmpegPipe) as pipe, \
+                self.assertLogs('deteccion.streaming', 'ERROR') as logs:
+            stream = HLSStreamer(os.path.join(directorio, 'hls'), ffmpeg_bin=ffmpeg_falso(directorio),
+                                 retry_seconds=0.2, max_failures=3)
+            limite = time.monotonic() + 5
+            while not stream._disabled and time.monotonic() < limite:
+                stream.write(frame)
+                time.sleep(0.01)
+
+        self.assertTrue(stream._disabled)
+        self.assertEqual(pipe.call_count, 3)
+        self.assertIn('codec roto', '\n'.join(logs.output))
+        self.assertIn('-hls_start_number_source', stream._output_args())
+
+
+class GrabadorAsincronoTests(SimpleTestCase):
+    """Con la cola llena se descartan frames, nunca la apertura o el cierre de un segmento"""
+
+    def test_segments_registered_under_backpressure(self):
+        liberar = threading.Event()
+        segmentos = []
+        with tempfile.TemporaryDirectory() as directorio:
+            grabador = GrabadorAsincrono(
+                directorio, backend_factory=lambda: BackendLento(liberar), queue_size=4,
+                pre_roll_seconds=0, post_roll_seconds=10, segment_seconds=2,
+                on_segment_closed=segmentos.append,
+            )
+            frame = numpy.zeros((4, 4, 3), numpy.uint8)
+
+            def enviar(i):
+                grabador.submit(frame, detected=True, timestamp=1000 + i * 0.1, persons=1)
+
+            def vaciar():
+                while not grabador._queue.empty():
+                    time.sleep(0.01)
+
+            # El escritor queda bloqueado en el primer frame y la cola se llena
+            enviar(0)
+            vaciar()
+            for i in range(1, 20):
+                enviar(i)
+            self.assertEqual(grabador._queue.qsize(), 4)
+            self.assertEqual(grabador.dropped, 15)
+
+            # La rotación a los 2 s encola el cierre y la apertura con la cola llena
+            threading.Timer(0.2, liberar.set).start()
+            for i in range(20, 30):
+                enviar(i)
+                vaciar()
+            grabador.close()
+
+        # Los dos segmentos se registran; el frame de la rotación puede descartarse
+        self.assertEqual(len(segmentos), 2)
+        self.assertNotEqual(segmentos[0]['filename'], segmentos[1]['filename'])
+        self.assertEqual(segmentos[0]['started'], 1000)
+        self.assertAlmostEqual(segmentos[1]['ended'], 1002.9)
+        self.assertGreaterEqual(segmentos[1]['frames'], 9)
+
+    def test_control_timeout_marks_failed(self):
+        liberar = threading.Event()
+        with tempfile.TemporaryDirectory() as directorio:
+            grabador = GrabadorAsincrono(
+                directorio, backend_factory=lambda: BackendLento(liberar), queue_size=4,
+                pre_roll_seconds=0, post_roll_seconds=10, segment_seconds=1, control_timeout=0.2,
+            )
+            frame = numpy.zeros((4, 4, 3), numpy.uint8)
+            grabador.submit(frame, detected=True, timestamp=1000)
+            while not grabador._queue.empty():
+                time.sleep(0.01)
+            for i in range(1, 10):
+                grabador.submit(frame, detected=True, timestamp=1000 + i * 0.1)
+
+            # La rotación no encuentra lugar: espera acotada y grabación suspendida
+            inicio = time.monotonic()
+            grabador.submit(frame, detected=True, timestamp=1001)
+            self.assertLess(time.monotonic() - inicio, 1)
+            self.assertTrue(grabador.failed)
+            self.assertFalse(grabador.is_recording)
+
+            # Con la cola vaciada se reanuda
+            liberar.set()
+            esperar(grabador._queue.empty)
+            grabador.submit(frame, detected=True, timestamp=1002)
+            self.assertFalse(grabador.failed)
+            self.assertTrue(grabador.is_recording)
+            grabador.close()
+
+
+@skipUnless(os.name == 'posix', 'Usa un script de shell como ffmpeg')
+class FFmpegBackendTests(SimpleTestCase):
+    """Si ffmpeg termina, la escritura falla con su código y stderr en lugar de bloquear"""
+
+    def test_ffmpeg_exit_fails_segment(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            backend = FFmpegBackend(fps=10, ffmpeg_bin=ffmpeg_falso(directorio), write_timeout=2)
+            self.assertTrue(backend.open(os.path.join(directorio, 'a.mp4'), 4, 4))
+            frame = numpy.zeros((4, 4, 3), numpy.uint8)
+            inicio = time.monotonic()
+            with self.assertRaises(BackendError) as ctx:
+                for i in range(1000):
+                    backend.write(frame, 1000 + i * 0.1)
+            backend.close()
+
+        self.assertLess(time.monotonic() - inicio, 5)
+        self.assertIn('código 3', str(ctx.exception))
+        self.assertIn('codec roto', str(ctx.exception))
+
+
+class GenerarMiniaturasTests(TestCase):
+    """Una grabación que no se puede decodificar se marca y no se reintenta en cada pasada"""
+
+    def test_failed_decode_not_retried(self):
+        from django.core.management import call_command
+        from django.test import override_settings
+        from .models import Recording
+
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            os.makedirs(os.path.join(media, 'grabaciones'))
+            open(os.path.join(media, 'grabaciones', 'rota.mp4'), 'wb').close()
+            ahora = timezone.now()
+            recording = Recording.objects.create(file='grabaciones/rota.mp4', camera='pc',
+                                                 started_at=ahora, ended_at=ahora)
+            with mock.patch('deteccion.management.commands.generar_miniaturas.generar_miniaturas',
+                            return_value=0) as generar:
+                for _ in range(2):
+                    call_command('generar_miniaturas', stdout=io.StringIO(), stderr=io.StringIO())
+                self.assertEqual(generar.call_count, 1)
+                call_command('generar_miniaturas', '--forzar', stdout=io.StringIO(), stderr=io.StringIO())
+                self.assertEqual(generar.call_count, 2)
+
+        recording.refresh_from_db()
+        self.assertIsNotNone(recording.sprite_failed_at)
+        self.assertEqual(recording.sprite, '')
+
+
+class TranscodificarGrabacionesTests(TestCase):
+    """Al pasar de .avi a .mp4 las alertas enlazadas cambian de nombre y se invalida la caché"""
+
+    def test_rename_bumps_version(self):
+        from django.test import override_settings
+        from .management.commands.transcodificar_grabaciones import Command
+        from .models import Recording
+
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            os.makedirs(os.path.join(media, 'grabaciones'))
+            with open(os.path.join(media, 'grabaciones', 'a.avi'), 'wb') as f:
+                f.write(b'x' * 100)
+            ahora = timezone.now()
+            recording = Recording.objects.create(file='grabaciones/a.avi', camera='pc', started_at=ahora,
+                                                 ended_at=ahora, duration=1, codec='xvid')
+            alerta = Alert.objects.create(message='Persona sin Casco', video='grabaciones/a.avi')
+            version = AlertVersion.current().version
+            recientes = obtener_recientes()
+
+            def transcodificar(src, tmp, **kwargs):
+                with open(tmp, 'wb') as f:
+                    f.write(b'x' * 10)
+
+            comando = 'deteccion.management.commands.transcodificar_grabaciones'
+            with mock.patch(f'{comando}.transcodificar', transcodificar), \
+                    mock.patch(f'{comando}.verificar', return_value=True), \
+                    mock.patch.object(recientes, 'invalidar') as invalidar, \
+                    self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(Command().procesar(recording, False), 90)
+
+            self.assertTrue(os.path.exists(os.path.join(media, 'grabaciones', 'a.mp4')))
+        alerta.refresh_from_db()
+        self.assertEqual(alerta.video.name, 'grabaciones/a.mp4')
+        self.assertEqual(AlertVersion.current().version, version + 1)
+        invalidar.assert_called_once()
+
+
+class GrabadorClipsTests(SimpleTestCase):
+    """solicitar() no abre archivos en el hilo de la cámara y nunca espera sin límite"""
+
+    def test_open_failure_and_full_queue(self):
+        liberar = threading.Event()
+        backends = []
+
+        def fabrica():
+            backends.append(BackendLento(liberar))
+            return backends[-1]
+
+        frame = numpy.zeros((4, 4, 3), numpy.uint8)
+        with tempfile.TemporaryDirectory() as directorio:
+            clips = GrabadorClips(directorio, backend_factory=fabrica, before_seconds=1, after_seconds=0.5,
+                                  base_dir=directorio, queue_size=2, control_timeout=0.5)
+            for i in range(5):
+                clips.submit(frame, 1000 + i * 0.1)
+
+            # La apertura ocurre en el codificador: el nombre se devuelve igual
+            with mock.patch.object(BackendLento, 'open', return_value=False), \
+                    self.assertLogs('deteccion.evidencia', 'ERROR'):
+                fallido = clips.solicitar(1000.4)
+                self.assertTrue(fallido)
+                esperar(clips._queue.empty)
+                time.sleep(0.05)
+            self.assertFalse(os.path.exists(os.path.join(directorio, fallido)))
+
+            nombre = clips.solicitar(1000.4)
+            self.assertNotEqual(nombre, fallido)
+            # El escritor queda bloqueado en el primer frame y la cola se llena
+            esperar(clips._queue.empty)
+            while not clips._queue.full():
+                clips.submit(frame, 1000.5)
+                time.sleep(0.01)
+            inicio = time.monotonic()
+            self.assertEqual(clips.solicitar(1000.6), '')
+            self.assertLess(time.monotonic() - inicio, 1)
+            dia = os.path.join(directorio, os.path.dirname(nombre))
+            self.assertEqual(os.listdir(dia), [os.path.basename(nombre)])
+
+            # Pasado after_seconds el cierre espera lugar en la cola
+            threading.Timer(0.1, liberar.set).start()
+            clips.submit(frame, 1001.0)
+            while not clips._queue.empty():
+                time.sleep(0.01)
+            time.sleep(0.05)
+            self.assertTrue(getattr(backends[1], 'cerrado', False))
+            clips.close()
+
+
+def esperar(condicion, timeout=5):
+    """Espera a que `condicion()` se cumpla (trabajo de otro hilo)"""
+    limite = time.monotonic() + timeout
+    while not condicion():
+        if time.monotonic() > limite:
+            raise AssertionError('Tiempo de espera agotado')
+        time.sleep(0.01)
+
+
+class AlertSinkTests(TransactionTestCase):
+    """Las alertas se escriben por lotes y lo pendiente se escribe al cerrar"""
+
+    def test_batches_and_flush_on_close(self):
+        with tempfile.TemporaryDirectory() as media:
+            sink = AlertSink(media_root=media, batch_size=3, flush_interval=60)
+            for i in range(4):
+                sink.submit({'message': f'Alerta {i}', 'camera': 'pc'})
+            # Un lote completo se escribe sin esperar flush_interval; la cuarta queda en cola
+            esperar(lambda: sink.written == 3)
+            self.assertEqual(Alert.objects.count(), 3)
+
+            sink.actualizar(None, {'message': 'Sin clave'})
+            sink.submit({'message': 'Incidente', 'camera': 'pc'}, key='k1')
+            sink.actualizar('k1', {'frame_count': 7})
+            sink.actualizar('k1', {'frame_count': 9}, cerrar=True)
+            sink.close()
+
+        self.assertEqual(sink.stats()['pending'], 0)
+        self.assertEqual((sink.written, sink.updated, sink.errors, sink.dropped), (5, 1, 1, 0))
+        self.assertEqual(Alert.objects.count(), 5)
+        # Dentro de un lote sólo se aplica la última actualización del incidente
+        self.assertEqual(Alert.objects.get(message='Incidente').frame_count, 9)
+
+    def test_flush_interval(self):
+        with tempfile.TemporaryDirectory() as media:
+            sink = AlertSink(media_root=media, batch_size=100, flush_interval=0.1)
+            sink.submit({'message': 'Sola'})
+            esperar(lambda: sink.written == 1)
+            sink.close()
+        self.assertTrue(Alert.objects.filter(message='Sola').exists())
+
+
+class SinkFalso:
+    """Registra lo que GestorIncidentes envía al AlertSink"""
+
+    def __init__(self):
+        self.creadas = []
+        self.actualizaciones = []
+
+    def submit(self, campos, snapshot=None, snapshot_name=None, key=None, clave_dedup=None):
+        self.creadas.append((key, campos))
+
+    def actualizar(self, key, campos, snapshot=None, snapshot_name=None, cerrar=False, clave_dedup=None):
+        self.actualizaciones.append((key, campos, cerrar))
+
+
+class GestorIncidentesTests(SimpleTestCase):
+    """Un incumplimiento continuo es una sola alerta que se cierra tras el silencio"""
+
+    def test_open_update_close_reopen(self):
+        sink = SinkFalso()
+        gestor = GestorIncidentes(sink, camera='pc', quiet_seconds=10, update_seconds=5)
+
+        self.assertTrue(gestor.observar(['Casco'], timestamp=0))
+        for t in range(1, 5):
+            self.assertFalse(gestor.observar(['Casco'], timestamp=t))
+        self.assertEqual(sink.actualizaciones, [])
+        # Se acumulan los elementos faltantes; la actualización sale cada update_seconds
+        gestor.observar(['Casco', 'Chaleco'], timestamp=5)
+        self.assertEqual(len(sink.creadas), 1)
+        key, campos, cerrar = sink.actualizaciones[-1]
+        self.assertEqual((key, campos['missing'], campos['frame_count'], cerrar),
+                         (sink.creadas[0][0], 'Casco, Chaleco', 6, False))
+
+        # Sin incumplimiento pero dentro del silencio: sigue abierto
+        gestor.observar([], timestamp=12)
+        self.assertFalse(sink.actualizaciones[-1][2])
+        gestor.observar([], timestamp=16)
+        key, campos, cerrar = sink.actualizaciones[-1]
+        self.assertTrue(cerrar)
+        self.assertEqual(campos['closed_at'], campos['last_seen'])
+
+        # Volver a verlo después del cierre abre otro incidente
+        self.assertTrue(gestor.observar(['Casco'], timestamp=30))
+        self.assertEqual(len(sink.creadas), 2)
+        self.assertNotEqual(sink.creadas[0][0], sink.creadas[1][0])
+
+
+class DedupStoreTests(SimpleTestCase):
+    """El incidente activo se comparte entre instancias hasta que vence su ttl"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.path = os.path.join(directorio.name, 'dedup.sqlite3')
+
+    def test_ttl_renew_and_expiry(self):
+        # Dos instancias: cachés separadas, como dos procesos
+        uno, otro = DedupStore(self.path), DedupStore(self.path)
+        self.assertEqual(uno.reclamar('pc', '*', 'Casco', 'a', ttl=10, now=100), (True, 'a'))
+        self.assertEqual(otro.reclamar('pc', '*', 'Casco', 'b', ttl=10, now=105), (False, 'a'))
+        self.assertEqual(otro.reclamar('pc', '*', 'Botas', 'c', ttl=10, now=105), (True, 'c'))
+
+        uno.asociar('a', 42)
+        self.assertEqual(otro.alerta_de('a'), 42)
+
+        # Renovado a los 108 vence a los 118, no a los 110
+        uno.renovar('pc', '*', 'Casco', ttl=10, now=108)
+        self.assertEqual(DedupStore(self.path).reclamar('pc', '*', 'Casco', 'd', ttl=10, now=115), (False, 'a'))
+        # Vencido: otro incidente puede reclamar la clave y pierde la alerta asociada
+        self.assertEqual(DedupStore(self.path).reclamar('pc', '*', 'Casco', 'e', ttl=10, now=119), (True, 'e'))
+        self.assertIsNone(uno.alerta_de('e'))
+
+
+class IncidentesCompartidosTests(TransactionTestCase):
+    """El AlertSink reclama la clave del incidente en su hilo y retoma el de otra instancia"""
+
+    def test_incident_resumed_after_restart(self):
+        hilos = []
+        reclamar = DedupStore.reclamar
+
+        def registrar_hilo(store, *args):
+            hilos.append(threading.current_thread())
+            return reclamar(store, *args)
+
+        with tempfile.TemporaryDirectory() as directorio, \
+                mock.patch.object(DedupStore, 'reclamar', registrar_hilo):
+            path = os.path.join(directorio, 'dedup.sqlite3')
+            sink = AlertSink(media_root=directorio, flush_interval=0.05, dedup=DedupStore(path))
+            GestorIncidentes(sink, camera='pc', quiet_seconds=10).observar(['Casco'], timestamp=100)
+            esperar(lambda: sink.written == 1)
+
+            # La cámara se reinicia (otro proceso): se retoma el incidente en vez de crear otra fila
+            otro = AlertSink(media_root=directorio, flush_interval=0.05, dedup=DedupStore(path))
+            reiniciado = GestorIncidentes(otro, camera='pc', quiet_seconds=10)
+            reiniciado.observar(['Casco'], timestamp=104, confidence=0.9)
+            reiniciado.cerrar()
+            esperar(lambda: otro.updated == 1)
+            self.assertEqual(Alert.objects.count(), 1)
+            alerta = Alert.objects.get()
+            self.assertEqual(alerta.last_seen.timestamp(), 104)
+            self.assertEqual(alerta.closed_at, alerta.last_seen)
+            self.assertEqual(alerta.confidence, 0.0)
+
+            # Vencido el ttl se abre un incidente nuevo
+            reiniciado.observar(['Casco'], timestamp=200)
+            otro.close()
+            sink.close()
+        self.assertEqual(Alert.objects.count(), 2)
+        self.assertEqual(len(hilos), 3)
+        self.assertNotIn(threading.current_thread(), hilos)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN es específico de SQLite')
+class AlertQueryPlanTests(TestCase):
+    """Las consultas que se consultan periódicamente deben usar índices, no recorrer la tabla"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Distribución parecida a producción: casi todo antiguo y resuelto
+        Alert.objects.bulk_create([
+            Alert(message='Persona sin helmet', missing='helmet', missing_mask=1, resolved=i % 10 != 0,
+                  resolution_status='non_compliant' if i % 3 == 0 else 'resolved')
+            for i in range(500)
+        ])
+        Alert.objects.filter(id__lte=450).update(timestamp=timezone.now() - timedelta(days=30))
+        resumenes.reconstruir()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def plan(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, index):
+        plan = self.plan(*queryset.query.sql_with_params())
+        self.assertIn(index, plan)
+        self.assertNotRegex(plan, r'SCAN (TABLE )?deteccion_alert(?! USING)')
+
+    def test_latest_alerts(self):
+        since = timezone.now() - timedelta(hours=24)
+        self.assertUsesIndex(
+            Alert.objects.filter(timestamp__gte=since).order_by('-timestamp')[:10],
+            'alert_ts_status_idx',
+        )
+
+    def test_alert_list(self):
+        since = timezone.now() - timedelta(hours=24)
+        self.assertUsesIndex(
+            Alert.objects.filter(timestamp__gte=since, resolved=False).order_by('-timestamp'),
+            'alert_ts_status_idx',
+        )
+
+    def test_alert_list_after_id(self):
+        # Las novedades se leen por rango de la clave primaria
+        since = timezone.now() - timedelta(hours=24)
+        alerts = Alert.objects.filter(timestamp__gte=since, resolved=False, id__gt=480).order_by('id')[:201]
+        plan = self.plan(*alerts.query.sql_with_params())
+        self.assertIn('INTEGER PRIMARY KEY', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_top_non_compliant_items(self):
+        from .views import get_top_non_compliant_items
+
+        with CaptureQueriesContext(connection) as queries:
+            top_items = get_top_non_compliant_items()
+        self.assertEqual(top_items, [{'missing': 'Casco', 'code': 'helmet', 'count': 167}])
+        plan = self.plan(queries[-1]['sql'])
+        self.assertIn('deteccion_alertrollup', plan)
+
+class ElementosEppTests(TestCase):
+    """Los bits con que se escriben las máscaras son los que se leen de PPEItem"""
+
+    def test_elementos_match_ppeitem(self):
+        self.assertEqual(
+            sorted(epp.ELEMENTOS),
+            sorted(PPEItem.objects.values_list('code', 'name', 'bit')),
+        )
+
+
+class AlertRollupTests(TestCase):
+    """Los resúmenes mantenidos incrementalmente coinciden con una reconstrucción"""
+
+    def snapshot(self):
+        return sorted(
+            AlertRollup.objects.exclude(count=0)
+            .values_list('hour', 'camera', 'level', 'resolved', 'resolution_status', 'missing_mask', 'count')
+        )
+
+    def test_incremental_matches_rebuild(self):
+        alertas = Alert.objects.bulk_create([
+            Alert(message='Persona sin Casco', missing='Casco', missing_mask=1, camera='pc'),
+            Alert(message='Persona sin Casco, Botas', missing='Casco, Botas', missing_mask=5, camera='pc'),
+            Alert(message='Persona sin Chaleco', missing='Chaleco', missing_mask=2, camera='droidcam'),
+        ])
+        resumenes.registrar(alertas)
+        resumenes.actualizar(Alert.objects.filter(pk=alertas[0].pk), missing_mask=3, missing='Casco, Chaleco')
+        resumenes.actualizar(Alert.objects.filter(camera='pc'), resolved=True, resolution_status='non_compliant')
+        resumenes.actualizar(Alert.objects.filter(camera='droidcam'), frame_count=10)
+
+        incremental = self.snapshot()
+        resumenes.reconstruir()
+        self.assertEqual(incremental, self.snapshot())
+        self.assertEqual(sum(row[-1] for row in incremental), 3)
+
+        # Los incrementos posteriores a una reconstrucción caen en las mismas filas
+        filas = AlertRollup.objects.count()
+        resumenes.actualizar(Alert.objects.filter(camera='droidcam'), level='low')
+        resumenes.actualizar(Alert.objects.filter(camera='droidcam'), level='high')
+        self.assertEqual(AlertRollup.objects.exclude(count=0).count(), filas)
+
+    def test_archive_keeps_rollups(self):
+        antiguas = Alert.objects.bulk_create([
+            Alert(message=f'Alerta {i}', missing_mask=1, resolved=i % 2 == 0, resolution_status='resolved')
+            for i in range(5)
+        ])
+        Alert.objects.update(timestamp=timezone.now() - timedelta(days=60))
+        Alert.objects.create(message='Reciente', resolved=True)
+        resumenes.reconstruir()
+        antes = self.snapshot()
+        version = AlertVersion.current().version
+
+        self.assertEqual(archivar(timezone.now() - timedelta(days=30), batch_size=2), 3)
+        self.assertEqual(Alert.objects.count(), 3)
+        self.assertEqual(
+            sorted(AlertArchive.objects.values_list('id', flat=True)),
+            [alerta.pk for alerta in antiguas[::2]],
+        )
+        self.assertGreater(AlertVersion.current().version, version)
+        # Los resúmenes cuentan las archivadas, también tras reconstruir
+        self.assertEqual(self.snapshot(), antes)
+        resumenes.reconstruir()
+        self.assertEqual(self.snapshot(), antes)
+
+    def test_timeseries(self):
+        ahora = timezone.now()
+        alertas = Alert.objects.bulk_create([
+            Alert(message=f'Alerta {i}', missing_mask=3 if i % 2 else 1, level='high' if i < 3 else 'low')
+            for i in range(5)
+        ])
+        Alert.objects.filter(pk=alertas[0].pk).update(timestamp=ahora - timedelta(days=3))
+        resumenes.reconstruir()
+
+        serie = resumenes.serie(ahora - timedelta(days=7), ahora, agrupar='level')
+        self.assertEqual(serie['interval'], 'hour')
+        self.assertEqual(len(serie['buckets']), len(serie['series']['high']))
+        self.assertEqual({nombre: sum(valores) for nombre, valores in serie['series'].items()}, {'high': 3, 'low': 2})
+
+        # Un año no cabe en 500 horas: se agrupa por día
+        serie = resumenes.serie(ahora - timedelta(days=365), ahora, agrupar='item', intervalo='hour')
+        self.assertEqual(serie['interval'], 'day')
+        self.assertLessEqual(len(serie['buckets']), 500)
+        self.assertEqual(sum(serie['series']['helmet']), 5)
+        self.assertEqual(serie['series']['helmet'][-1], 4)
+
+
+class AlertConditionalGetTests(TestCase):
+    """Los endpoints consultados periódicamente responden 304 si no hubo cambios"""
+
+    def setUp(self):
+        obtener_recientes().invalidar()
+
+    def test_latest_alerts_not_modified(self):
+        url = reverse('deteccion:latest_alerts')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # Como mucho se lee la fila de la versión, nunca las alertas
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in queries if '"deteccion_alert"' in q['sql']])
+
+        AlertVersion.bump()
+        obtener_recientes().invalidar()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class BusAlertasTests(SimpleTestCase):
+    """Los clientes SSE reanudan desde Last-Event-ID o reciben un reset"""
+
+    def primer_evento(self, bus, last_event_id):
+        async def leer():
+            flujo = bus.flujo(last_event_id, keepalive=0.1)
+            await flujo.__anext__()  # retry
+            return await flujo.__anext__()
+        return asyncio.run(leer())
+
+    def test_resume_and_reset(self):
+        bus = BusAlertas(history=3)
+        for i in range(5):
+            bus.publicar('creada', {'id': i})
+
+        self.assertIn('event: creada\ndata: {"id":3}', self.primer_evento(bus, bus.id_evento(3)))
+        # Eventos ya descartados del historial, o de otro arranque
+        self.assertIn('event: reset', self.primer_evento(bus, bus.id_evento(1)))
+        self.assertIn('event: reset', self.primer_evento(bus, 'otro-4'))
+
+
+class AlertEventsTests(TransactionTestCase):
+    """El flujo SSE sólo se abre bajo ASGI; bajo WSGI no debe ocupar el hilo"""
+
+    def setUp(self):
+        from .models import User
+        self.user = User.objects.create(username='eventos', email='eventos@example.com')
+
+    def test_wsgi_no_content(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('deteccion:alert_events'))
+        self.assertEqual(response.status_code, 204)
+
+    def test_asgi_stream(self):
+        from django.test import AsyncClient
+
+        async def primer_bloque():
+            client = AsyncClient()
+            await client.aforce_login(self.user)
+            response = await client.get(reverse('deteccion:alert_events'))
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            return await anext(aiter(response.streaming_content))
+        self.assertEqual(asyncio.run(primer_bloque()), b'retry: 3000\n\n')
+
+
+class AlertasRecientesTests(TestCase):
+    """Las alertas recientes se sirven de memoria y piden la base sólo si falta algo"""
+
+    def setUp(self):
+        self.alertas = Alert.objects.bulk_create([Alert(message=f'Alerta {i}') for i in range(8)])
+        self.recientes = AlertasRecientes(size=5, check_interval=60)
+
+    def test_pages_from_memory(self):
+        ids = [alerta.pk for alerta in self.alertas]
+        self.recientes.version()
+
+        with self.assertNumQueries(0):
+            filas, cursores = self.recientes.pagina(limit=3)
+            self.assertEqual([fila['id'] for fila in filas], ids[:-4:-1])
+            self.assertTrue(cursores['has_more'])
+
+            filas, cursores = self.recientes.pagina(after_id=ids[5])
+            self.assertEqual([fila['id'] for fila in filas], ids[6:])
+            self.assertEqual(cursores['after_id'], ids[-1])
+
+            # Más antiguas que lo guardado en memoria: debe ir a la base
+            self.assertIsNone(self.recientes.pagina(after_id=ids[0]))
+            self.assertIsNone(self.recientes.pagina(limit=10))
+
+    def test_bus_events_update_memory(self):
+        self.recientes.version()
+        alerta = Alert.objects.create(message='Nueva')
+        self.recientes.aplicar('creada', datos_alerta(alerta))
+        AlertVersion.bump()
+
+        filas, _ = self.recientes.pagina(limit=1)
+        self.assertEqual(filas[0]['id'], alerta.pk)
+
+
+class ResolverAlertasTests(TestCase):
+    """La resolución en bloque no pisa las alertas ya resueltas ni sus notas"""
+
+    def test_only_unresolved_and_keep_notes(self):
+        from .alertas import resolver_alertas
+        from .models import User
+
+        antes, ahora = [User.objects.create(username=n, email=f'{n}@example.com') for n in ('antes', 'ahora')]
+        resuelta, pendiente = Alert.objects.bulk_create([
+            Alert(message='Resuelta', resolved=True, resolution_status='false_positive',
+                  resolution_notes='Era un reflejo', resolved_by=antes),
+            Alert(message='Pendiente', resolution_notes='Revisar mañana'),
+        ])
+
+        self.assertEqual(resolver_alertas(Alert.objects.all(), ahora, status='non_compliant'), 1)
+        resuelta.refresh_from_db()
+        pendiente.refresh_from_db()
+        self.assertEqual((resuelta.resolution_status, resuelta.resolved_by, resuelta.resolution_notes),
+                         ('false_positive', antes, 'Era un reflejo'))
+        self.assertEqual((pendiente.resolution_status, pendiente.resolved_by, pendiente.resolution_notes),
+                         ('non_compliant', ahora, 'Revisar mañana'))
+
+        resolver_alertas(Alert.objects.filter(pk=resuelta.pk), ahora, notes='Revisado', only_unresolved=False)
+        resuelta.refresh_from_db()
+        self.assertEqual((resuelta.resolution_status, resuelta.resolution_notes), ('resolved', 'Revisado'))
+
+    def test_resolved_meanwhile_is_skipped(self):
+        from .alertas import resolver_alertas
+        from .models import User
+
+        usuario = User.objects.create(username='ahora', email='ahora@example.com')
+        alertas = Alert.objects.bulk_create([Alert(message=f'Alerta {i}') for i in range(3)])
+        resumenes.registrar(alertas)
+        actualizar = resumenes.actualizar
+
+        def resuelta_por_otro(queryset, **campos):
+            # Otro usuario resuelve la última mientras se procesa el primer lote
+            if not Alert.objects.filter(resolution_status='false_positive').exists():
+                actualizar(Alert.objects.filter(pk=alertas[2].pk), resolved=True,
+                           resolution_status='false_positive')
+            return actualizar(queryset, **campos)
+
+        with mock.patch.object(resumenes, 'actualizar', side_effect=resuelta_por_otro), \
+                mock.patch('deteccion.alertas.obtener_bus') as bus:
+            self.assertEqual(resolver_alertas(Alert.objects.all(), usuario, batch_size=2), 2)
+
+        self.assertEqual(Alert.objects.get(pk=alertas[2].pk).resolution_status, 'false_positive')
+        evento = bus.return_value.publicar.call_args
+        self.assertEqual(evento.args[0], 'resueltas')
+        self.assertEqual(evento.args[1]['count'], 2)
+        self.assertNotIn('ids', evento.args[1])
+        incremental = AlertRollupTests.snapshot(self)
+        resumenes.reconstruir()
+        self.assertEqual(incremental, AlertRollupTests.snapshot(self))
+
+
+class ExportarAlertasTests(TestCase):
+    """La exportación recorre alertas y archivo por lotes con los filtros aplicados"""
+
+    @classmethod
+    def setUpTestData(cls):
+        PPEItem.objects.get_or_create(code='vest', defaults={'name': 'Chaleco', 'bit': 2})
+        Alert.objects.bulk_create([
+            Alert(message=f'Alerta {i}\n"con comillas"', missing_mask=2 if i % 2 else 1,
+                  level='high' if i < 6 else 'low', resolved=True)
+            for i in range(10)
+        ])
+        Alert.objects.filter(id__in=Alert.objects.order_by('id').values('id')[:4]).update(
+            timestamp=timezone.now() - timedelta(days=60)
+        )
+        archivar(timezone.now() - timedelta(days=30))
+
+    def test_csv(self):
+        texto = ''.join(exportar.csv_filas(chunk_size=3))
+        filas = list(csv.reader(io.StringIO(texto)))
+        self.assertEqual(filas[0], [nombre for nombre, _ in exportar.COLUMNAS])
+        self.assertEqual(len(filas), 11)
+        self.assertEqual(filas[1][8], 'Alerta 0\n"con comillas"')
+
+        filtros = exportar.filtros(level='high', item='vest')
+        self.assertEqual(exportar.escribir_csv(io.StringIO(), chunk_size=2, **filtros), 3)
+        with self.assertRaises(ValueError):
+            exportar.filtros(desde='ayer')
+
+    @skipUnless(importlib.util.find_spec('polars'), 'Parquet necesita polars')
+    def test_parquet(self):
+        import polars as pl
+
+        with tempfile.TemporaryFile() as archivo:
+            self.assertEqual(exportar.escribir_parquet(archivo, chunk_size=3), 10)
+            archivo.seek(0)
+            df = pl.read_parquet(archivo)
+        self.assertEqual(df.columns, [nombre for nombre, _ in exportar.COLUMNAS])
+        self.assertEqual(sorted(df['id'].to_list()), sorted(
+            list(Alert.objects.values_list('id', flat=True)) + list(AlertArchive.objects.values_list('id', flat=True))
+        ))
+        self.assertEqual(df.filter(pl.col('missing') == 'Chaleco').height, 5)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 es específico de SQLite')
+class BusquedaAlertasTests(TestCase):
+    """El índice FTS5 sigue a las alertas y al archivo mediante triggers"""
+
+    def buscar(self, modelo, texto):
+        return [alerta.pk for alerta in busqueda.filtrar(modelo.objects.all(), texto)]
+
+    def test_triggers_and_ranking(self):
+        casco, chaleco, otra = Alert.objects.bulk_create([
+            Alert(message='Persona sin Casco', missing='Casco'),
+            Alert(message='Persona sin Chaleco', missing='Chaleco'),
+            Alert(message='Persona sin Botas', missing='Botas'),
+        ])
+        resumenes.actualizar(
+            Alert.objects.filter(pk=chaleco.pk), resolved=True,
+            resolution_notes='El camión tapaba la cámara; el casco estaba bien puesto',
+        )
+        # Sin tildes y por prefijo; las notas también cuentan
+        self.assertEqual(self.buscar(Alert, 'camion camar'), [chaleco.pk])
+        self.assertEqual(sorted(self.buscar(Alert, 'casco')), [casco.pk, chaleco.pk])
+        self.assertEqual(self.buscar(Alert, 'casco')[0], casco.pk)
+        self.assertEqual(self.buscar(Alert, '" OR *'), [])
+
+        Alert.objects.filter(pk=chaleco.pk).update(timestamp=timezone.now() - timedelta(days=60))
+        archivar(timezone.now() - timedelta(days=30))
+        self.assertEqual(self.buscar(Alert, 'camion'), [])
+        self.assertEqual(self.buscar(AlertArchive, 'camion'), [chaleco.pk])
+
+        Alert.objects.filter(pk=otra.pk).delete()
+        self.assertEqual(self.buscar(Alert, 'botas'), [])
+
+
+class AlertAdminTests(TestCase):
+    """El listado del admin no cuenta ni trunca fechas de toda la tabla"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from .models import User
+        cls.user = User.objects.create(username='admin', email='admin@example.com', is_staff=True, is_superuser=True)
+        Alert.objects.bulk_create([Alert(message='Persona sin Casco', missing='Casco') for _ in range(30)])
+        for i, alerta in enumerate(Alert.objects.order_by('id')):
+            Alert.objects.filter(pk=alerta.pk).update(timestamp=timezone.now() - timedelta(days=20 * i, hours=i))
+
+    def changelist(self, **params):
+        from django.contrib import admin
+        from django.test import RequestFactory
+
+        request = RequestFactory().get('/admin/deteccion/alert/', params)
+        request.user = self.user
+        return admin.site._registry[Alert].get_changelist_instance(request)
+
+    def test_date_hierarchy_matches_datetimes(self):
+        from django.db.models import QuerySet
+        from .admin import FechasIndexadasQuerySet
+
+        alertas = FechasIndexadasQuerySet(Alert)
+        for kind in ('year', 'month', 'day'):
+            self.assertEqual(
+                list(alertas.datetimes('timestamp', kind)),
+                list(QuerySet(Alert).datetimes('timestamp', kind)),
+            )
+
+    def test_bounded_count_and_cursor(self):
+        from urllib.parse import parse_qsl
+        from django.contrib import admin
+        from .admin import ConteoAcotadoPaginator
+
+        vistas = []
+        params = {}
+        with mock.patch.object(ConteoAcotadoPaginator, 'LIMITE', 12), \
+                mock.patch.object(admin.site._registry[Alert], 'list_per_page', 10):
+            while True:
+                cl = self.changelist(**params)
+                vistas += [alerta.pk for alerta in cl.result_list]
+                if not cl.anteriores_url:
+                    break
+                self.assertEqual(cl.result_count, 13)
+                params = dict(parse_qsl(cl.anteriores_url[1:]))
+        # Tres páginas por cursor, sin repetir ni saltar filas
+        self.assertEqual(vistas, list(Alert.objects.order_by('-timestamp').values_list('pk', flat=True)))
+
+    def test_change_and_delete_keep_rollups(self):
+        from django.contrib import admin
+        from django.test import RequestFactory
+
+        modelo = admin.site._registry[Alert]
+        request = RequestFactory().post('/admin/deteccion/alert/')
+        request.user = self.user
+        resumenes.reconstruir()
+        version = AlertVersion.current().version
+
+        alerta = Alert.objects.order_by('id').first()
+        alerta.resolved, alerta.resolution_status = True, 'false_positive'
+        modelo.save_model(request, alerta, None, change=True)
+        modelo.delete_model(request, Alert.objects.order_by('id').last())
+        modelo.delete_queryset(request, Alert.objects.filter(pk__in=Alert.objects.order_by('id').values('pk')[1:4]))
+
+        self.assertEqual(Alert.objects.count(), 26)
+        self.assertEqual(AlertVersion.current().version, version + 3)
+        incremental = AlertRollupTests.snapshot(self)
+        resumenes.reconstruir()
+        self.assertEqual(incremental, AlertRollupTests.snapshot(self))
@@ -0,0 +1,95 @@
+import json
+import logging
+import shutil
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+
+def tramos_con_personas(timeline, padding=1):
+    """
+    Tramos (inicio, fin) en segundos con al menos una persona según la línea
+    de tiempo empaquetada (personas, incumplimientos), ampliados `padding`
+    segundos a cada lado y fusionados.
+    """
+    data = bytes(timeline)
+    total = len(data) // 2
+    tramos = []
+    for second in range(total):
+        if not data[second * 2]:
+            continue
+        start, end = max(0, second - padding), min(total, second + 1 + padding)
+        if tramos and start <= tramos[-1][1]:
+            tramos[-1] = (tramos[-1][0], max(tramos[-1][1], end))
+        else:
+            tramos.append((start, end))
+    return tramos
+
+
+def compactar_timeline(timeline, tramos):
+    """Línea de tiempo con sólo los segundos conservados"""
+    data = bytes(timeline)
+    return b''.join(data[start * 2:end * 2] for start, end in tramos)
+
+
+def _prefijo_baja_prioridad(nice):
+    """nice (CPU) e ionice clase idle (disco) si están disponibles"""
+    prefijo = []
+    if nice is not None and shutil.which('nice'):
+        prefijo += ['nice', '-n', str(nice)]
+    if shutil.which('ionice'):
+        prefijo += ['ionice', '-c', '3']
+    return prefijo
+
+
+def verificar(path, expected_seconds=None, codec='h264', ffprobe_bin='ffprobe'):
+    """
+    Comprueba con ffprobe que el archivo se lea completo: códec esperado,
+    paquetes de video y duración cercana a la esperada.
+    """
+    cmd = [
+        ffprobe_bin, '-v', 'error', '-select_streams', 'v:0', '-count_packets',
+        '-show_entries', 'stream=codec_name,nb_read_packets:format=duration',
+        '-of', 'json', path,
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, check=True, timeout=300)
+        info = json.loads(result.stdout)
+        stream = info['streams'][0]
+        duration = float(info['format']['duration'])
+    except (OSError, subprocess.SubprocessError, ValueError, KeyError, IndexError) as e:
+        logger.error(f"ffprobe no pudo leer {path}: {e}")
+        return False
+    if stream.get('codec_name') != codec or int(stream.get('nb_read_packets', 0)) == 0:
+        return False
+    if expected_seconds:
+        # Tolerancia por redondeo del GOP y del último segundo
+        return abs(duration - expected_seconds) <= max(2.0, expected_seconds * 0.1)
+    return True
+
+
+def transcodificar(src, dst, fps=5, preset='slow', crf=30, threads=1, tramos=None,
+                   ffmpeg_bin='ffmpeg', nice=19):
+    """
+    Recodifica `src` en H.264 de calidad de archivo (MP4 con faststart).
+
+    Con `tramos` sólo se conservan esos intervalos (en segundos) y las marcas
+    de tiempo se reescriben para que queden contiguos. Se ejecuta con
+    prioridad mínima para no competir con la inferencia en vivo.
+    """
+    filtros = [f'fps={fps}']
+    if tramos:
+        condicion = '+'.join(f'between(t,{start},{end - 0.001:.3f})' for start, end in tramos)
+        filtros += [f"select='{condicion}'", 'setpts=N/FRAME_RATE/TB']
+    cmd = _prefijo_baja_prioridad(nice) + [
+        ffmpeg_bin, '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', src,
+        '-vf', ','.join(filtros),
+        '-an',
+        '-c:v', 'libx264', '-preset', preset, '-crf', str(crf),
+        '-threads', str(threads),
+        '-pix_fmt', 'yuv420p',
+        '-movflags', '+faststart',
+        '-f', 'mp4', dst,
+    ]
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
@@ -16,6 +16,11 @@ urlpatterns = [
 
     # URLs para la cámara
     path('video_feed/', views.video_feed, name='video_feed'),
+    path('detections_feed/', views.detections_feed, name='detections_feed'),
+    path('inicio/alerts/events/', views.alert_events, name='alert_events'),
+    path('live/', views.live_hls, name='live_hls'),
+    path('live/hls/live.m3u8', views.hls_playlist, name='hls_playlist'),
+    path('live/hls/<str:name>', views.hls_segment, name='hls_segment'),
     path('toggle_camera/', views.toggle_camera, name='toggle_camera'),
     path('grabaciones/', views.grabaciones, name='grabaciones'),
 
@@ -23,9 +28,13 @@ urlpatterns = [
 ##alertas
     path('inicio/alerts/', views.alert_list, name='alert_data'),
     path('inicio/alerts/list/', views.alert_list_page, name='alert_list'),
+    path('inicio/alerts/search/', views.alert_search, name='alert_search'),
     path('inicio/latest-alerts/', views.latest_alerts, name='latest_alerts'),
     path('inicio/alerts/resolve/<int:alert_id>/', views.resolve_alert, name='resolve_alert'),
+    path('inicio/alerts/resolve/bulk/', views.resolve_alerts_bulk, name='resolve_alerts_bulk'),
+    path('inicio/alerts/export/', views.export_alerts, name='export_alerts'),
     path('inicio/alerts/statistics/', views.alert_statistics, name='alert_statistics'),
+    path('inicio/alerts/timeseries/', views.alert_timeseries, name='alert_timeseries'),
     path('inicio/alerts/modal/<int:alert_id>/', views.alert_resolution_modal, name='alert_resolution_modal'),
     
     path('inicio/incunplimiento/<int:incumplimiento_id>/', views.ver_incumplimiento, name='incunplimiento'),
@@ -1,28 +1,50 @@
 # deteccion/views.py
 from django.shortcuts import render, redirect
 from django.http import StreamingHttpResponse, JsonResponse
-from django.db.models import Q
+from django.db.models import F, Q
 from .camera import VideoCamera
 from .droidcam import DroidCamera
+from .detecciones import serializar
+from .streaming import HLSStreamer
+from .grabacion import crear_backend_factory
+from .evidencia import GrabadorClips
+from .alertas import obtener_sink, resolver_alertas
+from .eventos import datos_alerta, obtener_bus
+from .recientes import obtener_recientes
+from . import busqueda, epp, exportar, resumenes
+import tempfile
 import json
+import re
+import threading
+import time
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.cache import cache
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.urls import reverse_lazy,reverse
 from django.contrib import messages
 from django.contrib.auth import logout, authenticate, login
 from django.contrib.auth.decorators import login_required,user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
-from .models import Menu, Module, Cargo, Empleado, GroupModulePermission,User, Alert
+from .models import Menu, Module, Cargo, Empleado, GroupModulePermission,User, Alert, Recording, PPEItem, AlertRollup, AlertVersion, AlertArchive
 from .forms import MenuForm, ModuleForm, CargoForm, EmpleadoForm, LoginForm, GroupForm, GroupModulePermissionForm
 from .forms import UserForm,UserEditForm,UserPasswordChangeForm
 from django.db.models import Prefetch
+from django.core.paginator import Paginator
+from django.utils.dateparse import parse_date, parse_datetime
 import os
 from django.utils import timezone
 from datetime import timedelta
 from django.utils.timezone import localtime
-from django.db import models
 from .models import Capacitacion, ProgresoCapacitacion, Certificado
 
 camera = None 
+camera_lock = threading.Lock()  # get_frame no es seguro entre hilos
+mjpeg_viewers = 0
+mjpeg_viewers_lock = threading.Lock()
 class MenuContextMixin:
     """Mixin para agregar el contexto de menús y módulos a las vistas."""
     def get_menu_context(self, user):
@@ -90,10 +112,14 @@ def inicio(request):
         return redirect('deteccion:inicio_trabajador')
     # Obtener el contexto de menús para el usuario actual
     menu_context = MenuContextMixin().get_menu_context(request.user)
-    # Obtener las últimas alertas (las 6 más recientes)
+    # Obtener las últimas alertas (las 6 más recientes), de memoria si es posible
     try:
-        # Forzar evaluación aquí para atrapar errores de DB (p. ej. tabla no existe)
-        latest_alerts = list(Alert.objects.filter(resolved=False).order_by('-timestamp')[:6])
+        page = obtener_recientes().pagina(limit=6, filtro=lambda alerta: not alerta['resolved'])
+        if page is not None:
+            latest_alerts = page[0]
+        else:
+            alerts = Alert.objects.filter(resolved=False).order_by('-timestamp')[:6]
+            latest_alerts = [datos_alerta(alerta) for alerta in alerts]
     except Exception:
         latest_alerts = []
 
@@ -157,9 +183,40 @@ def logout_view(request):
     # Redirige a la vista de login (debes asegurar que esta URL funcione).
     return redirect('deteccion:login') 
 
+@login_required
 def grabaciones(request):
-    """Muestra la página con el listado de grabaciones."""
-    return render(request, 'deteccion/grabaciones.html')
+    """Listado de grabaciones con acceso directo a los momentos con incumplimientos."""
+    camara = request.GET.get('camara', '')
+    fecha = request.GET.get('fecha', '')
+    solo_incumplimientos = request.GET.get('incumplimientos') == '1'
+
+    recordings = Recording.objects.all()
+    if camara:
+        recordings = recordings.filter(camera=camara)
+    if fecha and parse_date(fecha):
+        recordings = recordings.filter(started_at__date=parse_date(fecha))
+    if solo_incumplimientos:
+        recordings = recordings.filter(violation_seconds__gt=0)
+
+    page = Paginator(recordings, 20).get_page(request.GET.get('page'))
+    for rec in page:
+        # Bandas de la línea de tiempo en porcentaje de la duración
+        total = max(len(rec.timeline) // 2, 1)
+        rec.bands = [
+            {'start': start, 'left': start * 100 / total, 'width': max((end - start) * 100 / total, 0.5)}
+            for start, end in rec.violation_ranges()
+        ]
+
+    context = {
+        'menu_list': MenuContextMixin().get_menu_context(request.user),
+        'title': 'Grabaciones',
+        'page_obj': page,
+        'camaras': Recording.objects.values_list('camera', flat=True).distinct().order_by('camera'),
+        'camara': camara,
+        'fecha': fecha,
+        'solo_incumplimientos': solo_incumplimientos,
+    }
+    return render(request, 'grabaciones/lista.html', context)
 
 
 
@@ -327,19 +384,80 @@ class ModuleListView(LoginRequiredMixin, ListView):
 
 # ----------------------------------------------------
 # Funciones para la cámara
-def gen_frames():
-    global camera
-    while True:
-        if camera:
-            frame = camera.get_frame()
+def gen_frames(annotate=True):
+    global mjpeg_viewers
+    with mjpeg_viewers_lock:
+        mjpeg_viewers += 1
+    try:
+        while True:
+            current = camera
+            if not current:
+                time.sleep(0.1)
+                continue
+            with camera_lock:
+                frame = current.get_frame(annotate=annotate)
             if frame:
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+    finally:
+        with mjpeg_viewers_lock:
+            mjpeg_viewers -= 1
 
 def video_feed(request):
-    return StreamingHttpResponse(gen_frames(),
+    # ?raw=1 entrega el frame sin anotar (el navegador dibuja las detecciones)
+    annotate = request.GET.get('raw') not in ('1', 'true')
+    return StreamingHttpResponse(gen_frames(annotate=annotate),
                                content_type='multipart/x-mixed-replace; boundary=frame')
 
+def gen_detections():
+    """Eventos SSE con los metadatos de detección de cada frame"""
+    last_camera = None
+    last_seq = None
+    while True:
+        current = camera
+        if current is None:
+            yield ': keepalive\n\n'
+            time.sleep(1)
+            continue
+        if current is not last_camera:
+            # Cámara nueva: enviar primero el mapa id -> nombre de clase
+            last_camera, last_seq = current, None
+            yield f"event: classes\ndata: {serializar(current.model.names)}\n\n"
+        meta = current.detecciones.esperar(last_seq, timeout=15)
+        if meta is None:
+            yield ': keepalive\n\n'
+            continue
+        last_seq = meta['seq']
+        yield f"id: {last_seq}\ndata: {serializar(meta)}\n\n"
+
+async def alert_events(request):
+    """
+    Eventos SSE de alertas creadas, actualizadas y resueltas. Requiere ASGI
+    para no ocupar un hilo por cliente; el navegador reanuda con
+    Last-Event-ID y, si la conexión falla, vuelve a consultar latest_alerts.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    if not isinstance(request, ASGIRequest):
+        # Bajo WSGI (runserver) Django consume el flujo entero antes de enviar
+        # nada y el hilo queda ocupado para siempre. Con 204 el navegador no
+        # reintenta y las páginas siguen consultando periódicamente.
+        return HttpResponse(status=204)
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    flujo = obtener_bus().flujo(last_event_id, keepalive=settings.ALERTAS_EVENTOS_KEEPALIVE_SECONDS)
+    response = StreamingHttpResponse(flujo, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+def detections_feed(request):
+    response = StreamingHttpResponse(gen_detections(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 def toggle_camera(request):
     global camera
     if request.method == 'POST':
@@ -359,10 +477,49 @@ def toggle_camera(request):
         
         if action == 'start':
             if not camera:
+                tracking = getattr(settings, 'DETECCION_TRACKING', False)
+                backend = crear_backend_factory(
+                    settings.GRABACION_BACKEND,
+                    fps=settings.GRABACION_FPS,
+                    ffmpeg_bin=settings.FFMPEG_BIN,
+                    preset=settings.GRABACION_X264_PRESET,
+                    crf=settings.GRABACION_X264_CRF,
+                    threads=settings.GRABACION_X264_THREADS,
+                )
+                clips = GrabadorClips(
+                    os.path.join(settings.CLIPS_DIR, camera_type),
+                    backend_factory=backend,
+                    before_seconds=settings.CLIP_ANTES_SECONDS,
+                    after_seconds=settings.CLIP_DESPUES_SECONDS,
+                    base_dir=settings.MEDIA_ROOT,
+                )
                 if camera_type == 'droidcam':
-                    camera = DroidCamera(ip_address=ip, port=port)
+                    camera = DroidCamera(
+                        ip_address=ip, port=port, tracking=tracking, clips=clips,
+                        incident_quiet_seconds=settings.INCIDENTE_SILENCIO_SECONDS,
+                    )
                 else:
-                    camera = VideoCamera()
+                    camera = VideoCamera(
+                        tracking=tracking,
+                        pre_roll_seconds=getattr(settings, 'GRABACION_PRE_ROLL_SECONDS', 5),
+                        post_roll_seconds=getattr(settings, 'GRABACION_POST_ROLL_SECONDS', 5),
+                        recording_backend=backend,
+                        clips=clips,
+                        incident_quiet_seconds=settings.INCIDENTE_SILENCIO_SECONDS,
+                        recordings_dir=os.path.join(settings.GRABACIONES_DIR, 'pc'),
+                        media_root=settings.MEDIA_ROOT,
+                        segment_seconds=settings.GRABACION_SEGMENT_SECONDS,
+                        segment_max_bytes=settings.GRABACION_SEGMENT_MAX_MB * 1024 * 1024,
+                    )
+                if getattr(settings, 'LIVE_HLS_ENABLED', False):
+                    camera.hls = HLSStreamer(
+                        settings.LIVE_HLS_DIR,
+                        threads=settings.LIVE_HLS_THREADS,
+                        segment_seconds=settings.LIVE_HLS_SEGMENT_SECONDS,
+                        list_size=settings.LIVE_HLS_LIST_SIZE,
+                        ffmpeg_bin=settings.FFMPEG_BIN,
+                    )
+                    threading.Thread(target=drive_hls, args=(camera,), daemon=True).start()
             camera.start()
             return JsonResponse({'status': 'started', 'camera_type': camera_type})
             
@@ -373,6 +530,52 @@ def toggle_camera(request):
             return JsonResponse({'status': 'stopped'})
             
     return JsonResponse({'status': 'error'}, status=400)
+
+def drive_hls(cam):
+    """Procesa frames para el stream HLS mientras no haya visores MJPEG"""
+    while camera is cam:
+        if mjpeg_viewers > 0:
+            # Los visores MJPEG ya llaman a get_frame, que alimenta el HLS
+            time.sleep(0.5)
+            continue
+        with camera_lock:
+            frame = cam.get_frame()
+        if frame is None:
+            time.sleep(0.1)
+
+HLS_SEGMENT_RE = re.compile(r'^seg_\d+\.ts$')
+
+@login_required
+def live_hls(request):
+    """Página con el stream H.264 (HLS) para supervisores remotos"""
+    context = {
+        'menu_list': MenuContextMixin().get_menu_context(request.user),
+        'hls_enabled': getattr(settings, 'LIVE_HLS_ENABLED', False),
+    }
+    return render(request, 'camara/live_hls.html', context)
+
+@login_required
+def hls_playlist(request):
+    path = os.path.join(settings.LIVE_HLS_DIR, HLSStreamer.PLAYLIST)
+    if not os.path.exists(path):
+        raise Http404("Stream HLS no disponible")
+    response = FileResponse(open(path, 'rb'), content_type='application/vnd.apple.mpegurl')
+    # La playlist cambia con cada segmento nuevo
+    response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    return response
+
+@login_required
+def hls_segment(request, name):
+    if not HLS_SEGMENT_RE.match(name):
+        raise Http404
+    path = os.path.join(settings.LIVE_HLS_DIR, name)
+    if not os.path.exists(path):
+        raise Http404
+    response = FileResponse(open(path, 'rb'), content_type='video/mp2t')
+    # Un segmento publicado nunca cambia: la numeración empieza en el
+    # instante de inicio de cada sesión, así que un nombre no se reutiliza
+    response['Cache-Control'] = 'private, max-age=60, immutable'
+    return response
 # ----------------------------------------------------
 
 
@@ -788,7 +991,10 @@ LOCALSTACK_ENDPOINT = 'http://localhost:4566'
 
 def ver_incumplimiento(request, incumplimiento_id):
     """Muestra detalles del incumplimiento - para archivos locales"""
-    incumplimiento = get_object_or_404(Alert, pk=incumplimiento_id)
+    incumplimiento = Alert.objects.filter(pk=incumplimiento_id).first()
+    if incumplimiento is None:
+        # Las alertas archivadas conservan su id
+        incumplimiento = get_object_or_404(AlertArchive, pk=incumplimiento_id)
     
     image_url = None
     debug_info = ""
@@ -819,9 +1025,20 @@ def ver_incumplimiento(request, incumplimiento_id):
                 image_url = alternative_paths[0]
                 print(f"✅ Imagen alternativa encontrada: {image_url}")
     
+    # El clip se escribe en segundo plano: puede no existir aún
+    clip_url = None
+    clip_pending = False
+    if incumplimiento.clip:
+        if os.path.exists(os.path.join(settings.MEDIA_ROOT, incumplimiento.clip.name)):
+            clip_url = incumplimiento.clip.url
+        else:
+            clip_pending = True
+
     context = {
         'incumplimiento': incumplimiento,
         'image_url': image_url,
+        'clip_url': clip_url,
+        'clip_pending': clip_pending,
         'debug_info': debug_info,
         'title': f'Incumplimiento ID: {incumplimiento_id}'
     }
@@ -844,26 +1061,164 @@ def find_alternative_image(alert_id, original_path):
     return possible_files
 
 
+def _alert_version(request):
+    # Versión cacheada del proceso: se lee de la base como mucho una vez por
+    # ALERTAS_RECIENTES_VERIFICAR_SECONDS
+    if not hasattr(request, '_alert_version'):
+        request._alert_version = obtener_recientes().version()
+    return request._alert_version
+
+
+def alert_etag(request, *args, **kwargs):
+    # La hora en curso forma parte de la versión porque las ventanas de 24
+    # horas cambian aunque no se modifique ninguna alerta
+    hour = resumenes.hora(timezone.now())
+    return f"{_alert_version(request).version}-{int(hour.timestamp())}"
+
+
+def alert_last_modified(request, *args, **kwargs):
+    return max(_alert_version(request).updated_at, resumenes.hora(timezone.now()))
+
+
+# Respuestas condicionales para los endpoints que se consultan periódicamente:
+# el navegador revalida con If-None-Match y recibe 304 sin leer las alertas
+alert_conditional = condition(etag_func=alert_etag, last_modified_func=alert_last_modified)
+alert_revalidate = cache_control(private=True, no_cache=True)
+
+
+ALERT_PAGE_MAX = 200
+ALERT_LEVELS = dict(Alert.LEVEL_CHOICES)
+
+
+def cursor_params(request, default_limit=None):
+    """(after_id, before, limit) de la consulta, o None si no son válidos"""
+    try:
+        after_id = int(request.GET['after_id']) if request.GET.get('after_id') else None
+        before = int(request.GET['before']) if request.GET.get('before') else None
+        limit = int(request.GET['limit']) if request.GET.get('limit') else default_limit
+    except ValueError:
+        return None
+    if limit is not None:
+        limit = max(1, min(limit, ALERT_PAGE_MAX))
+    return after_id, before, limit
+
+
+def alert_page(request, alerts, order, default_limit=None):
+    """
+    Paginación por cursor (keyset) sobre el id de la alerta:
+
+    - `after_id`: alertas posteriores al id, en orden ascendente, para pedir
+      sólo lo nuevo desde la última consulta.
+    - `before`: la página anterior al id, en orden descendente.
+    - sin cursor: las más recientes según `order`.
+
+    `limit` acota la página (hasta ALERT_PAGE_MAX). Devuelve (filas, cursores)
+    o None si los parámetros no son válidos; las filas son `values()` sin
+    instanciar modelos.
+    """
+    params = cursor_params(request, default_limit)
+    if params is None:
+        return None
+    after_id, before, limit = params
+
+    if after_id is not None:
+        alerts = alerts.filter(id__gt=after_id).order_by('id')
+    elif before is not None:
+        alerts = alerts.filter(id__lt=before).order_by('-id')
+    else:
+        alerts = alerts.order_by(*order)
+
+    rows = list(alerts[:limit + 1] if limit is not None else alerts)
+    has_more = limit is not None and len(rows) > limit
+    rows = rows[:limit]
+
+    ids = [row['id'] for row in rows]
+    cursors = {
+        # Cursor para la siguiente consulta de novedades
+        'after_id': max(ids + [after_id or 0]),
+        # Cursor para la página anterior (None si no hay más)
+        'before': min(ids) if has_more and after_id is None else None,
+        'has_more': has_more,
+    }
+    return rows, cursors
+
+
+def _media_url(field, name):
+    return Alert._meta.get_field(field).storage.url(name) if name else ''
+
+
+@alert_revalidate
+@alert_conditional
 def alert_list(request):
     # Obtenemos alertas no resueltas de las últimas 24 horas
     since = timezone.now() - timedelta(hours=24)
-    alerts = Alert.objects.filter(timestamp__gte=since, resolved=False).order_by('-timestamp')
-    
+    alerts = Alert.objects.filter(timestamp__gte=since, resolved=False).values(*ALERT_ROW_FIELDS)
+    page = alert_page(request, alerts, ['-timestamp'])
+    if page is None:
+        return JsonResponse({'success': False, 'error': 'Parámetros de paginación inválidos'}, status=400)
+    rows, cursors = page
+    return JsonResponse({'alerts': [_alert_row(alert) for alert in rows], **cursors})
+
+
+ALERT_ROW_FIELDS = (
+    'id', 'message', 'missing', 'level', 'video', 'clip', 'camera', 'frame_count',
+    'closed_at', 'last_seen', 'timestamp', 'resolved', 'resolution_status', 'resolved_at',
+)
+
+
+def _alert_row(alert):
+    """Fila de alert_list a partir de `values(*ALERT_ROW_FIELDS)`"""
+    return {
+        'id': alert['id'],
+        'message': alert['message'],
+        'missing': alert['missing'],
+        'level': ALERT_LEVELS.get(alert['level'], alert['level']),
+        'video_url': _media_url('video', alert['video']),
+        'clip_url': _media_url('clip', alert['clip']),
+        'camera': alert['camera'],
+        'frame_count': alert['frame_count'],
+        'open': alert['closed_at'] is None,
+        'last_seen': localtime(alert['last_seen']).strftime('%Y-%m-%d %H:%M:%S') if alert['last_seen'] else None,
+        'timestamp': alert['timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
+        'resolved': alert['resolved'],
+        'resolution_status': alert['resolution_status'],  # ✅ Nuevo campo
+        'resolved_at': alert['resolved_at'].strftime('%Y-%m-%d %H:%M:%S') if alert['resolved_at'] else None,  # ✅ Nuevo campo
+    }
+
+
+@login_required
+def alert_search(request):
+    """
+    Búsqueda de texto en mensaje, elementos faltantes y notas de resolución
+    de todas las alertas, incluidas las archivadas, de la más relevante a la
+    menos. Cada resultado lleva `snippet` (HTML con las coincidencias
+    resaltadas) y `archived`.
+    """
+    q = request.GET.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 50)), ALERT_PAGE_MAX))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Límite inválido'}, status=400)
+    if not busqueda.consulta(q):
+        return JsonResponse({'alerts': [], 'query': q})
+
+    fields = ALERT_ROW_FIELDS + (('rank', 'snippet') if busqueda.disponible() else ())
+    results = []
+    for model in (Alert, AlertArchive):
+        rows = busqueda.filtrar(model.objects.all(), q, snippet=True).values(*fields)[:limit]
+        for row in rows:
+            # Sin FTS5 no hay rank ni snippet
+            results.append((row.get('rank', 0), model is AlertArchive, row))
+    results.sort(key=lambda result: result[0])
+
     data = []
-    for alert in alerts:
-        data.append({
-            'id': alert.id,
-            'message': alert.message,
-            'missing': alert.missing,
-            'level': alert.get_level_display(),
-            'video_url': alert.video.url if alert.video else '',
-            'timestamp': alert.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'resolved': alert.resolved,
-            'resolution_status': alert.resolution_status,  # ✅ Nuevo campo
-            'resolved_at': alert.resolved_at.strftime('%Y-%m-%d %H:%M:%S') if alert.resolved_at else None,  # ✅ Nuevo campo
-        })
-    
-    return JsonResponse({'alerts': data})
+    for rank, archived, row in results[:limit]:
+        data.append(dict(
+            _alert_row(row),
+            archived=archived,
+            snippet=busqueda.resaltar(row.get('snippet')),
+        ))
+    return JsonResponse({'alerts': data, 'query': q})
 
 
 def alert_list_page(request):
@@ -877,34 +1232,57 @@ def alert_list_page(request):
 
 
 
+# Campos de latest_alerts (un subconjunto de eventos.datos_alerta)
+LATEST_ALERT_FIELDS = (
+    'id', 'message', 'missing_elements', 'timestamp', 'video', 'clip', 'level',
+    'element_count', 'resolved', 'resolution_status',
+)
+
+
+@alert_revalidate
+@alert_conditional
 def latest_alerts(request):
     # Filtrar alertas de las últimas 24 horas y ordenar por las más recientes
     time_threshold = timezone.now() - timedelta(hours=24)
+
+    # Primero desde las alertas recientes en memoria
+    params = cursor_params(request, default_limit=10)
+    if params is not None and params[1] is None:
+        after_id, _, limit = params
+        page = obtener_recientes().pagina(after_id, limit, desde=time_threshold.timestamp())
+        if page is not None:
+            rows, cursors = page
+            alerts = [{key: row[key] for key in LATEST_ALERT_FIELDS} for row in rows]
+            return JsonResponse({"alerts": alerts, **cursors})
     
     alerts = Alert.objects.filter(
         timestamp__gte=time_threshold
-    ).order_by('-timestamp')[:10]  # Solo las 10 más recientes
+    ).values(
+        'id', 'message', 'missing_mask', 'timestamp', 'video', 'clip', 'level', 'resolved', 'resolution_status',
+    )
+    page = alert_page(request, alerts, ['-timestamp'], default_limit=10)  # Solo las 10 más recientes
+    if page is None:
+        return JsonResponse({'success': False, 'error': 'Parámetros de paginación inválidos'}, status=400)
+    rows, cursors = page
 
     alert_data = []
-    for a in alerts:
-        # Procesar elementos faltantes del campo 'missing'
-        missing_elements = []
-        if a.missing:
-            missing_elements = [elemento.strip() for elemento in a.missing.split(',')]
-        
+    for a in rows:
+        missing_elements = epp.nombres(a['missing_mask'])
+
         alert_data.append({
-            'id': a.pk,
-            'message': a.message,
+            'id': a['id'],
+            'message': a['message'],
             'missing_elements': missing_elements,
-            'timestamp': localtime(a.timestamp).strftime("%H:%M:%S %d-%m-%Y"), 
-            'video': a.video.url if a.video else None, 
-            'level': a.level,
+            'timestamp': localtime(a['timestamp']).strftime("%H:%M:%S %d-%m-%Y"), 
+            'video': _media_url('video', a['video']) or None, 
+            'clip': _media_url('clip', a['clip']) or None,
+            'level': a['level'],
             'element_count': len(missing_elements),
-            'resolved': a.resolved,  # ✅ Agregar estado de resolución
-            'resolution_status': a.resolution_status or 'pending',  # ✅ Estado de resolución
+            'resolved': a['resolved'],  # ✅ Agregar estado de resolución
+            'resolution_status': a['resolution_status'] or 'pending',  # ✅ Estado de resolución
         })
     
-    return JsonResponse({"alerts": alert_data})
+    return JsonResponse({"alerts": alert_data, **cursors})
  
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
@@ -931,6 +1309,8 @@ def resolve_alert(request, alert_id):
                 'error': 'Estado de resolución inválido'
             }, status=400)
         
+        antes = resumenes.clave(alert)
+
         # ✅ NUEVO: Validar y actualizar el nivel si se proporciona
         valid_levels = ['high', 'medium', 'low', 'positive']
         if new_level and new_level in valid_levels:
@@ -945,7 +1325,11 @@ def resolve_alert(request, alert_id):
         alert.resolution_notes = resolution_notes
         alert.resolved_by = request.user
         alert.resolved_at = timezone.now()
-        alert.save()
+        with transaction.atomic():
+            alert.save()
+            resumenes.mover(antes, resumenes.clave(alert))
+            AlertVersion.bump()
+        obtener_bus().publicar('resuelta', datos_alerta(alert))
         
         return JsonResponse({
             'success': True,
@@ -963,34 +1347,199 @@ def resolve_alert(request, alert_id):
             'error': str(e)
         }, status=500)
 
+
+@login_required
+@require_POST
+def resolve_alerts_bulk(request):
+    """
+    Resuelve varias alertas a la vez. El cuerpo JSON lleva `ids` (lista de
+    ids) o `filter` (since/until en ISO, level, camera, item, status) y los
+    mismos campos que resolve_alert. Por defecto sólo se tocan las alertas
+    pendientes (`only_unresolved`).
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'JSON inválido'}, status=400)
+
+    resolution_status = data.get('resolution_status', 'resolved')
+    if resolution_status not in ['resolved', 'false_positive', 'non_compliant', 'system_error']:
+        return JsonResponse({'success': False, 'error': 'Estado de resolución inválido'}, status=400)
+    new_level = data.get('new_level')
+    if new_level and new_level not in ALERT_LEVELS:
+        return JsonResponse({'success': False, 'error': 'Nivel inválido'}, status=400)
+
+    alerts = Alert.objects.all()
+    ids = data.get('ids')
+    filtro = data.get('filter')
+    if ids is not None:
+        # bool es subclase de int: true/false no son ids
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            return JsonResponse({'success': False, 'error': 'ids debe ser una lista de enteros'}, status=400)
+        alerts = alerts.filter(pk__in=ids)
+    elif isinstance(filtro, dict) and filtro:
+        fechas = {}
+        for campo in ('since', 'until'):
+            valor = filtro.get(campo)
+            if valor:
+                try:
+                    fechas[campo] = parse_datetime(valor) if isinstance(valor, str) else None
+                except ValueError:
+                    # Bien formada pero inexistente (p. ej. mes 13)
+                    fechas[campo] = None
+                if fechas[campo] is None:
+                    return JsonResponse({'success': False, 'error': 'Fecha inválida'}, status=400)
+        since, until = fechas.get('since'), fechas.get('until')
+        if since:
+            alerts = alerts.filter(timestamp__gte=since)
+        if until:
+            alerts = alerts.filter(timestamp__lt=until)
+        if filtro.get('level'):
+            alerts = alerts.filter(level=filtro['level'])
+        if filtro.get('camera'):
+            alerts = alerts.filter(camera=filtro['camera'])
+        if filtro.get('status'):
+            alerts = alerts.filter(resolution_status=filtro['status'])
+        if filtro.get('item'):
+            bit = PPEItem.objects.filter(code=filtro['item']).values_list('bit', flat=True).first()
+            if bit is None:
+                return JsonResponse({'success': False, 'error': 'Elemento desconocido'}, status=400)
+            alerts = alerts.alias(item_bit=F('missing_mask').bitand(bit)).filter(item_bit=bit)
+    else:
+        return JsonResponse({'success': False, 'error': 'Indique ids o filter'}, status=400)
+
+    updated = resolver_alertas(
+        alerts, request.user, status=resolution_status,
+        notes=data.get('resolution_notes', ''), level=new_level,
+        only_unresolved=bool(data.get('only_unresolved', True)),
+    )
+    return JsonResponse({
+        'success': True,
+        'message': f'{updated} alertas resueltas',
+        'updated': updated,
+        'resolution_status': resolution_status,
+    })
+
+
+@login_required
+def export_alerts(request):
+    """
+    Descarga las alertas (incluidas las archivadas) en CSV o Parquet
+    (`format`), filtradas por start_date/end_date, level, status, item y
+    camera. El CSV se genera a medida que se envía; el Parquet se escribe
+    por lotes en un archivo temporal.
+    """
+    formato = request.GET.get('format', 'csv')
+    if formato not in exportar.FORMATOS:
+        return JsonResponse({'success': False, 'error': 'Formato inválido'}, status=400)
+    try:
+        filtros = exportar.filtros(
+            desde=request.GET.get('start_date'),
+            hasta=request.GET.get('end_date'),
+            level=request.GET.get('level'),
+            status=request.GET.get('status'),
+            item=request.GET.get('item'),
+            camera=request.GET.get('camera'),
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    nombre = f"alertas_{timezone.localtime():%Y%m%d_%H%M}.{formato}"
+    if formato == 'csv':
+        response = StreamingHttpResponse(exportar.csv_filas(**filtros), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{nombre}"'
+        return response
+
+    archivo = tempfile.TemporaryFile()
+    try:
+        exportar.escribir_parquet(archivo, **filtros)
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return FileResponse(archivo, as_attachment=True, filename=nombre,
+                        content_type='application/vnd.apache.parquet')
+
 @login_required
+@alert_revalidate
+@alert_conditional
 def alert_statistics(request):
     """Obtiene estadísticas de las alertas"""
-    # Alertas de las últimas 24 horas
-    since = timezone.now() - timedelta(hours=24)
-    
-    total_alerts = Alert.objects.filter(timestamp__gte=since).count()
-    unresolved_alerts = Alert.objects.filter(timestamp__gte=since, resolved=False).count()
-    resolved_alerts = Alert.objects.filter(timestamp__gte=since, resolved=True).count()
-    
+    # Alertas de las últimas 24 horas, desde los resúmenes horarios (la hora
+    # en curso cuenta completa)
+    since = resumenes.hora(timezone.now()) - timedelta(hours=23)
+    rollups = AlertRollup.objects.filter(hour__gte=since)
+
+    counts = rollups.aggregate(
+        total=Sum('count'),
+        unresolved=Sum('count', filter=Q(resolved=False)),
+        resolved=Sum('count', filter=Q(resolved=True)),
+    )
+    total_alerts = counts['total'] or 0
+    unresolved_alerts = counts['unresolved'] or 0
+    resolved_alerts = counts['resolved'] or 0
+
     # Estadísticas por tipo de resolución
-    resolution_stats = Alert.objects.filter(
-        timestamp__gte=since, 
+    resolution_stats = rollups.filter(
         resolved=True
     ).values('resolution_status').annotate(
-        count=models.Count('id')
-    )
-    
-    resolution_data = {stat['resolution_status']: stat['count'] for stat in resolution_stats}
+        count=Sum('count')
+    ).order_by()
+
+    resolution_data = {stat['resolution_status']: stat['count'] for stat in resolution_stats if stat['count']}
     
     return JsonResponse({
         'total_alerts': total_alerts,
         'unresolved_alerts': unresolved_alerts,
         'resolved_alerts': resolved_alerts,
         'resolution_stats': resolution_data,
-        'resolution_rate': (resolved_alerts / total_alerts * 100) if total_alerts > 0 else 0
+        'resolution_rate': (resolved_alerts / total_alerts * 100) if total_alerts > 0 else 0,
+        # Contadores de la cola de escritura de alertas de este proceso (no
+        # cambian la versión: una respuesta 304 puede mostrarlos atrasados)
+        'sink': obtener_sink().stats(),
     })
 
+
+ALERT_SERIES_GROUPS = ('level', 'status', 'item')
+ALERT_SERIES_POINTS = 500
+
+
+@login_required
+@alert_revalidate
+@alert_conditional
+def alert_timeseries(request):
+    """
+    Serie temporal de alertas entre start_date y end_date (incluida; por
+    defecto los últimos 30 días), total o por `group` (level, status, item).
+    `interval` (hour, day, week, month) es opcional: si da más de
+    ALERT_SERIES_POINTS puntos se usa uno mayor.
+    """
+    group = request.GET.get('group') or None
+    interval = request.GET.get('interval') or None
+    if group is not None and group not in ALERT_SERIES_GROUPS:
+        return JsonResponse({'success': False, 'error': 'Agrupación inválida'}, status=400)
+    if interval is not None and interval not in resumenes.INTERVALOS:
+        return JsonResponse({'success': False, 'error': 'Intervalo inválido'}, status=400)
+    try:
+        end_date = date.fromisoformat(request.GET['end_date']) if request.GET.get('end_date') else timezone.localdate()
+        start_date = date.fromisoformat(request.GET['start_date']) if request.GET.get('start_date') else end_date - timedelta(days=29)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Fecha inválida'}, status=400)
+    if start_date > end_date:
+        return JsonResponse({'success': False, 'error': 'Rango de fechas inválido'}, status=400)
+
+    # Mismo ETag, misma respuesta: se comparte entre usuarios hasta que cambie
+    key = f"alert_timeseries:{alert_etag(request)}:{start_date}:{end_date}:{group}:{interval}"
+    data = cache.get(key)
+    if data is None:
+        data = resumenes.serie(
+            timezone.make_aware(datetime.combine(start_date, datetime.min.time())),
+            timezone.make_aware(datetime.combine(end_date + timedelta(days=1), datetime.min.time())),
+            agrupar=group, intervalo=interval, max_puntos=ALERT_SERIES_POINTS,
+        )
+        cache.set(key, data, 3600)
+    return JsonResponse(data)
+
 @login_required
 def alert_resolution_modal(request, alert_id):
     """Devuelve el HTML del modal de resolución"""
@@ -1007,8 +1556,9 @@ def alert_resolution_modal(request, alert_id):
 
 from django.shortcuts import render
 from django.utils import timezone
-from datetime import timedelta, date
-from django.db.models import Count, Q
+from datetime import date, datetime, timedelta
+from django.db.models import F, Q, Sum
+from django.db.models.lookups import Exact
 
 # Importar el modelo (asume que está en .models o ajusta la importación)
 
@@ -1018,22 +1568,24 @@ from django.db.models import Count, Q
 def get_alerts_summary_report(start_date: date, end_date: date) -> dict:
     """
     Genera un resumen del conteo de alertas, agrupado por nivel y estado de resolución.
+    Se calcula sobre los resúmenes horarios, no sobre las alertas.
     """
-    end_datetime = timezone.datetime.combine(end_date, timezone.localtime().max.time())
-    start_datetime = timezone.datetime.combine(start_date, timezone.localtime().min.time())
+    start_datetime = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+    end_datetime = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
 
-    alerts = Alert.objects.filter(
-        timestamp__range=(start_datetime, end_datetime)
+    rollups = AlertRollup.objects.filter(
+        hour__gte=start_datetime, hour__lt=end_datetime
     )
 
-    report_data = alerts.aggregate(
-        total_alerts=Count('id'),
-        high_alerts=Count('id', filter=Q(level='high')),
-        medium_alerts=Count('id', filter=Q(level='medium')),
-        low_alerts=Count('id', filter=Q(level='low')),
-        resolved_alerts=Count('id', filter=Q(resolved=True)),
-        non_compliant_alerts=Count('id', filter=Q(resolution_status='non_compliant')),
+    report_data = rollups.aggregate(
+        total_alerts=Sum('count'),
+        high_alerts=Sum('count', filter=Q(level='high')),
+        medium_alerts=Sum('count', filter=Q(level='medium')),
+        low_alerts=Sum('count', filter=Q(level='low')),
+        resolved_alerts=Sum('count', filter=Q(resolved=True)),
+        non_compliant_alerts=Sum('count', filter=Q(resolution_status='non_compliant')),
     )
+    report_data = {key: value or 0 for key, value in report_data.items()}
 
     report_data['start_date'] = start_date
     report_data['end_date'] = end_date
@@ -1044,22 +1596,25 @@ def get_top_non_compliant_items(limit=10) -> list:
     """
     Identifica y cuenta los elementos (`missing`) más frecuentemente
     asociados con un 'Incumplimiento Real' ('non_compliant').
+    Cada elemento se cuenta por separado con un filtro de bits sobre
+    `missing_mask` de los resúmenes horarios, en una sola consulta.
     """
-    top_items = Alert.objects.filter(
-        resolution_status='non_compliant'
-    ).exclude(
-        missing__isnull=True
-    ).exclude(
-        missing__exact=''
-    ).values(
-        'missing'
-    ).annotate(
-        count=Count('missing')
-    ).order_by(
-        '-count'
-    )[:limit]
-
-    return list(top_items)
+    items = list(PPEItem.objects.all())
+    if not items:
+        return []
+    counts = AlertRollup.objects.filter(
+        resolution_status='non_compliant', missing_mask__gt=0
+    ).aggregate(**{
+        item.code: Sum('count', filter=Exact(F('missing_mask').bitand(item.bit), item.bit))
+        for item in items
+    })
+
+    top_items = [
+        {'missing': item.name, 'code': item.code, 'count': counts[item.code]}
+        for item in items if counts[item.code]
+    ]
+    top_items.sort(key=lambda item: item['count'], reverse=True)
+    return top_items[:limit]
 
 
 # --- Vista de Django ---
@@ -2,6 +2,9 @@
 ASGI config for sistema project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Required for the live alert events (SSE); run it with e.g.
+
+    uvicorn sistema.asgi:application --host 0.0.0.0 --port 8000
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -144,4 +145,100 @@ STATICFILES_DIRS = [
     # Esto es donde DEBES guardar tu carpeta 'static'
     os.path.join(BASE_DIR, 'static'), 
 ]
-MODEL_PATH = r"C:\Users\jonat\Desktop\modelo_entrenado\sistema\models2\Models\best.pt"
\ No newline at end of file
+MODEL_PATH = r"C:\Users\jonat\Desktop\modelo_entrenado\sistema\models2\Models\best.pt"
+
+# Detección
+# Usar model.track() en lugar de model.predict() para incluir track ids
+# en los metadatos de detección (detections_feed)
+DETECCION_TRACKING = False
+
+# Stream en vivo H.264 (HLS) como alternativa al MJPEG de video_feed.
+# Los segmentos se escriben en un directorio en RAM cuando existe /dev/shm.
+LIVE_HLS_ENABLED = False
+LIVE_HLS_DIR = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'sd-epp-hls')
+LIVE_HLS_THREADS = 2
+LIVE_HLS_SEGMENT_SECONDS = 2
+LIVE_HLS_LIST_SIZE = 6
+FFMPEG_BIN = 'ffmpeg'
+
+# Grabaciones: segundos conservados antes de la primera detección (pre-roll)
+# y segundos que se sigue grabando tras la última (post-roll)
+GRABACION_PRE_ROLL_SECONDS = 5
+GRABACION_POST_ROLL_SECONDS = 5
+
+# Codificador de grabaciones: 'ffmpeg' (H.264 en MP4 fragmentado) u 'opencv'
+# (XVID en AVI). Si ffmpeg no está instalado se usa OpenCV.
+GRABACION_BACKEND = 'ffmpeg'
+GRABACION_FPS = 15
+GRABACION_X264_PRESET = 'ultrafast'
+GRABACION_X264_CRF = 26
+GRABACION_X264_THREADS = 2
+
+# Grabaciones en MEDIA_ROOT/grabaciones/<cámara>/<AAAAMMDD>/, divididas en
+# segmentos por duración o tamaño. `manage.py limpiar_grabaciones` aplica
+# las cuotas (borra primero las más antiguas, nunca las de alertas abiertas).
+GRABACIONES_DIR = os.path.join(MEDIA_ROOT, 'grabaciones')
+GRABACION_SEGMENT_SECONDS = 300
+GRABACION_SEGMENT_MAX_MB = 200
+GRABACIONES_QUOTA_CAMARA_MB = 20 * 1024
+GRABACIONES_QUOTA_GLOBAL_MB = 50 * 1024
+
+# Vistas previas de grabaciones (`manage.py generar_miniaturas`): sprite con
+# una miniatura cada N segundos, decodificando sólo keyframes
+MINIATURAS_INTERVALO_SECONDS = 10
+MINIATURAS_ANCHO = 160
+MINIATURAS_COLUMNAS = 10
+
+# Recodificación de grabaciones cerradas a calidad de archivo
+# (`manage.py transcodificar_grabaciones`), con prioridad mínima de CPU y disco.
+# Con DESCARTAR_SIN_PERSONAS se eliminan los tramos sin personas según la
+# línea de tiempo de detecciones.
+FFPROBE_BIN = 'ffprobe'
+TRANSCODIFICACION_FPS = 5
+TRANSCODIFICACION_PRESET = 'slow'
+TRANSCODIFICACION_CRF = 30
+TRANSCODIFICACION_THREADS = 1
+TRANSCODIFICACION_NICE = 19
+TRANSCODIFICACION_MIN_EDAD_MINUTOS = 10
+TRANSCODIFICACION_DESCARTAR_SIN_PERSONAS = False
+
+# Clips de evidencia por alerta en MEDIA_ROOT/clips/<cámara>/<AAAAMMDD>/:
+# segundos antes y después de la alerta. `limpiar_grabaciones` también les
+# aplica sus cuotas.
+CLIPS_DIR = os.path.join(MEDIA_ROOT, 'clips')
+CLIP_ANTES_SECONDS = 3
+CLIP_DESPUES_SECONDS = 5
+CLIPS_QUOTA_CAMARA_MB = 2 * 1024
+CLIPS_QUOTA_GLOBAL_MB = 5 * 1024
+
+# Escritura asíncrona de alertas (AlertSink): tamaño de lote para
+# bulk_create, espera máxima antes de escribir un lote incompleto y tamaño
+# de la cola (las alertas que no caben se descartan y se contabilizan)
+ALERTAS_LOTE = 20
+ALERTAS_FLUSH_SECONDS = 1.0
+ALERTAS_COLA = 500
+
+# Eventos de alertas por SSE (/inicio/alerts/events/). Sólo funcionan bajo
+# ASGI, p. ej. `uvicorn sistema.asgi:application`; con runserver (WSGI) el
+# endpoint responde 204 y las páginas consultan latest_alerts periódicamente.
+# Eventos guardados para reanudar con Last-Event-ID y segundos entre
+# comentarios keepalive
+ALERTAS_EVENTOS_HISTORIAL = 500
+ALERTAS_EVENTOS_KEEPALIVE_SECONDS = 15
+
+# Últimas alertas en memoria por proceso (latest_alerts e inicio) y cada
+# cuántos segundos, como mucho, se compara la versión con la base
+ALERTAS_RECIENTES = 50
+ALERTAS_RECIENTES_VERIFICAR_SECONDS = 1.0
+
+# `manage.py archivar_alertas` mueve a AlertArchive las alertas resueltas
+# con más de estos días; los reportes las siguen contando por los resúmenes
+ALERTAS_ARCHIVAR_DIAS = 30
+
+# Incidentes: un incumplimiento continuo se guarda como una sola alerta que
+# se cierra tras estos segundos sin volver a detectarlo
+INCIDENTE_SILENCIO_SECONDS = 15
+
+# Estado de deduplicación de incidentes compartido entre procesos y reinicios
+# de cámara (SQLite en modo WAL, separado de la base principal)
+DEDUP_DB_PATH = BASE_DIR / 'dedup.sqlite3'